@@ -6,6 +6,7 @@ Loads all saved files created by executer.py for analysing them
 """
 
 import generalFunctions as gf
+import evaluation
 import pickle
 import numpy as np
 import matplotlib.pyplot as plt
@@ -21,24 +22,20 @@ import seaborn as sns
 scraped_buy = gf.load_data('scraped_buy')
 cleaned_buy = gf.load_data('cleaned_buy')
 featureEngineered_buy = gf.load_data('featureEngineered_buy')
-X_buy = gf.load_data('X_buy')
-X_train_buy = gf.load_data('X_train_buy')
-X_test_buy = gf.load_data('X_test_buy')
-y_buy = gf.load_data('y_buy')
-y_train_buy = gf.load_data('y_train_buy')
-y_test_buy = gf.load_data('y_test_buy')
+X_buy, y_buy = gf.load_dataset('dataset_buy')
+slices_buy = gf.get_datasetSlices('dataset_buy')
+X_train_buy, y_train_buy = X_buy.iloc[slices_buy['train']], y_buy.iloc[slices_buy['train']]
+X_test_buy, y_test_buy = X_buy.iloc[slices_buy['test']], y_buy.iloc[slices_buy['test']]
 errorMeasures_buy = gf.load_data('errorMeasures_buy')
 
 # For rent:
 scraped_rent = gf.load_data('scraped_rent')
 cleaned_rent = gf.load_data('cleaned_rent')
 featureEngineered_rent = gf.load_data('featureEngineered_rent')
-X_rent = gf.load_data('X_rent')
-X_train_rent = gf.load_data('X_train_rent')
-X_test_rent = gf.load_data('X_test_rent')
-y_rent = gf.load_data('y_rent')
-y_train_rent = gf.load_data('y_train_rent')
-y_test_rent = gf.load_data('y_test_rent')
+X_rent, y_rent = gf.load_dataset('dataset_rent')
+slices_rent = gf.get_datasetSlices('dataset_rent')
+X_train_rent, y_train_rent = X_rent.iloc[slices_rent['train']], y_rent.iloc[slices_rent['train']]
+X_test_rent, y_test_rent = X_rent.iloc[slices_rent['test']], y_rent.iloc[slices_rent['test']]
 errorMeasures_rent = gf.load_data('errorMeasures_rent')
 
 #Load the nrwCityCoordinates.csv
@@ -53,10 +50,10 @@ for cat in ['_buy', '_rent']:
         modelConfigs['columns_used' + cat] = data['columns_used']
         modelConfigs['test_errors' + cat] = data['test_errors']
         modelConfigs['test_errors_notAbsolute' + cat] = data['test_errors_notAbsolute']
-        modelConfigs['test_errors_notAbsolute_Quantile_5%' + cat] = data['test_errors_notAbsolute'].quantile(q=0.05)
-        modelConfigs['test_errors_notAbsolute_Quantile_95%' + cat] = data['test_errors_notAbsolute'].quantile(q=0.95)
-        modelConfigs['test_errorfactor_notAbsolute_Quantile_5%' + cat] = np.exp(data['test_errors_notAbsolute'].quantile(q=0.05))
-        modelConfigs['test_errorfactor_notAbsolute_Quantile_95%' + cat] = np.exp(data['test_errors_notAbsolute'].quantile(q=0.95))
+        # Prediction-intervals per price band calibrated by modeling.py (models saved without them: 5%-/95%-quantiles)
+        modelConfigs['intervalTable' + cat] = data.get('intervalTable',
+                                                       evaluation.make_globalIntervalTable(data['test_errors_notAbsolute']))
+        modelConfigs['intervals' + cat] = evaluation.format_intervalTable(modelConfigs['intervalTable' + cat])
         
 
 #----------------------------------------------------------------------------------------------------
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark of the pipeline on synthetic data created by 'syntheticData.py',
+so that performance regressions can be measured without depending on live immowelt.de data.
+
+For every given size (number of synthetic exposes each for buy and rent) a work-folder
+benchmarks/work_<size> is prepared with the synthetic scraped_buy.csv, scraped_rent.csv
+(generated only once per size and seed) and the stages cleaning, featureEngineering,
+trainTestSplitting and modeling are run one after another, each in a fresh process.
+For every stage wall time, CPU time, peak RSS (resident set size of the stage-process,
+without the worker-processes of the grid-searches) and rows per second are measured, the rows being
+the rows of the input-files of the stage (e.g. fewer rows for featureEngineering than for cleaning).
+The results are saved as JSON-file benchmarks/benchmark_<timestamp>.json, two of these files
+can be compared with compare_results().
+Additionally the startup-time (import-time in a fresh interpreter) of the pipeline-modules and of the
+prediction entry points is measured, as the heavy dependencies are only imported where they are used,
+and the throughput of the hashing of description-texts (see featureEngineering.hash_textChunks())
+per 100,000 synthetic descriptions with one process and with all CPUs.
+With the optional parameter profile every stage is profiled (see generalFunctions.profiled(),
+the measures then include the overhead of the profiler). The profiles are saved in folder
+benchmarks/profiles_<timestamp>/work_<size> and two profiles of the same stage, e.g. before
+and after a change, can be compared with compare_profiles().
+
+CAUTION: modeling at 1,000,000 rows runs for a very long time, choose 'sizes' and 'stages' accordingly.
+
+@author: Michael Volk
+"""
+
+import generalFunctions as gf
+import collections
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import pstats
+import shutil
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 1: Define functions for the benchmark
+
+
+stagesToBenchmark = ['cleaning', 'featureEngineering', 'trainTestSplitting', 'modeling']
+benchmarkFolder = 'benchmarks'
+codeFolder = os.path.dirname(os.path.abspath(__file__))
+# Input-files of the stages (per cat), whose rows are counted as the rows processed by the stage
+stageInputs = {'cleaning': 'scraped{cat}', 'featureEngineering': 'cleaned{cat}',
+               'trainTestSplitting': 'featureEngineered{cat}', 'modeling': 'dataset{cat}'}
+# Modules whose startup-time is measured
+modulesForStartup = ['executer', 'scraping', 'cleaning', 'featureEngineering', 'trainTestSplitting', 'modeling',
+                     'predicting', 'scoring']
+
+
+def get_gitCommit():
+    """Returns the current git-commit of the code or None if it is not available"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=codeFolder, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_stageMeasured(stageName, workFolder, resultQueue, profile=None):
+    """Runs the run()-function of given stage in given work-folder and puts the measures in 'resultQueue'.
+    Executed in a fresh process, so that the peak RSS belongs to this stage only."""
+
+    sys.path.insert(0, codeFolder)
+    os.chdir(workFolder)
+    module = importlib.import_module(stageName)
+    startWall = time.perf_counter()
+    startCpu = time.process_time()
+    module.run(profile=profile)
+    resultQueue.put({'wall_seconds': round(time.perf_counter() - startWall, 3),
+                     'cpu_seconds': round(time.process_time() - startCpu, 3),
+                     'peak_rss_mb': round(gf.get_peakRss(), 1)})
+
+def measure_stage(stageName, workFolder, profile=None):
+    """Runs given stage in a fresh process (profiled with given profile-type) and returns its measures"""
+
+    context = multiprocessing.get_context('spawn')
+    resultQueue = context.Queue()
+    process = context.Process(target=run_stageMeasured, args=(stageName, workFolder, resultQueue, profile))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError('Stage ' + stageName + ' failed in benchmark-folder ' + workFolder)
+
+    return resultQueue.get()
+
+def count_inputRows(stageName, workFolder):
+    """Returns the number of rows of the input-files (buy and rent) of given stage in given work-folder
+    (for a dataset-file taken from its json-file, see generalFunctions.save_dataset())"""
+
+    rows = 0
+    for cat in ['_buy', '_rent']:
+        filename = os.path.join(workFolder, stageInputs[stageName].format(cat=cat))
+        if os.path.exists(filename + '.json'):
+            with open(filename + '.json') as f:
+                rows += sum(json.load(f)['rows'].values())
+        else:
+            for chunk in pd.read_csv(filename + '.csv', usecols=[0], dtype=str, chunksize=1000000):
+                rows += len(chunk)
+
+    return rows
+
+def measure_startup(moduleName, repeats=3):
+    """Returns the measures of the import of given module in a fresh interpreter (best of 'repeats' runs):
+    import-time in seconds and number of modules loaded by the import (None if the import fails)"""
+
+    code = ('import sys, time; modules = len(sys.modules); start = time.perf_counter(); import ' + moduleName
+            + '; print(time.perf_counter() - start, len(sys.modules) - modules)')
+    seconds, modulesLoaded = None, None
+    for _ in range(repeats):
+        process = subprocess.run([sys.executable, '-c', code], cwd=codeFolder, capture_output=True, text=True)
+        if process.returncode != 0:
+            break
+        importSeconds, modulesLoaded = process.stdout.split()
+        seconds = float(importSeconds) if seconds is None else min(seconds, float(importSeconds))
+
+    return {'module': moduleName,
+            'import_seconds': None if seconds is None else round(seconds, 3),
+            'modules_loaded': None if modulesLoaded is None else int(modulesLoaded)}
+
+def measure_textHashing(nTexts=100000, nPartitions=1, seed=0):
+    """Returns the measures of hashing 'nTexts' synthetic description-texts in chunks of
+    featureEngineering.textChunkSize texts on 'nPartitions' processes (see featureEngineering.hash_textChunks()):
+    wall time, seconds per 100,000 texts, texts per second and token-features per text"""
+
+    import featureEngineering
+    import syntheticData
+
+    texts = syntheticData.make_descriptionTexts(nTexts, np.random.default_rng(seed))
+    chunkSize = featureEngineering.textChunkSize
+    start = time.perf_counter()
+    matrix = featureEngineering.hash_textChunks((texts[i:i + chunkSize] for i in range(0, nTexts, chunkSize)),
+                                                nPartitions=nPartitions)
+    seconds = time.perf_counter() - start
+
+    return {'texts': nTexts,
+            'partitions': nPartitions,
+            'wall_seconds': round(seconds, 3),
+            'seconds_per_100k': round(seconds * 100000 / nTexts, 3),
+            'texts_per_second': round(nTexts / seconds, 1),
+            'features_per_text': round(matrix.nnz / nTexts, 1)}
+
+def prepare_workFolder(nRows, seed=0):
+    """Returns the work-folder for given size with synthetic scraped-files and the shapefiles.
+    The synthetic data is only generated if it does not exist for given size and seed."""
+
+    import syntheticData
+
+    workFolder = os.path.join(codeFolder, benchmarkFolder, 'work_' + str(nRows))
+    os.makedirs(workFolder, exist_ok=True)
+    shutil.copytree(os.path.join(codeFolder, 'shapefiles'), os.path.join(workFolder, 'shapefiles'), dirs_exist_ok=True)
+    # The stages also save their results to the web-application folder next to the work-folder
+    os.makedirs(os.path.join(workFolder, '..', 'Buy-and-Rent-Price-Estimator-for-Apartments_Web-Application'),
+                exist_ok=True)
+
+    markerFilename = os.path.join(workFolder, 'syntheticData.json')
+    marker = {'nRows': nRows, 'seed': seed}
+    if os.path.exists(markerFilename):
+        with open(markerFilename) as f:
+            if json.load(f) == marker:
+                return workFolder
+    syntheticData.run(nRows=nRows, seed=seed, path=workFolder + os.sep)
+    with open(markerFilename, 'w') as f:
+        json.dump(marker, f)
+
+    return workFolder
+
+def print_results(measures):
+    """Prints given measures as table"""
+    print(pd.DataFrame(measures).to_string(index=False))
+
+def compare_results(filenameBase, filenameNew):
+    """Compares the measures of two benchmark-result-files (same stages and sizes)
+    and returns dataframe with the ratios new/base (< 1 means faster or less memory)"""
+
+    measures = {}
+    startup = {}
+    textHashing = {}
+    for key, filename in [('base', filenameBase), ('new', filenameNew)]:
+        with open(filename) as f:
+            results = json.load(f)
+        measures[key] = pd.DataFrame(results['measures'])
+        startup[key] = pd.DataFrame(results.get('startup', []), columns=['module', 'import_seconds', 'modules_loaded'])
+        textHashing[key] = pd.DataFrame(results.get('textHashing', []), columns=['texts', 'partitions', 'seconds_per_100k'])
+    for key in measures:
+        # Results saved before the rows were counted per stage have 'rows' = 2 * size
+        if 'size' not in measures[key]:
+            measures[key]['size'] = measures[key]['rows'] // 2
+    df = measures['base'].merge(measures['new'], on=['stage', 'size'], suffixes=('_base', '_new'))
+    for measure in ['wall_seconds', 'cpu_seconds', 'peak_rss_mb']:
+        df[measure + '_ratio'] = (df[measure + '_new'] / df[measure + '_base']).round(3)
+    df = df[['stage', 'size', 'rows_base', 'rows_new', 'wall_seconds_base', 'wall_seconds_new', 'wall_seconds_ratio',
+             'cpu_seconds_ratio', 'peak_rss_mb_base', 'peak_rss_mb_new', 'peak_rss_mb_ratio']]
+    print(df.to_string(index=False))
+    dfStartup = startup['base'].merge(startup['new'], on='module', suffixes=('_base', '_new'))
+    if len(dfStartup) > 0:
+        dfStartup['import_seconds_ratio'] = (dfStartup['import_seconds_new'] / dfStartup['import_seconds_base']).round(3)
+        print(dfStartup.to_string(index=False))
+    dfTextHashing = textHashing['base'].merge(textHashing['new'], on=['texts', 'partitions'], suffixes=('_base', '_new'))
+    if len(dfTextHashing) > 0:
+        dfTextHashing['seconds_per_100k_ratio'] = (dfTextHashing['seconds_per_100k_new']
+                                                   / dfTextHashing['seconds_per_100k_base']).round(3)
+        print(dfTextHashing.to_string(index=False))
+
+    return df
+
+def load_profile(filename):
+    """Returns series with the inclusive share of the total time per function ('module:function')
+    of given cProfile- (.prof) or sampling-profile (.collapsed)"""
+
+    inclusive = collections.Counter()
+    if filename.endswith('.prof'):
+        stats = pstats.Stats(filename).stats
+        for (path, line, function), (primitiveCalls, calls, totalTime, cumulativeTime, callers) in stats.items():
+            inclusive[os.path.basename(path) + ':' + function] += cumulativeTime
+        total = max(inclusive.values())
+    else:
+        total = 0
+        with open(filename, encoding='utf-8') as f:
+            for line in f:
+                stack, count = line.rsplit(' ', 1)
+                total += int(count)
+                for frame in set(stack.split(';')):
+                    inclusive[frame] += int(count)
+
+    return pd.Series(inclusive, dtype='float64') / total
+
+def compare_profiles(filenameBase, filenameNew, top=30):
+    """Compares two profiles of the same type (see load_profile()) and returns dataframe
+    with the 'top' functions with the biggest change of their inclusive share of the total time"""
+
+    df = pd.DataFrame({'share_base': load_profile(filenameBase), 'share_new': load_profile(filenameNew)}).fillna(0)
+    df['share_change'] = df['share_new'] - df['share_base']
+    df = df.reindex(df['share_change'].abs().sort_values(ascending=False).index)[:top].round(4)
+    print(df.to_string())
+
+    return df
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 2: Define the order of running the above functions.
+
+
+def run(sizes=(1000, 10000, 100000, 1000000), stages=stagesToBenchmark, seed=0, label='', profile=None,
+        startupModules=modulesForStartup, textHashingTexts=100000):
+    """
+    Runs the benchmark for every given size (number of synthetic exposes each for buy and rent)
+    and every given stage, saves the results to a JSON-file and returns its filename.
+    The optional parameter label is saved with the results to identify the benchmark-run.
+    The optional parameter profile ('cprofile', 'sampling' or 'allocations') profiles every stage.
+    The optional parameter startupModules defines the modules whose startup-time is measured.
+    The optional parameter textHashingTexts defines the number of synthetic texts of the text-hashing benchmark (0: none).
+    """
+
+    timestamp = time.strftime('%Y%m%d_%H%M%S')
+
+    results = {'created': gf.dayTime(),
+               'label': label,
+               'commit': get_gitCommit(),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'cpus': os.cpu_count(),
+               'seed': seed,
+               'profile': profile,
+               'measures': [],
+               'startup': [],
+               'textHashing': []}
+    for moduleName in startupModules:
+        results['startup'].append(measure_startup(moduleName))
+        print(gf.dayTime() + ': ' + json.dumps(results['startup'][-1]))
+    if textHashingTexts > 0:
+        for nPartitions in sorted({1, os.cpu_count()}):
+            results['textHashing'].append(measure_textHashing(textHashingTexts, nPartitions, seed))
+            print(gf.dayTime() + ': ' + json.dumps(results['textHashing'][-1]))
+    for nRows in sizes:
+        print(gf.dayTime() + ': Benchmark with ' + str(nRows) + ' synthetic exposes each for buy and rent')
+        workFolder = prepare_workFolder(nRows, seed)
+        for stageName in stages:
+            measures = {'stage': stageName, 'size': nRows, 'rows': count_inputRows(stageName, workFolder)}
+            measures.update(measure_stage(stageName, workFolder, profile))
+            measures['rows_per_second'] = round(measures['rows'] / measures['wall_seconds'], 1)
+            results['measures'].append(measures)
+            print(gf.dayTime() + ': ' + json.dumps(measures))
+        if profile is not None:
+            profileFolder = os.path.join(codeFolder, benchmarkFolder, 'profiles_' + timestamp)
+            os.makedirs(profileFolder, exist_ok=True)
+            shutil.move(os.path.join(workFolder, gf.profileFolder), os.path.join(profileFolder, 'work_' + str(nRows)))
+
+    filename = os.path.join(codeFolder, benchmarkFolder,
+                            'benchmark_' + timestamp + '.json')
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=1)
+    print_results(results['startup'])
+    print_results(results['textHashing'])
+    print_results(results['measures'])
+    print("Benchmark-results saved to file: " + filename)
+
+    return filename
+
+
+# Function run() shall be executed if module is executed directly via console
+if __name__ == "__main__":
+    run()
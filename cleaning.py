@@ -7,11 +7,20 @@ and of dropping rows out of the dataframes which:
 * have missing values in important columns
 * are identical/very similiar to other apartements
 * have defined blacklist-keywords in their description text like 'versteigerung', 'erbbau', 'pflegeimmobilie', ...
+Missing coordinates are imputed before from the geocoding-cache created by 'geocoding.py' (see geocoding.impute_coordinates()).
+With run(chunkSize=...) (e.g. 'python executer.py --chunkSize 100000') scraped files larger than memory are
+streamed in chunks, duplicates are dropped with a set of the keys seen so far and sorted spill-files,
+and the cleaned file is identical to the one of the in-memory cleaning (see clean_chunked()).
 
 @author: Michael Volk
 """
 
 import generalFunctions as gf
+import geocoding
+import heapq
+import os
+import tempfile
+import pandas as pd
 
 
 #----------------------------------------------------------------------------------------------------
@@ -20,9 +29,60 @@ import generalFunctions as gf
 # Section 1: Define functions for the datacleanig-process
 
 
-def row_dropper(df):    
+# Columns of the duplicate-groups of deduplicate() (besides DescriptionText)
+groupKeys = ['Offerer_globalUserId', 'equipmentArea_CONSTRUCTIONYEAR', 'EstateAddress_LocationId']
+# Numerical columns compared by the row-filters (parsed from text in the chunked cleaning)
+numericalFilterColumns = ['HardFacts_PRICE_NumberValue',
+                          'HardFacts_AREA_LIVING_NumberValue',
+                          'HardFacts_ROOMS_NumberValue',
+                          'equipmentArea_CONSTRUCTIONYEAR',
+                          'Price_DataTable_PRICE_RENT_COLD_NumberValue']
+
+# Core information columns kept by reduce_to_core_columns_cleaning()
+coreColumns = ['HardFacts_PRICE_NumberValue',
+               'Price_DataTable_PRICE_COMMONCHARGE_NumberValue', #only relevant for buy
+               'Price_DataTable_PRICE_RENT_WARM_NumberValue', #only relevant for rent
+               'Price_DataTable_PRICE_RENT_COLD_NumberValue', #only relevant for rent
+               'Price_DataTable_PRICE_ADDITIONALCOSTS_NumberValue', #only relevant for rent
+               'Price_DataTable_PRICE_HEATINGCOSTS_NumberValue', #only relevant for rent
+               'HardFacts_AREA_LIVING_NumberValue',
+               'HardFacts_ROOMS_NumberValue', 'EstateAddress_City',
+               'General_Headline', 'DescriptionText',
+               'equipmentArea_CONSTRUCTIONYEAR',
+               'equipmentArea_CATEGORY', 'equipmentArea_CONDITION',
+               'equipmentArea_ENERGY', 'equipmentArea_FLOOR',
+               'equipmentArea_OUTDOOR',                           
+               'EstateAddress_District', 'EstateAddress_FederalState',
+               'EstateAddress_FederalStateId', 'EstateAddress_LocationId',
+               'EstateAddress_PublishStreet', 'EstateAddress_ZipCode',
+               'EstateMapData_LocationCoordinates_Latitude',
+               'EstateMapData_LocationCoordinates_Longitude',
+               'General_EstateId', 'MediaItemsCount',
+               'EnergyPasses_Data_Value',
+               'Price_AdditionalInformation_Commission_CommissionType', #only relevant for buy                    
+               'Price_AdditionalInformation_Commission_DisplayValue_NumberValue', #only relevant for buy
+               'Price_AdditionalInformation_Commission_DisplayValue_StringValue', #only relevant for buy
+               'Offerer_globalUserId',
+               'CreateDate', 'ProtocolDatetimeRequestExposeUrl',
+               'ProtocolExposeUrl',
+               geocoding.levelColumn] #only existing if coordinates are imputed
+
+# Columns used by the rules of row_filter()/deduplicate() and of the cat-specific row-droppers
+rowFilterColumns = ['HardFacts_PRICE_Unit', 'HardFacts_PRICE_Label', 'HardFacts_PRICE_NumberValue',
+                    'HardFacts_AREA_LIVING_Unit', 'HardFacts_AREA_LIVING_Label', 'HardFacts_AREA_LIVING_NumberValue',
+                    'HardFacts_ROOMS_Label', 'HardFacts_ROOMS_NumberValue', 'General_EstateTypeKey',
+                    'equipmentArea_CONSTRUCTIONYEAR', 'DescriptionText', 'EstateAddress_LocationId',
+                    'EstateMapData_LocationCoordinates_Latitude', 'EstateMapData_LocationCoordinates_Longitude',
+                    'MediaItemsCount', 'Offerer_globalUserId']
+rowDropperColumns = {'_buy': ['HardFacts_PRICE_Label', 'General_DistributionTypeKey', 'DescriptionText', 'General_Headline'],
+                     '_rent': ['Price_DataTable_PRICE_RENT_COLD_Label', 'Price_DataTable_PRICE_RENT_COLD_Unit',
+                               'Price_DataTable_PRICE_RENT_COLD_NumberValue']}
+
+
+@gf.instrumented
+def row_filter(df):    
     """Drops rows from given dataframe, with exposes for buy or rent,
-    which do not match certain conditions"""
+    which do not match certain conditions (every row is checked on its own)"""
     
     #Drop rows which do not have the expected value for the defined column
     df.drop(df[df.HardFacts_PRICE_Unit != 'EUR'].index, inplace=True)
@@ -50,23 +110,42 @@ def row_dropper(df):
                                         'EstateMapData_LocationCoordinates_Longitude',
                                         'MediaItemsCount'], inplace=True)
     
+    return df
+
+@gf.instrumented
+def deduplicate(df):
+    """Drops rows from given dataframe, with exposes for buy or rent,
+    which are identical/very similiar to other rows"""
+    
     # Group rows by offerer, construction year and location and consider only the first row of each group
     # to drop out apartments which are offered by the same company and
     # are probably contained in one building and similiar or identical to each other
     # Reason: to avoid masses of similiar apartments from one big building(-project)
-    df = df.groupby(['Offerer_globalUserId',
-                    'equipmentArea_CONSTRUCTIONYEAR',
-                    'EstateAddress_LocationId']).apply(lambda df: df.iloc[0])
+    # (vectorized equivalent of groupby(keys).apply(lambda df: df.iloc[0]): rows with missing keys are dropped,
+    # the rows are stable sorted by the keys and only the first occurrence of every key is kept)
+    df = df.dropna(subset=groupKeys).sort_values(groupKeys, kind='stable').drop_duplicates(subset=groupKeys)
     df.reset_index(drop=True, inplace=True)
     
     # Group rows by DescriptionText and consider only the first row of each group
     # to drop out apartments which are identical in their offer text
-    df = df.groupby('DescriptionText').apply(lambda df: df.iloc[0])
+    df = df.sort_values('DescriptionText', kind='stable').drop_duplicates(subset=['DescriptionText'])
     df.reset_index(drop=True, inplace=True)
 
-    
     return df
 
+@gf.instrumented
+def row_dropper(df):    
+    """Drops rows from given dataframe, with exposes for buy or rent,
+    which do not match certain conditions or are duplicates"""
+    
+    return deduplicate(row_filter(df))
+
+def get_requiredColumns(cat):
+    """Returns the set of columns of the scraped file for given cat ('_buy' or '_rent'),
+    which are used by the cleaning (the other columns need not to be loaded)"""
+    return set(coreColumns + rowFilterColumns + rowDropperColumns[cat] + geocoding.geocodingColumns)
+
+@gf.instrumented
 def row_dropper_buy(df):    
     """Drops rows from given dataframe, with exposes for buy only,
     which do not match certain conditions"""
@@ -82,16 +161,18 @@ def row_dropper_buy(df):
     blacklistKeywords = ['versteigerung', 'auktion', 'meistbietend', 'höchstbietend',
                         'mindestpreis', 'verkauf gegen angebot', 'miteigentumsanteil',
                         'paketverkauf', 'erbbau', 'pflegeimmobilie']
+    # (result_type='reduce' returns a series also for a dataframe without rows)
     df['blacklistKeywordsContained_OWN'] = df.apply(
         lambda row: any([blacklistKeyword in row.DescriptionText.lower() 
                          for blacklistKeyword in blacklistKeywords])
                     or
                     any([blacklistKeyword in row.General_Headline.lower() 
-                         for blacklistKeyword in blacklistKeywords]), axis=1)
+                         for blacklistKeyword in blacklistKeywords]), axis=1, result_type='reduce').astype(bool)
     df.drop(df[df.blacklistKeywordsContained_OWN].index, inplace=True)
 
     return df
 
+@gf.instrumented
 def row_dropper_rent(df):    
     """Drops rows from given dataframe, with exposes for rent only,
     which do not match certain conditions"""
@@ -108,38 +189,11 @@ def row_dropper_rent(df):
                 
     return df
 
+@gf.instrumented
 def reduce_to_core_columns_cleaning(df):
     """Reduces the dataframe, with exposes for buy or rent,
     to the columns which contain potential useful information"""
     
-    #Define core information columns
-    coreColumns = ['HardFacts_PRICE_NumberValue',
-                   'Price_DataTable_PRICE_COMMONCHARGE_NumberValue', #only relevant for buy
-                   'Price_DataTable_PRICE_RENT_WARM_NumberValue', #only relevant for rent
-                   'Price_DataTable_PRICE_RENT_COLD_NumberValue', #only relevant for rent
-                   'Price_DataTable_PRICE_ADDITIONALCOSTS_NumberValue', #only relevant for rent
-                   'Price_DataTable_PRICE_HEATINGCOSTS_NumberValue', #only relevant for rent
-                   'HardFacts_AREA_LIVING_NumberValue',
-                   'HardFacts_ROOMS_NumberValue', 'EstateAddress_City',
-                   'General_Headline', 'DescriptionText',
-                   'equipmentArea_CONSTRUCTIONYEAR',
-                   'equipmentArea_CATEGORY', 'equipmentArea_CONDITION',
-                   'equipmentArea_ENERGY', 'equipmentArea_FLOOR',
-                   'equipmentArea_OUTDOOR',                           
-                   'EstateAddress_District', 'EstateAddress_FederalState',
-                   'EstateAddress_FederalStateId', 'EstateAddress_LocationId',
-                   'EstateAddress_PublishStreet', 'EstateAddress_ZipCode',
-                   'EstateMapData_LocationCoordinates_Latitude',
-                   'EstateMapData_LocationCoordinates_Longitude',
-                   'General_EstateId', 'MediaItemsCount',
-                   'EnergyPasses_Data_Value',
-                   'Price_AdditionalInformation_Commission_CommissionType', #only relevant for buy                    
-                   'Price_AdditionalInformation_Commission_DisplayValue_NumberValue', #only relevant for buy
-                   'Price_AdditionalInformation_Commission_DisplayValue_StringValue', #only relevant for buy
-                   'Offerer_globalUserId',
-                   'CreateDate', 'ProtocolDatetimeRequestExposeUrl',
-                   'ProtocolExposeUrl']
-    
     # Only consider the coreColumns if they exist in the dataframe
     # (because some columns only exist in the buy or rent dataframe)
     coreColumns_existing = [col for col in coreColumns if col in df.columns]
@@ -149,38 +203,175 @@ def reduce_to_core_columns_cleaning(df):
 
     return df
 
+def scan_columnTypes(filename, chunkSize):
+    """Scans the core-columns of given csv-file in chunks and returns the columns which are parsed as float
+    and for every column of groupKeys the function which parses its text to the value it has
+    when the whole file is loaded (float for numerical columns, else str)"""
+
+    columns = pd.read_csv(filename, nrows=0).columns
+    coreColumns_existing = [col for col in coreColumns if col in columns]
+    numerical = {col: True for col in coreColumns_existing}
+    integer = {col: True for col in coreColumns_existing}
+    for chunk in pd.read_csv(filename, usecols=coreColumns_existing, dtype=str, chunksize=chunkSize):
+        for col in coreColumns_existing:
+            values = chunk[col].dropna()
+            numerical[col] = numerical[col] and pd.to_numeric(values, errors='coerce').notna().all()
+            integer[col] = integer[col] and len(values) == len(chunk) and values.str.fullmatch(r'[+-]?\d+').all()
+    floatColumns = [col for col in coreColumns_existing if numerical[col] and not integer[col]]
+
+    return floatColumns, [float if numerical[key] else str for key in groupKeys]
+
+def spill_filteredChunk(chunk, rowDropper, seenKeys, keyParsers, floatColumns, spillFilename):
+    """Applies row_filter(), the first part of deduplicate() and given cat-specific 'rowDropper'
+    to given chunk of the scraped file (all values as text) and saves the remaining rows
+    sorted by DescriptionText and group-key to given spill-file.
+    The group-keys already seen in previous chunks are given and updated in set 'seenKeys'.
+    The result of 'rowDropper' is only marked in column 'RowDropperPassed_OWN', because
+    in the in-memory cleaning it is applied after the deduplication.
+    The values of the given 'floatColumns' are saved as float like in the in-memory cleaning."""
+
+    # Filter on a copy of the chunk with parsed numerical columns, but keep the original text of the values
+    parsed = chunk.copy()
+    for col in numericalFilterColumns:
+        if col in parsed.columns:
+            parsed[col] = pd.to_numeric(parsed[col], errors='coerce')
+    parsed = row_filter(parsed).dropna(subset=groupKeys)
+    passed = rowDropper(parsed.copy()).index
+    chunk = chunk.loc[parsed.index]
+
+    # Keep only the first occurrence of every group-key (in order of the file)
+    keys = list(zip(*[chunk[key].map(parser) for key, parser in zip(groupKeys, keyParsers)]))
+    firstOccurrence = []
+    for key in keys:
+        firstOccurrence.append(key not in seenKeys)
+        seenKeys.add(key)
+    keys = [key for key, first in zip(keys, firstOccurrence) if first]
+    # (selection by index, an empty mask-list would select columns)
+    chunk = chunk.loc[chunk.index[firstOccurrence]]
+
+    passed = chunk.index.isin(passed)
+    chunk = reduce_to_core_columns_cleaning(chunk)
+    for col in floatColumns:
+        chunk[col] = pd.to_numeric(chunk[col]).astype('float64')
+    chunk['RowDropperPassed_OWN'] = passed
+    descriptions = chunk['DescriptionText'].tolist()
+    order = sorted(range(len(chunk)), key=lambda i: (descriptions[i], keys[i]))
+    chunk.iloc[order].to_csv(spillFilename, index=False)
+
+def read_spillRows(spillFilename, chunkSize):
+    """Yields the rows of given spill-file as tuples of text-values"""
+    for chunk in pd.read_csv(spillFilename, dtype=str, chunksize=chunkSize):
+        yield from chunk.itertuples(index=False, name=None)
+
+@gf.instrumented
+def clean_chunked(cat, chunkSize=100000, filename=None, cleanedFilename=None, geocodingIndex=None):
+    """Cleans the scraped exposes for given cat ('_buy' or '_rent') like the in-memory cleaning in run(),
+    but streams the scraped file in chunks of 'chunkSize' rows, so memory is bounded for files larger than RAM:
+    1. Every chunk is filtered by spill_filteredChunk(), the duplicates of the group-keys are dropped
+       with a set of the already seen keys (first occurrence wins) and the rest is saved to a sorted spill-file.
+    2. The spill-files are merged by DescriptionText and group-key (like the sorting of deduplicate()),
+       so the first row of every DescriptionText is kept, and written to the cleaned file chunk by chunk.
+    The values are passed through as text, so the cleaned file is identical to the one of the in-memory cleaning.
+    The missing coordinates of every chunk are imputed with given 'geocodingIndex' (see geocoding.load_index()).
+    Returns the number of cleaned rows."""
+
+    filename = filename if filename is not None else 'scraped' + cat + '.csv'
+    cleanedFilename = cleanedFilename if cleanedFilename is not None else 'cleaned' + cat + '.csv'
+    rowDropper = {'_buy': row_dropper_buy, '_rent': row_dropper_rent}[cat]
+    floatColumns, keyParsers = scan_columnTypes(filename, chunkSize)
+
+    with tempfile.TemporaryDirectory(dir='.') as spillFolder:
+        seenKeys = set()
+        spillFilenames = []
+        requiredColumns = get_requiredColumns(cat)
+        for i, chunk in enumerate(pd.read_csv(filename, usecols=lambda col: col in requiredColumns, dtype=str,
+                                              chunksize=chunkSize)):
+            spillFilenames.append(os.path.join(spillFolder, 'spill' + str(i) + '.csv'))
+            chunk = geocoding.impute_coordinates(chunk, geocodingIndex)
+            spill_filteredChunk(chunk, rowDropper, seenKeys, keyParsers, floatColumns, spillFilenames[-1])
+            print(gf.dayTime() + ': Filtered ' + str(i * chunkSize + len(chunk)) + ' rows of ' + filename)
+        del seenKeys
+
+        # Scraped file without rows: save the cleaned file only with the header of the in-memory cleaning
+        if not spillFilenames:
+            header = pd.read_csv(filename, usecols=lambda col: col in requiredColumns, dtype=str, nrows=0)
+            reduce_to_core_columns_cleaning(geocoding.impute_coordinates(header, geocodingIndex)).to_csv(
+                cleanedFilename, index=False)
+            print("Dataframe saved to file: " + cleanedFilename)
+            return 0
+
+        columns = list(pd.read_csv(spillFilenames[0], nrows=0).columns)
+        descriptionIndex = columns.index('DescriptionText')
+        keyIndices = [columns.index(key) for key in groupKeys]
+        rows = heapq.merge(*[read_spillRows(spillFilename, chunkSize) for spillFilename in spillFilenames],
+                           key=lambda row: (row[descriptionIndex],
+                                            tuple(parser(row[i]) for parser, i in zip(keyParsers, keyIndices))))
+
+        rowsCleaned = 0
+        batch = []
+        previousDescription = None
+        with open(cleanedFilename, 'w', encoding='utf-8', newline='') as f:
+            pd.DataFrame(columns=columns[:-1]).to_csv(f, index=False)
+            for row in rows:
+                if row[descriptionIndex] == previousDescription:
+                    continue
+                previousDescription = row[descriptionIndex]
+                if row[-1] == 'True':
+                    batch.append(row[:-1])
+                if len(batch) == chunkSize:
+                    pd.DataFrame(batch, columns=columns[:-1]).to_csv(f, index=False, header=False)
+                    rowsCleaned += len(batch)
+                    batch = []
+            pd.DataFrame(batch, columns=columns[:-1]).to_csv(f, index=False, header=False)
+            rowsCleaned += len(batch)
+    print("Dataframe saved to file: " + cleanedFilename)
+
+    return rowsCleaned
+
+
 #----------------------------------------------------------------------------------------------------
 
 
 # Section 2: Define the order of running the above functions.
 
 
-def run():
+@gf.profilable
+def run(cats=['_buy', '_rent'], chunkSize=None, region=gf.defaultRegion, imputeCoordinates=True):
     """
     Runs the above functions in defined order.
+    The optional parameter cats defines the exposes to be cleaned ('_buy' and/or '_rent').
+    The optional parameter region defines the region (see generalFunctions.regions) whose exposes are cleaned.
+    The optional parameter chunkSize defines the number of rows of the scraped file cleaned at once
+    (see clean_chunked()), by default the whole file is loaded into memory.
+    With the optional parameter imputeCoordinates=True missing coordinates are imputed from the geocoding-cache
+    of the region (see geocoding.py), if it exists.
+    The optional parameter profile ('cprofile', 'sampling' or 'allocations') profiles the run (see generalFunctions.profiled).
     """
     
-    # Regarding exposes to buy:
-    
-    # Execute pipeline
-    df_buy_cleaned = (
-          gf.load_data(filename = "scraped_buy")
-          .pipe(row_dropper)
-          .pipe(row_dropper_buy)
-          .pipe(reduce_to_core_columns_cleaning)
-          .pipe(gf.save_data, filename = "cleaned_buy")
-    )
-    
-    # Regarding exposes to rent:
+    # Define for exposes to buy and to rent the specific row-dropper
+    rowDroppers = {'_buy': row_dropper_buy, '_rent': row_dropper_rent}
+    regionFolder = gf.get_regionFolder(region)
     
-    # Execute pipeline
-    df_rent_cleaned = (
-          gf.load_data(filename = "scraped_rent")
-          .pipe(row_dropper)
-          .pipe(row_dropper_rent)
-          .pipe(reduce_to_core_columns_cleaning)
-          .pipe(gf.save_data, filename = "cleaned_rent")
-    )
+    for cat in cats:
+        
+        # Load the geocoding-index for the exposes without coordinates
+        geocodingIndex = geocoding.load_index(cat, region) if imputeCoordinates else None
+        
+        # Clean scraped files larger than memory in chunks
+        if chunkSize is not None:
+            clean_chunked(cat, chunkSize, regionFolder + 'scraped' + cat + '.csv', regionFolder + 'cleaned' + cat + '.csv',
+                          geocodingIndex)
+            continue
+        
+        # Execute pipeline
+        df_cleaned = (
+              gf.load_data(filename = regionFolder + "scraped" + cat, columns = get_requiredColumns(cat))
+              .pipe(geocoding.impute_coordinates, geocodingIndex)
+              .pipe(row_dropper)
+              .pipe(rowDroppers[cat])
+              .pipe(reduce_to_core_columns_cleaning)
+              .pipe(gf.save_data, filename = regionFolder + "cleaned" + cat)
+        )
 
 
 # Function run() shall be executed if module is executed directly via console 
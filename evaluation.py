@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized evaluation of the test-predictions of several models, used by 'modeling.py'.
+The log-predictions of all models are stacked into one 2-D array (one row per model), so every
+error-measure and error-quantile is calculated for all models in one pass with numpy,
+and only the summary statistics (plus optionally a sample of the residuals) are kept,
+so the memory of the results does not grow with the number of test-rows times the number of models.
+pandas is only imported by the functions returning dataframes, so the interval-lookup
+can be used by the lightweight prediction entry point 'scoring.py' without importing pandas.
+Also calibrates the prediction-intervals of the best model (split-conformal per price band), which are
+saved as small lookup-table with the model, so the interval of a prediction is a table lookup.
+
+@author: Michael Volk
+"""
+
+import numpy as np
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 1: Define functions for the evaluation
+
+
+# Quantiles of the absolute errors reported as error-factors in errorMeasures_buy.csv, errorMeasures_rent.csv
+errorQuantiles = [0.50, 0.75, 0.90, 0.95]
+
+
+def stack_predictions(predictions):
+    """Returns 2-D array (one row per model) of given dictionary of model-name to predictions
+    and the list of the model-names in order of the rows"""
+    modelNames = list(predictions)
+    return np.vstack([np.asarray(predictions[modelName], dtype='float64') for modelName in modelNames]), modelNames
+
+def get_explainedVarianceScores(residuals, y_true):
+    """Returns the explained variance score 1 - Var(y_true - y_predict) / Var(y_true) of every row of 2-D array
+    'residuals'. Like sklearn.metrics.explained_variance_score a constant y_true scores 1.0 for perfect
+    predictions and 0.0 otherwise (instead of nan or -inf)."""
+
+    numerator = residuals.var(axis=1)
+    denominator = y_true.var()
+    scores = np.where(numerator == 0, 1.0, 0.0)
+    if denominator != 0:
+        scores[numerator != 0] = 1 - numerator[numerator != 0] / denominator
+    return scores
+
+def evaluate_predictions(y_true, predictions, modelNames, quantiles=errorQuantiles, nSampledResiduals=0, seed=0):
+    """Calculates for every model (row of 2-D array 'predictions', named by 'modelNames') the error-measures
+    of its predictions to 'y_true' in one vectorized pass:
+    median and mean absolute error, explained variance score (like the sklearn.metrics of the same names)
+    and the given quantiles of the absolute errors (columns test_errors_quantile_<q>%).
+    Returns dataframe with one row per model (index: model-name) and, if nSampledResiduals > 0,
+    dataframe with the residuals (prediction - y_true) of the same 'nSampledResiduals' randomly sampled
+    test-rows for every model (one column per model), else None."""
+
+    import pandas as pd
+
+    y_true = np.asarray(y_true, dtype='float64')
+    residuals = predictions - y_true
+    absoluteErrors = np.abs(residuals)
+
+    measures = pd.DataFrame({
+        'test_median_absolute_error': np.median(absoluteErrors, axis=1),
+        'test_mean_absolute_error': absoluteErrors.mean(axis=1),
+        'test_explained_variance_score': get_explainedVarianceScores(residuals, y_true)},
+        index=pd.Index(modelNames, name='Model'))
+    errorQuantileValues = np.quantile(absoluteErrors, quantiles, axis=1)
+    for q, values in zip(quantiles, errorQuantileValues):
+        measures['test_errors_quantile_' + format(q * 100, 'g') + '%'] = values
+
+    sampledResiduals = None
+    if nSampledResiduals > 0:
+        rows = np.random.default_rng(seed).choice(len(y_true), min(nSampledResiduals, len(y_true)), replace=False)
+        sampledResiduals = pd.DataFrame(residuals[:, np.sort(rows)].T, columns=modelNames)
+
+    return measures, sampledResiduals
+
+def get_residuals(y_true, predictions, modelNames, modelName):
+    """Returns the residuals (prediction - y_true) of given model as series with the index of series 'y_true'"""
+    import pandas as pd
+    return pd.Series(predictions[modelNames.index(modelName)] - y_true.to_numpy(), index=y_true.index, name=y_true.name)
+
+def calibrate_intervalTable(y_true, y_predict, coverage=0.9, nBands=5, minBandSize=100):
+    """Calibrates split-conformal prediction-intervals on given calibration-rows (e.g. the test-rows,
+    which are not used for fitting and choosing the model) per price band: the rows are split into
+    'nBands' bands of equal size by their predicted (log-)price (less bands if a band would have less than
+    'minBandSize' rows or for tied predictions) and for every band the conformal quantiles of the residuals
+    (prediction - y_true) are calculated, so that an interval covers the true value with probability 'coverage'.
+    Returns dictionary (lookup-table) with the inner band-edges and the residual-quantiles per band,
+    intervals for new predictions are looked up with lookup_intervals()."""
+
+    y_true = np.asarray(y_true, dtype='float64')
+    y_predict = np.asarray(y_predict, dtype='float64')
+    nBands = max(1, min(nBands, len(y_predict) // minBandSize))
+    bandEdges = np.unique(np.quantile(y_predict, np.arange(1, nBands) / nBands))
+    # Tied predictions can leave bands without rows: drop the edges with an empty band below them
+    # (the band is merged with the band above), so every band has rows
+    rowsPerBand = np.bincount(np.searchsorted(bandEdges, y_predict, side='right'), minlength=len(bandEdges) + 1)
+    bandEdges = bandEdges[rowsPerBand[:-1] > 0]
+    nBands = len(bandEdges) + 1
+    bands = np.searchsorted(bandEdges, y_predict, side='right')
+    alpha = 1 - coverage
+
+    residualsLower, residualsUpper = [], []
+    for band in range(nBands):
+        residuals = np.sort(y_predict[bands == band] - y_true[bands == band])
+        n = len(residuals)
+        # Conformal quantiles with finite-sample correction (ranks ceil/floor of (n+1) * level)
+        rankUpper = min(n, int(np.ceil((n + 1) * (1 - alpha / 2))))
+        rankLower = max(1, int(np.floor((n + 1) * alpha / 2)))
+        residualsUpper.append(residuals[rankUpper - 1])
+        residualsLower.append(residuals[rankLower - 1])
+
+    return {'coverage': coverage,
+            'bandEdges': bandEdges,
+            'residualsLower': np.array(residualsLower),
+            'residualsUpper': np.array(residualsUpper)}
+
+def make_globalIntervalTable(residuals, lowerQuantile=0.05, upperQuantile=0.95):
+    """Returns lookup-table (see calibrate_intervalTable()) with one band for all predictions
+    based on given quantiles of given residuals (used for models saved without interval-table)"""
+    return {'coverage': upperQuantile - lowerQuantile,
+            'bandEdges': np.array([]),
+            'residualsLower': np.array([residuals.quantile(q=lowerQuantile)]),
+            'residualsUpper': np.array([residuals.quantile(q=upperQuantile)])}
+
+def lookup_intervals(intervalTable, y_predict):
+    """Returns the lower and upper bounds (arrays) of the prediction-intervals of given (log-)predictions
+    by looking up the residual-quantiles of their price band in given 'intervalTable'
+    (residual = prediction - y  =>  y = prediction - residual)"""
+
+    bands = np.searchsorted(intervalTable['bandEdges'], y_predict, side='right')
+    return y_predict - intervalTable['residualsUpper'][bands], y_predict - intervalTable['residualsLower'][bands]
+
+def format_intervalTable(intervalTable):
+    """Returns dataframe of given 'intervalTable' with one row per price band and the
+    price-range of the band and its interval as error-factors (retransformed with exp())"""
+    import pandas as pd
+    bandEdges = np.exp(intervalTable['bandEdges'])
+    return pd.DataFrame({'Price_from': np.concatenate([[0], bandEdges]),
+                         'Price_until': np.concatenate([bandEdges, [np.inf]]),
+                         'errorfactor_lower': np.exp(-intervalTable['residualsUpper']),
+                         'errorfactor_upper': np.exp(-intervalTable['residualsLower'])})
@@ -1,35 +1,403 @@
 # -*- coding: utf-8 -*-
 """
-Imports all created modules and runs the full process
-from scraping immowelt.de website, data-cleaning, feature-engineering,
+Runs the full process from scraping immowelt.de website, keeping the history of the listings, data-cleaning, feature-engineering,
 model-building and saving the best model to be used for the app.
 
+Each stage (=module with a run()-function) declares its input- and output-files.
+Before a stage runs, a fingerprint of its code (module and generalFunctions.py),
+its parameters and the contents of its input-files is calculated. A stage is skipped
+if its outputs exist, are unchanged since the last run and were created with the same fingerprint,
+so re-runs after small changes (e.g. of one model definition) only run the affected stages.
+The fingerprints are stored per stage and branch in file pipelineState.json.
+Modules of stages are only imported when the stage actually runs.
+Stage scraping is volatile: its input is the website, so it runs at every run (unless it is not selected).
+
+Every stage consists of a branch per region (german federal state, see generalFunctions.regions,
+default North Rhine-Westphalia) and listing-type (buy and rent). The branches share nothing but the
+shapefile of their region and write their files to the folder of their region (regions/<region>/,
+the current folder for the default region). With option --parallel the branches run concurrently
+in separate processes, either per stage ('stages') or through the whole pipeline ('pipeline').
+The output of each branch is written to its own log-file in folder logs and printed as one block
+after the branch finished. The CPU budget (--cpus, default all CPUs) is divided between the parallel branches.
+
+Every stage-branch and the main steps of the stages are instrumented (see generalFunctions.Step):
+wall time, CPU time, peak memory and rows in and out are appended as JSON-lines to file
+logs/instrumentation.jsonl and a summary table of the run is printed at the end.
+
+Usage via console (all options can be combined):
+    python executer.py                              runs all outdated stages
+    python executer.py --until featureEngineering  runs outdated stages up to featureEngineering
+    python executer.py --from modeling             runs outdated stages from modeling on
+    python executer.py --only cleaning             runs only stage cleaning (if outdated)
+    python executer.py --force                     runs the selected stages even if they are current
+    python executer.py --dry-run                   only prints which stages would run
+    python executer.py --cat _rent                 runs only the rent-branch of the stages
+    python executer.py --region bayern --region hessen   runs the branches of these regions
+    python executer.py --parallel pipeline         runs buy- and rent-branch in parallel processes
+    python executer.py --traceMemory               traces peak Python-memory per step (slower)
+    python executer.py --only cleaning --profile sampling   profiles the stage (files in folder profiles)
+    python executer.py --chunkSize 100000          cleans the scraped files in chunks (bounded memory)
+    python executer.py --incremental               updates the saved models with the new rows (see modeling.py)
+    python executer.py --splitMode hash            assigns listings to train/test by the hash of their Url
+    python executer.py --spatialCV city            cross-validates the models on folds of whole municipalities
+    python executer.py --textFeatures              compares a model with hashed text-features of the descriptions
+
 @author: Michael Volk
 """
 
 import generalFunctions as gf
-import scraping
-import cleaning
-import featureEngineering
-import trainTestSplitting
-import modeling
+import argparse
+import concurrent.futures
+import contextlib
+import hashlib
+import importlib
+import json
+import os
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 1: Define the stages of the pipeline and functions for running them
+
+
+# Stages in order of execution with their input- and output-files.
+# Every stage consists of a branch per region and listing-type: '{cat}' in a filename is replaced
+# by '_buy' or '_rent' ('{listingType}' by 'buy' or 'rent'), '{region}' by the region, '{folder}' by the folder
+# of the region and '{shapefile}' and '{cityCoordinates}' by the files of the region (see generalFunctions.regions).
+# 'code' lists the modules of the stage (besides generalFunctions.py), whose changes make its outputs outdated.
+# 'parameterFiles' lists per parameter of the run()-function the additional input- and output-files if it is set.
+# 'volatile' stages depend on data outside the pipeline (the website) and run at every run.
+# The run()-function of the stage is called with cats=[cat] and the region.
+stages = [
+    {'name': 'scraping',
+     'code': ['scraping.py'],
+     'volatile': True,
+     'inputs': [],
+     'outputs': ['{folder}urls{cat}.csv', '{folder}scraped{cat}.csv']},
+    # Every crawl changes the scraped file (crawl-time per expose), so the snapshot of every crawl is appended
+    {'name': 'listingHistory',
+     'code': ['listingHistory.py'],
+     'inputs': ['{folder}scraped{cat}.csv'],
+     'outputs': ['history/{region}/{listingType}/manifest.json', 'history/{region}/{listingType}/index.csv']},
+    {'name': 'geocoding',
+     'code': ['geocoding.py', 'featureEngineering.py'],
+     'inputs': ['{folder}scraped{cat}.csv', '{shapefile}.shp', '{shapefile}.dbf', '{shapefile}.shx'],
+     'outputs': ['{folder}geocodingCache{cat}.csv']},
+    {'name': 'cleaning',
+     'code': ['cleaning.py', 'geocoding.py'],
+     'inputs': ['{folder}scraped{cat}.csv', '{folder}geocodingCache{cat}.csv'],
+     'outputs': ['{folder}cleaned{cat}.csv']},
+    {'name': 'featureEngineering',
+     'code': ['featureEngineering.py'],
+     'inputs': ['{folder}cleaned{cat}.csv', '{shapefile}.shp', '{shapefile}.dbf', '{shapefile}.shx'],
+     'outputs': ['{folder}featureEngineered{cat}.csv'],
+     'parameterFiles': {'textFeatures': {'outputs': ['{folder}textFeatures{cat}.npz']}},
+     # The mapping for cityname to central-coordinates is only created by the buy-branch
+     'branchOutputs': {'_buy': ['{folder}{cityCoordinates}.csv']},
+     'branchParameters': {'_rent': {'cityCoordinates': False}}},
+    {'name': 'trainTestSplitting',
+     'code': ['trainTestSplitting.py'],
+     'inputs': ['{folder}featureEngineered{cat}.csv'],
+     'outputs': ['{folder}dataset{cat}.csv', '{folder}dataset{cat}.json']},
+    {'name': 'modeling',
+     'code': ['modeling.py', 'evaluation.py', 'geoNeighbors.py', 'featureEngineering.py'],
+     'inputs': ['{folder}dataset{cat}.csv', '{folder}dataset{cat}.json'],
+     'parameterFiles': {'textFeatures': {'inputs': ['{folder}textFeatures{cat}.npz']}},
+     'outputs': ['{folder}errorMeasures{cat}.csv', '{folder}model{cat}.p', '{folder}scoringModel{cat}.p']},
+]
+stageNames = [stage['name'] for stage in stages]
+cats = ['_buy', '_rent']
+
+stateFilename = 'pipelineState.json'
+logFolder = 'logs'
+instrumentationFilename = os.path.join(logFolder, 'instrumentation.jsonl')
+codeFolder = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_state():
+    """Returns the saved pipeline-state (fingerprints of stages and hashes of files)"""
+    if not os.path.exists(stateFilename):
+        return {'stages': {}, 'files': {}}
+    with open(stateFilename) as f:
+        return json.load(f)
+
+def save_state(state):
+    """Saves given pipeline-state to file pipelineState.json"""
+    with open(stateFilename, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+def get_branchName(branch):
+    """Returns the name of given branch (tuple of region and cat) used in the pipeline-state and log-files,
+    e.g. '_buy' for the default region and '_bayern_buy' for other regions"""
+    region, cat = branch
+    return ('' if region == gf.defaultRegion else '_' + region) + cat
+
+def merge_branchState(state, branchState, branch):
+    """Merges the state returned by given branch (run in a separate process) into state"""
+    state['files'].update(branchState['files'])
+    branchKeys = [stageName + get_branchName(branch) for stageName in stageNames]
+    state['stages'].update({key: value for key, value in branchState['stages'].items() if key in branchKeys})
+
+def get_fileHash(path, state):
+    """Returns the content-hash of given file or None if it does not exist.
+    The hash is only recalculated if size or modification-time of the file changed
+    since the last calculation (cached in state['files'])."""
+
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    cached = state['files'].get(path)
+    if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    fileHash = gf.hash_file(path)
+    state['files'][path] = [stat.st_size, stat.st_mtime_ns, fileHash]
+    return fileHash
+
+def get_branchFiles(stage, key, branch, stageParameters={}):
+    """Returns the input- (key='inputs') or output-files (key='outputs') of given stage for given branch
+    and given parameters of the stage (see 'parameterFiles' of the stages)"""
+    region, cat = branch
+    paths = stage[key] + (stage.get('branchOutputs', {}).get(cat, []) if key == 'outputs' else [])
+    for parameter, files in stage.get('parameterFiles', {}).items():
+        if stageParameters.get(parameter):
+            paths = paths + files.get(key, [])
+    return [path.format(cat=cat, listingType=cat[1:], region=region, folder=gf.get_regionFolder(region),
+                        shapefile=gf.regions[region]['shapefile'],
+                        cityCoordinates=gf.regions[region]['cityCoordinates'])
+            for path in paths]
+
+def get_stageFingerprint(stage, branch, parameters, state):
+    """Returns fingerprint of given stage for given branch on basis of its code (all modules of stage['code']
+    and generalFunctions.py), parameters and input-files"""
+
+    fingerprint = hashlib.sha256()
+    for path in [os.path.join(codeFolder, filename) for filename in stage['code'] + ['generalFunctions.py']]:
+        fingerprint.update((path + ':' + str(get_fileHash(path, state))).encode('utf-8'))
+    fingerprint.update(json.dumps(parameters, sort_keys=True).encode('utf-8'))
+    for path in get_branchFiles(stage, 'inputs', branch, parameters):
+        fingerprint.update((path + ':' + str(get_fileHash(path, state))).encode('utf-8'))
+
+    return fingerprint.hexdigest()
+
+def is_stageCurrent(stage, branch, fingerprint, state, stageParameters={}):
+    """Returns True if the outputs of given stage for given branch exist, are unchanged since its last run
+    and were created with given fingerprint (never for volatile stages)"""
+
+    if stage.get('volatile', False):
+        return False
+    saved = state['stages'].get(stage['name'] + get_branchName(branch))
+    if saved is None or saved['fingerprint'] != fingerprint:
+        return False
+    return all(get_fileHash(path, state) is not None and get_fileHash(path, state) == saved['outputs'].get(path)
+               for path in get_branchFiles(stage, 'outputs', branch, stageParameters))
+
+def select_stages(fromStage=None, untilStage=None, onlyStage=None):
+    """Returns the stages to consider for given stage-range"""
+
+    if onlyStage is not None:
+        return [stages[stageNames.index(onlyStage)]]
+    start = stageNames.index(fromStage) if fromStage is not None else 0
+    end = stageNames.index(untilStage) + 1 if untilStage is not None else len(stages)
+    return stages[start:end]
+
+def run_stageBranch(stage, branch, parameters, runtimeParameters, state, force, dryRun, upstreamWouldRun):
+    """Runs given stage for given branch (tuple of region and cat) if it is outdated (or forced) and updates state.
+    'parameters' are part of the fingerprint, 'runtimeParameters' (like n_jobs) are not.
+    Returns True if the stage ran (or would run in a dry-run)."""
+
+    region, cat = branch
+    branchName = get_branchName(branch)
+    stageParameters = dict(parameters.get(stage['name'], {}), **stage.get('branchParameters', {}).get(cat, {}))
+    fingerprint = get_stageFingerprint(stage, branch, stageParameters, state)
+    label = stage['name'] + '.py for ' + cat[1:] + ('' if region == gf.defaultRegion else ' in ' + region)
+    if not force and not upstreamWouldRun and is_stageCurrent(stage, branch, fingerprint, state, stageParameters):
+        print('\n' + gf.dayTime() + ': ' + label + ' skipped (outputs are current)')
+        return False
+    if dryRun:
+        print('\n' + gf.dayTime() + ': ' + label + ' would run')
+        return True
+
+    print('\n' + gf.dayTime() + ': ' + label + ' started')
+    with gf.Step(stage['name'] + branchName):
+        importlib.import_module(stage['name']).run(cats=[cat], region=region, **stageParameters,
+                                                   **runtimeParameters.get(stage['name'], {}))
+    state['stages'][stage['name'] + branchName] = {
+        'fingerprint': fingerprint,
+        'outputs': {path: get_fileHash(path, state)
+                    for path in get_branchFiles(stage, 'outputs', branch, stageParameters)}}
+    return True
+
+def run_branch(branchStages, branch, parameters, runtimeParameters, state, force, dryRun,
+               upstreamWouldRun=False, logFilename=None):
+    """Runs given stages for given branch (tuple of region and cat) in sequence. If 'logFilename' is given, all output is
+    written to that file (used when the branch runs in a separate process).
+    Returns the updated state and if a stage ran (or would run in a dry-run)."""
+
+    with contextlib.ExitStack() as stack:
+        if logFilename is not None:
+            log = stack.enter_context(open(logFilename, 'w', encoding='utf-8'))
+            stack.enter_context(contextlib.redirect_stdout(log))
+            stack.enter_context(contextlib.redirect_stderr(log))
+        for stage in branchStages:
+            ran = run_stageBranch(stage, branch, parameters, runtimeParameters, state, force, dryRun, upstreamWouldRun)
+            # In a dry-run the outputs of a stage which would run do not change, so all following stages would run too
+            upstreamWouldRun = upstreamWouldRun or (dryRun and ran)
+
+    return state, upstreamWouldRun
+
+def run_branchesInParallel(branchStages, branches, parameters, runtimeParameters, state, force, dryRun,
+                           upstreamWouldRun, logName, maxWorkers):
+    """Runs given stages for every given branch in a separate process (at most 'maxWorkers' branches
+    run concurrently). The output of every branch is written to its own log-file, which is printed as a block
+    prefixed by the branch-name after all branches have finished, so the logs are not interleaved.
+    If a branch fails, the state of the other branches is merged nevertheless before its exception is re-raised."""
+
+    os.makedirs(logFolder, exist_ok=True)
+    logFilenames = {branch: os.path.join(logFolder, logName + get_branchName(branch) + '.log') for branch in branches}
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(len(branches), maxWorkers)) as executor:
+            futures = {branch: executor.submit(run_branch, branchStages, branch, parameters, runtimeParameters, state,
+                                               force, dryRun, upstreamWouldRun[branch], logFilenames[branch])
+                       for branch in branches}
+            errors = []
+            for branch in branches:
+                try:
+                    branchState, upstreamWouldRun[branch] = futures[branch].result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                merge_branchState(state, branchState, branch)
+        if errors:
+            raise errors[0]
+    finally:
+        for branch in branches:
+            if os.path.exists(logFilenames[branch]):
+                with open(logFilenames[branch], encoding='utf-8') as log:
+                    prefix = '[' + get_branchName(branch).lstrip('_') + '] '
+                    print(''.join(prefix + line for line in log), end='')
+
+def parse_arguments():
+    """Returns the parsed console-arguments as dictionary of parameters for run()"""
+
+    parser = argparse.ArgumentParser(description='Runs the outdated stages of the pipeline.')
+    parser.add_argument('--from', dest='fromStage', choices=stageNames, help='first stage to consider')
+    parser.add_argument('--until', dest='untilStage', choices=stageNames, help='last stage to consider')
+    parser.add_argument('--only', dest='onlyStage', choices=stageNames, help='consider only this stage')
+    parser.add_argument('--cat', dest='branchCats', action='append', choices=cats,
+                        help='consider only this branch (can be given twice), default: both')
+    parser.add_argument('--region', dest='regions', action='append', choices=sorted(gf.regions),
+                        help='consider only this region (can be given several times), default: ' + gf.defaultRegion)
+    parser.add_argument('--force', action='store_true', help='run selected stages even if they are current')
+    parser.add_argument('--dry-run', dest='dryRun', action='store_true', help='only print which stages would run')
+    parser.add_argument('--parallel', choices=['stages', 'pipeline'],
+                        help='run the branches in separate processes, per stage or for the whole pipeline')
+    parser.add_argument('--cpus', type=int, default=os.cpu_count(),
+                        help='CPU budget shared by the branches running in parallel')
+    parser.add_argument('--traceMemory', action='store_true',
+                        help='trace the peak memory allocated by Python per step (slows down the stages)')
+    parser.add_argument('--profile', choices=gf.profileTypes,
+                        help='profile the stages which run, saved per stage and branch in folder profiles')
+    parser.add_argument('--chunkSize', type=int,
+                        help='clean the scraped files in chunks of this number of rows instead of loading them at once')
+    parser.add_argument('--maxNumberExposes', type=int, default=999999,
+                        help='maximum number of exposes to be scraped')
+    parser.add_argument('--splitMode', choices=['random', 'hash'], default='random',
+                        help='split train/test randomly or stable by the hash of the Url (see trainTestSplitting.py)')
+    parser.add_argument('--spatialCellSize', type=float,
+                        help='with --splitMode hash: hash grid-cells of this size in degrees instead of Urls')
+    parser.add_argument('--incremental', action='store_true',
+                        help='update the saved models with the new rows instead of training all models again')
+    parser.add_argument('--spatialCV', choices=['city', 'grid'],
+                        help='cross-validate the models on folds of whole municipalities or grid-cells (see modeling.py)')
+    parser.add_argument('--textFeatures', action='store_true',
+                        help='compare a model with the hashed text-features of the descriptions (see modeling.py)')
+    return vars(parser.parse_args())
 
 
 #----------------------------------------------------------------------------------------------------
 
-  
-# Section 1: Run the run() functions of the imported modules in defined order.
+
+# Section 2: Run the run() functions of the outdated stages in defined order.
 # Print day-timestamp after each step.
 
-print('\n' + gf.dayTime() + ': EXECUTER STARTED!')
-print('\n' + gf.dayTime() + ': scraping.py started')
-scraping.run(maxNumberExposes=999999) #Optional: set parameter 'maxNumberExposes' for maximum number of exposes to be scraped
-print('\n' + gf.dayTime() + ': cleaning.py started')
-cleaning.run()
-print('\n' + gf.dayTime() + ': featureEngineering.py started')
-featureEngineering.run()
-print('\n' + gf.dayTime() + ': trainTestSplitting.py started')
-trainTestSplitting.run()
-print('\n' + gf.dayTime() + ': modeling.py started')
-modeling.run()
-print('\n' + gf.dayTime() + ': EXECUTER FINISHED!')
+
+def run(fromStage=None, untilStage=None, onlyStage=None, branchCats=None, force=False, dryRun=False,
+        parallel=None, cpus=os.cpu_count(), traceMemory=False, profile=None,
+        chunkSize=None, maxNumberExposes=999999, regions=None, incremental=False,
+        splitMode='random', spatialCellSize=None, spatialCV=None, textFeatures=False):
+    """
+    Runs the outdated stages of given stage-range in defined order for the given branches
+    (cats '_buy' and/or '_rent', default both, for every given region, default generalFunctions.defaultRegion).
+    With parallel='stages' the branches of every stage run concurrently in separate processes,
+    with parallel='pipeline' each branch runs through all stages in its own process.
+    The CPU budget 'cpus' is divided between the branches running in parallel,
+    so that the grid-searches of modeling.py and the partitions of featureEngineering.py do not oversubscribe the machine.
+    With traceMemory=True the peak memory allocated by Python is traced per instrumented step.
+    The optional parameter profile ('cprofile', 'sampling' or 'allocations') profiles every stage-branch
+    which runs, see generalFunctions.profiled().
+    The optional parameter chunkSize lets cleaning.py stream the scraped files in chunks of this number of rows.
+    The optional parameter maxNumberExposes defines the maximum number of exposes to be scraped.
+    With incremental=True modeling.py only updates the saved models with the new rows (unless they drifted).
+    The optional parameters splitMode and spatialCellSize define the train/test-split (see trainTestSplitting.py).
+    The optional parameter spatialCV ('city' or 'grid') lets modeling.py cross-validate on spatial folds.
+    With textFeatures=True featureEngineering.py hashes the descriptions and modeling.py compares a model
+    with these text-features.
+    """
+
+    branchCats = branchCats if branchCats else cats
+    regions = regions if regions else [gf.defaultRegion]
+    branches = [(region, cat) for region in regions for cat in branchCats]
+    selectedStages = select_stages(fromStage, untilStage, onlyStage)
+
+    # Parameters passed to the run()-function of the stages (part of the fingerprint)
+    parameters = {'scraping': {'maxNumberExposes': maxNumberExposes}}
+    if incremental:
+        parameters.setdefault('modeling', {})['incremental'] = True
+    if spatialCV is not None:
+        parameters.setdefault('modeling', {})['spatialCV'] = spatialCV
+    if textFeatures:
+        parameters.setdefault('featureEngineering', {})['textFeatures'] = True
+        parameters.setdefault('modeling', {})['textFeatures'] = True
+    if splitMode != 'random':
+        parameters['trainTestSplitting'] = {'splitMode': splitMode, 'spatialCellSize': spatialCellSize}
+    # Parameters passed to the run()-function of the stages, which do not change their outputs
+    parallelBranches = min(len(branches), cpus) if parallel else 1
+    runtimeParameters = {'cleaning': {'chunkSize': chunkSize},
+                         'featureEngineering': {'nPartitions': max(1, cpus // parallelBranches)},
+                         'modeling': {'n_jobs': max(1, cpus // parallelBranches)}}
+    if profile is not None:
+        for stageName in stageNames:
+            runtimeParameters.setdefault(stageName, {})['profile'] = profile
+
+    print('\n' + gf.dayTime() + ': EXECUTER STARTED!')
+    os.makedirs(logFolder, exist_ok=True)
+    runId = gf.start_instrumentation(instrumentationFilename, traceMemory)
+    state = load_state()
+    upstreamWouldRun = {branch: False for branch in branches}
+    # The state is saved even if a stage-branch fails, so the stage-branches which finished are not run again
+    try:
+        if parallel == 'pipeline':
+            run_branchesInParallel(selectedStages, branches, parameters, runtimeParameters, state, force, dryRun,
+                                   upstreamWouldRun, logName='pipeline', maxWorkers=parallelBranches)
+        else:
+            for stage in selectedStages:
+                if parallel == 'stages':
+                    run_branchesInParallel([stage], branches, parameters, runtimeParameters, state, force, dryRun,
+                                           upstreamWouldRun, logName=stage['name'], maxWorkers=parallelBranches)
+                else:
+                    for branch in branches:
+                        state, upstreamWouldRun[branch] = run_branch([stage], branch, parameters, runtimeParameters,
+                                                                     state, force, dryRun, upstreamWouldRun[branch])
+                save_state(state)
+    finally:
+        save_state(state)
+    if not dryRun:
+        print('\n' + gf.dayTime() + ': Instrumentation of run ' + runId + ' (appended to ' + instrumentationFilename + '):')
+        print(gf.summarise_instrumentation(instrumentationFilename, runId).to_string(index=False))
+    print('\n' + gf.dayTime() + ': EXECUTER FINISHED!')
+
+
+# Function run() shall be executed if module is executed directly via console
+if __name__ == "__main__":
+    run(**parse_arguments())
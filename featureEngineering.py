@@ -3,12 +3,21 @@
 Feature engineering based on cleaned dataframe files saved by 'cleaning.py'.
 Feature engineering process consists of renaming columns, one-hot-encoding of
 categorical columns, create mapping for cityname to central-coordinates of the city.
+With nPartitions > 1 the per-row steps run on a pool of processes over partitions of consecutive rows,
+which share the geomap of the region (see engineer_partitioned()).
+The headlines and description-texts are hashed into sparse token-features (see engineer_textFeatures()),
+which are saved separately as textFeatures_buy.npz, textFeatures_rent.npz for the optional text-model
+of 'modeling.py' (only with run(textFeatures=True), e.g. by 'python executer.py --textFeatures').
 
 @author: Michael Volk
 """
 
 import generalFunctions as gf
-import geopandas as gpd
+import collections
+import concurrent.futures
+import os
+import numpy as np
+import pandas as pd
 
 
 #----------------------------------------------------------------------------------------------------
@@ -16,32 +25,106 @@ import geopandas as gpd
 
 # Section 1: Define functions for the feature-engineering-process
 
+# Columns of the cleaned dataframe renamed by renameColumns()
+renamedColumns = {'HardFacts_PRICE_NumberValue': 'Price_buy',
+                  'Price_DataTable_PRICE_RENT_COLD_NumberValue': 'Price_rent_cold',
+                  'Price_DataTable_PRICE_RENT_WARM_NumberValue': 'Price_rent_warm',
+                  'HardFacts_AREA_LIVING_NumberValue': 'Area',
+                  'HardFacts_ROOMS_NumberValue': 'Rooms',
+                  'EstateAddress_District': 'City_district',
+                  'EstateMapData_LocationCoordinates_Latitude': 'Latitude',
+                  'EstateMapData_LocationCoordinates_Longitude': 'Longitude',
+                  'equipmentArea_CONSTRUCTIONYEAR': 'ConstructionYear',
+                  'MediaItemsCount': 'Pictures_number',
+                  'Offerer_globalUserId': 'Offerer_id',
+                  'ProtocolExposeUrl': 'Url'}
+# Categorical columns of the cleaned dataframe one-hot-encoded by categoricalColumns_mapper()
+mappedColumns = ['equipmentArea_CATEGORY', 'equipmentArea_CONDITION', 'equipmentArea_OUTDOOR']
+
+# Core information columns kept by reduce_to_core_columns_featureEngineering_buy()/_rent()
+coreColumns = {'_buy': ['Price_buy',
+                        'Price_buy_perArea',
+                        'Price_estimate_nearest',
+                        'Nearest_price_perArea',
+                        'Area',
+                        'Rooms',
+                        'ConstructionYear',
+                        'City',
+                        'City_district',
+                        'Latitude',
+                        'Longitude',
+                        'EQ_CAT_unknown',
+                        'EQ_CAT_floorApartment',
+                        'EQ_CAT_apartment',
+                        'EQ_CAT_maisonette',
+                        'EQ_CAT_penthouse',
+                        'EQ_CAT_terraceApartment',
+                        'EQ_CAT_loft',
+                        'EQ_CON_unknown',
+                        'EQ_CON_firstOccupancy',
+                        'EQ_CON_upscale',
+                        'EQ_CON_maintained',
+                        'EQ_CON_renovated',
+                        'EQ_CON_needsRenovation',
+                        'EQ_CON_refurbished',
+                        'EQ_CON_needsRefurbishment',
+                        'EQ_CON_partlyRenovated',
+                        'EQ_OUT_balcony',
+                        'EQ_OUT_garden',
+                        'EQ_OUT_loggia',
+                        'EQ_OUT_terrace',
+                        'Url'],
+               '_rent': ['Price_rent_cold',
+                         'Price_rent_cold_perArea',
+                         'Price_rent_warm',
+                         'Price_rent_warm_perArea',
+                         'Price_estimate_nearest',
+                         'Nearest_price_perArea',
+                         'Area',
+                         'Rooms',
+                         'ConstructionYear',
+                         'City',
+                         'City_district',
+                         'Latitude',
+                         'Longitude',
+                         'EQ_CAT_unknown',
+                         'EQ_CAT_floorApartment',
+                         'EQ_CAT_apartment',
+                         'EQ_CAT_maisonette',
+                         'EQ_CAT_penthouse',
+                         'EQ_CAT_terraceApartment',
+                         'EQ_CAT_loft',
+                         'EQ_CON_unknown',
+                         'EQ_CON_firstOccupancy',
+                         'EQ_CON_upscale',
+                         'EQ_CON_maintained',
+                         'EQ_CON_renovated',
+                         'EQ_CON_needsRenovation',
+                         'EQ_CON_refurbished',
+                         'EQ_CON_needsRefurbishment',
+                         'EQ_CON_partlyRenovated',
+                         'EQ_OUT_balcony',
+                         'EQ_OUT_garden',
+                         'EQ_OUT_loggia',
+                         'EQ_OUT_terrace',
+                         'Url']}
+
+@gf.instrumented
 def renameColumns(df):
     """Renames certain columns of df"""
     
-    df.rename(columns={'HardFacts_PRICE_NumberValue': 'Price_buy',
-                       'Price_DataTable_PRICE_RENT_COLD_NumberValue': 'Price_rent_cold',
-                       'Price_DataTable_PRICE_RENT_WARM_NumberValue': 'Price_rent_warm',
-                       'HardFacts_AREA_LIVING_NumberValue': 'Area',
-                       'HardFacts_ROOMS_NumberValue': 'Rooms',
-                       'EstateAddress_District': 'City_district',
-                       'EstateMapData_LocationCoordinates_Latitude': 'Latitude',
-                       'EstateMapData_LocationCoordinates_Longitude': 'Longitude',
-                       'equipmentArea_CONSTRUCTIONYEAR': 'ConstructionYear',
-                       'MediaItemsCount': 'Pictures_number',
-                       'Offerer_globalUserId': 'Offerer_id',
-                       'ProtocolExposeUrl': 'Url'
-                       }, inplace=True)
+    df.rename(columns=renamedColumns, inplace=True)
     
     return df
    
+@gf.instrumented
 def categoricalColumns_mapper(df):
     """Maps values for given dataframe in categorical columns to defined values.
     Creates for every defined value an own column with value 0 or 1 (one-hot-encoding)"""
  
     # equipmentArea_CATEGORY    
     # For missing values set 'unknown' and than create extra one-hot-encoded column 'unknown' for it
-    df.equipmentArea_CATEGORY.fillna('unknown', inplace=True)
+    df['equipmentArea_CATEGORY'] = gf.fill_missing(df['equipmentArea_CATEGORY'], 'unknown')
     df['EQ_CAT_unknown'] = df['equipmentArea_CATEGORY'].apply(
         lambda x: 1 if 'unknown' in x.lower() else 0)
     # Create extra column with 0 or 1 values for every relevant keyword
@@ -60,7 +143,7 @@ def categoricalColumns_mapper(df):
 
     # equipmentArea_CONDITION    
     # For missing values set 'unknown' and than create extra one-hot-encoded column 'unknown' for it
-    df.equipmentArea_CONDITION.fillna('unknown', inplace=True)
+    df['equipmentArea_CONDITION'] = gf.fill_missing(df['equipmentArea_CONDITION'], 'unknown')
     df['EQ_CON_unknown'] = df['equipmentArea_CONDITION'].apply(
         lambda x: 1 if 'unknown' in x.lower() else 0)
     # Create extra column with 0 or 1 values for every relevant keyword
@@ -83,7 +166,7 @@ def categoricalColumns_mapper(df):
                                 
     # equipmentArea_OUTDOOR    
     # For missing values set 'unknown' but create no extra one-hot-encoded column 'unknown' for it
-    df.equipmentArea_OUTDOOR.fillna('unknown', inplace=True)
+    df['equipmentArea_OUTDOOR'] = gf.fill_missing(df['equipmentArea_OUTDOOR'], 'unknown')
     # Create extra column with 0 or 1 values for every relevant outdoor-keyword
     df['EQ_OUT_balcony'] = df['equipmentArea_OUTDOOR'].apply(
         lambda x: 1 if 'balkon' in x.lower() else 0)
@@ -96,6 +179,7 @@ def categoricalColumns_mapper(df):
 
     return df
 
+@gf.instrumented
 def add_Prices_per_Area_buy(df):
     """Adds new column 'Price_buy_perArea'"""
     
@@ -103,6 +187,7 @@ def add_Prices_per_Area_buy(df):
     
     return df
 
+@gf.instrumented
 def add_Prices_per_Area_rent(df):
     """Adds new columns 'Price_rent_cold_perArea' and 'Price_rent_warm_perArea'"""
     
@@ -111,23 +196,28 @@ def add_Prices_per_Area_rent(df):
     
     return df
 
+@gf.instrumented
 def convert_to_geopandasDataframe(df):
     """Convertes dataframe to geopandas dataframe and sets the coordinate reference system (CRS)
     to EPSG 4326 (EPSG 4326 corresponds to coordinates in latitude and longitude).
     Adds a new column named 'geometry', which contains the coordinates"""
     
+    import geopandas as gpd
     df = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(
         df.Longitude, df.Latitude))
     df.crs = {'init': 'epsg:4326'}
     
     return df
 
-def load_geopandasMap(filename="shapefiles\dvg2gem_nw.shp"):    
-    """Reads in geomap from shp-file and returns it as a geopandas_dataframe.
+@gf.instrumented
+def load_geopandasMap(region=gf.defaultRegion):    
+    """Reads in geomap from shp-file of given region (see generalFunctions.regions) and returns it as a geopandas_dataframe.
     Default-shapefile is for german state Nordrhein-Westfalen.
     Source: https://www.opengeodata.nrw.de/produkte/geobasis/vkg/dvg/dvg2/"""
-    return gpd.read_file(filename, encoding='ASCII')
+    import geopandas as gpd
+    return gpd.read_file(gf.regions[region]['shapefile'] + '.shp', encoding='ASCII')
         
+@gf.instrumented
 def convert_epsg(df, epsg=25832):
     """Converts geopandas-dataframe to the epsg used by the geopandasMap
     to be compatible for joint operations"""
@@ -136,122 +226,183 @@ def convert_epsg(df, epsg=25832):
     
     return df
 
-def replace_citynames(df, df_map):
+@gf.instrumented
+def replace_citynames(df, df_map, cityColumn='GN'):
     """Replaces the scraped_cityname by searching on the basis of coordinates
     for the according district-polygon of the given geopandasMap 'df_map' and
-    than using that according district-name."""
+    than using that according district-name (column 'cityColumn' of df_map).
+    The search is a spatial join using the spatial index of df_map. In case of coordinates
+    within several districts the first district of df_map is used, rows with coordinates
+    not within any district of df_map are dropped."""
+    
+    import geopandas as gpd
+    
+    # Find for every point the districts where the coordinates are within and keep the first one of df_map
+    districts = gpd.sjoin(df[['geometry']], df_map[[cityColumn, 'geometry']], how='inner', op='within')
+    districts = districts.sort_values('index_right', kind='mergesort')
+    districts = districts.loc[~districts.index.duplicated(keep='first'), cityColumn]
     
-    def get_cityname(x):
-        """Function for finding the district where the coordinates are within.
-        In case of coordinates not within any district of df_map,
-        the resulting IndexError is handled by returning cityname=UNKNOWN."""
-        try:
-            return df_map.loc[df_map['geometry'].contains(x), 'GN'].values[0]
-        except IndexError:
-            return 'UNKNOWN'
-            
-    # Apply function to dataframe and drop rows with cityname=UNKNOWN
-    df['City'] = df['geometry'].apply(get_cityname)
-    df.drop(df[df.City == 'UNKNOWN'].index, inplace=True)
+    # Map the district-names to the dataframe and drop rows without district
+    df['City'] = df.index.map(districts)
+    df = df[df['City'].notna()].copy()
     
     return df
 
+def engineer_rows(df, df_map, cityColumn='GN'):
+    """Runs the steps of the feature engineering, which only depend on the row itself (and the geomap 'df_map'),
+    for given rows of the cleaned dataframe and returns them without the geometry-column"""
+
+    df = (df.pipe(renameColumns)
+            .pipe(convert_to_geopandasDataframe)
+            .pipe(convert_epsg)
+            .pipe(replace_citynames, df_map, cityColumn)
+            .pipe(categoricalColumns_mapper))
+
+    return pd.DataFrame(df.drop(columns='geometry'))
+
+# Geomap of the region in the worker-processes of engineer_partitioned()
+partitionMap = None
+
+def init_partitionWorker(df_map):
+    """Sets the geomap of the region in a worker-process of engineer_partitioned()"""
+    global partitionMap
+    partitionMap = df_map
+
+def engineer_partition(df, cityColumn):
+    """Runs engineer_rows() for given partition in a worker-process of engineer_partitioned()"""
+    return engineer_rows(df, partitionMap, cityColumn)
+
+@gf.instrumented
+def engineer_partitioned(df, df_map, cityColumn='GN', nPartitions=os.cpu_count(), minPartitionRows=10000):
+    """Splits df into 'nPartitions' partitions of consecutive rows (at least 'minPartitionRows' rows each),
+    runs engineer_rows() for them on a pool of processes and returns the results concatenated in original order.
+    The geomap is passed once to every worker-process when it starts (with fork-processes, the default on Linux,
+    it is inherited copy-on-write, with spawn-processes it is pickled once per worker, not per partition).
+    With a single partition the rows are engineered in this process."""
+
+    nPartitions = max(1, min(nPartitions, len(df) // minPartitionRows))
+    if nPartitions == 1:
+        return engineer_rows(df, df_map, cityColumn)
+
+    bounds = np.linspace(0, len(df), nPartitions + 1).astype('int64')
+    partitions = [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    print(gf.dayTime() + ': Feature engineering of ' + str(len(df)) + ' rows in ' + str(nPartitions) + ' partitions')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=nPartitions, initializer=init_partitionWorker,
+                                                initargs=(df_map,)) as executor:
+        results = list(executor.map(engineer_partition, partitions, [cityColumn] * nPartitions))
+
+    return pd.concat(results)
+
+# Text-columns of the cleaned dataframe hashed by engineer_textFeatures() (in this order, joined to one text per row)
+textColumns = ['General_Headline', 'DescriptionText']
+# Number of hashed text-features (fixed, independent of the vocabulary of the texts)
+textFeaturesCount = 2**18
+# Number of rows of the cleaned file read and hashed at once by engineer_textFeatures()
+textChunkSize = 10000
+
+def hash_texts(texts, nFeatures=textFeaturesCount):
+    """Returns sparse matrix (CSR, float32) with one row per given text and a 1 in the hashed column of every
+    token (lowercased word of at least 2 characters, e.g. 'aufzug', 'tiefgarage', 'fußbodenheizung') of the text.
+    The hashing needs no vocabulary, so every text is hashed independently with fixed memory."""
+    from sklearn.feature_extraction.text import HashingVectorizer
+    vectorizer = HashingVectorizer(n_features=nFeatures, alternate_sign=False, binary=True, norm=None, dtype=np.float32)
+    return vectorizer.transform(texts)
+
+def hash_textChunks(chunks, nFeatures=textFeaturesCount, nPartitions=1):
+    """Hashes the text-lists of given iterable 'chunks' with hash_texts() on a pool of 'nPartitions' processes
+    and returns the stacked sparse matrix of all chunks in original order.
+    The chunks are consumed as the pool proceeds (at most two chunks per process are pending),
+    so a generator of chunks read from a file is streamed and never held in memory at once."""
+
+    import scipy.sparse
+    if nPartitions <= 1:
+        matrices = [hash_texts(chunk, nFeatures) for chunk in chunks]
+    else:
+        matrices = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=nPartitions) as executor:
+            pending = collections.deque()
+            for chunk in chunks:
+                pending.append(executor.submit(hash_texts, chunk, nFeatures))
+                if len(pending) >= 2 * nPartitions:
+                    matrices.append(pending.popleft().result())
+            matrices.extend(future.result() for future in pending)
+    if not matrices:
+        return scipy.sparse.csr_matrix((0, nFeatures), dtype=np.float32)
+
+    return scipy.sparse.vstack(matrices, format='csr')
+
+@gf.instrumented
+def engineer_textFeatures(filename, urls, nPartitions=1, chunkSize=textChunkSize):
+    """Streams the text-columns of given cleaned file in chunks of 'chunkSize' rows, keeps the rows whose Url
+    is in given 'urls' (the feature-engineered rows) and hashes their headline and description-text with
+    hash_textChunks() on 'nPartitions' processes.
+    Returns the sparse matrix of the hashed text-features and the list of the Urls of its rows."""
+
+    urlColumn = {newName: oldName for oldName, newName in renamedColumns.items()}['Url']
+    urls = set(urls)
+    matrixUrls = []
+
+    def read_texts():
+        """Yields the texts of the kept rows of every chunk of the cleaned file"""
+        for chunk in pd.read_csv(filename + '.csv', usecols=[urlColumn] + textColumns, dtype=str, chunksize=chunkSize):
+            chunk = chunk[chunk[urlColumn].isin(urls)]
+            matrixUrls.extend(chunk[urlColumn].tolist())
+            yield chunk[textColumns].fillna('').agg('\n\n'.join, axis=1).tolist()
+
+    matrix = hash_textChunks(read_texts(), textFeaturesCount, nPartitions)
+    print(gf.dayTime() + ': ' + str(matrix.shape[0]) + ' texts hashed to ' + str(matrix.nnz) + ' token-features')
+
+    return matrix, matrixUrls
+
+def save_textFeatures(matrix, urls, filename):
+    """Saves given sparse matrix of hashed text-features and the Urls of its rows to npz-file"""
+    np.savez(filename + '.npz', data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+             shape=matrix.shape, urls=np.array(urls, dtype=str))
+    print("Text-features saved to file: " + filename + '.npz')
+
+def load_textFeatures(filename):
+    """Returns sparse matrix (CSR) of hashed text-features and array of the Urls of its rows
+    of given npz-file (see save_textFeatures())"""
+    import scipy.sparse
+    with np.load(filename + '.npz') as npz:
+        return (scipy.sparse.csr_matrix((npz['data'], npz['indices'], npz['indptr']), shape=tuple(npz['shape'])),
+                npz['urls'])
+
+def get_requiredColumns(cat):
+    """Returns the set of columns of the cleaned file for given cat ('_buy' or '_rent'),
+    which are used by the feature-engineering: the core-columns (with their names before renaming)
+    and the columns of categoricalColumns_mapper() (the other columns need not to be loaded)"""
+    originalNames = {newName: oldName for oldName, newName in renamedColumns.items()}
+    return set([originalNames.get(col, col) for col in coreColumns[cat]] + mappedColumns)
+
 def first_n_rows(df, n=10):
     """Returns only the first n rows of the dataframe df.
     Only relevant for testing."""
      
     return df[0:n].copy()
 
+@gf.instrumented
 def reduce_to_core_columns_featureEngineering_buy(df):
     """Reduces the dataframe, with exposes for buying,
     to the columns which shall be considered in next step data exploration"""
     
-    #Define core information columns
-    coreColumns = ['Price_buy',
-                   'Price_buy_perArea',
-                   'Price_estimate_nearest',
-                   'Nearest_price_perArea',
-                   'Area',
-                   'Rooms',
-                   'ConstructionYear',
-                   'City',
-                   'City_district',
-                   'Latitude',
-                   'Longitude',
-                   'EQ_CAT_unknown',
-                   'EQ_CAT_floorApartment',
-                   'EQ_CAT_apartment',
-                   'EQ_CAT_maisonette',
-                   'EQ_CAT_penthouse',
-                   'EQ_CAT_terraceApartment',
-                   'EQ_CAT_loft',
-                   'EQ_CON_unknown',
-                   'EQ_CON_firstOccupancy',
-                   'EQ_CON_upscale',
-                   'EQ_CON_maintained',
-                   'EQ_CON_renovated',
-                   'EQ_CON_needsRenovation',
-                   'EQ_CON_refurbished',
-                   'EQ_CON_needsRefurbishment',
-                   'EQ_CON_partlyRenovated',
-                   'EQ_OUT_balcony',
-                   'EQ_OUT_garden',
-                   'EQ_OUT_loggia',
-                   'EQ_OUT_terrace',
-                   'Url']
-        
     # Only consider the coreColumns if they exist in the dataframe
     # (because some columns only exist in the buy or rent dataframe)
-    coreColumns_existing = [col for col in coreColumns if col in df.columns]
+    coreColumns_existing = [col for col in coreColumns['_buy'] if col in df.columns]
 
     # Only consider the existing coreColumns in the dataframe (so implicitly drop all other columns)
     df = df[coreColumns_existing].copy()
 
     return df
 
+@gf.instrumented
 def reduce_to_core_columns_featureEngineering_rent(df):
     """Reduces the dataframe, with exposes for renting,
     to the columns which shall be considered in next step data exploration"""
     
-    #Define core information columns
-    coreColumns = ['Price_rent_cold',
-                   'Price_rent_cold_perArea',
-                   'Price_rent_warm',
-                   'Price_rent_warm_perArea',
-                   'Price_estimate_nearest',
-                   'Nearest_price_perArea',
-                   'Area',
-                   'Rooms',
-                   'ConstructionYear',
-                   'City',
-                   'City_district',
-                   'Latitude',
-                   'Longitude',
-                   'EQ_CAT_unknown',
-                   'EQ_CAT_floorApartment',
-                   'EQ_CAT_apartment',
-                   'EQ_CAT_maisonette',
-                   'EQ_CAT_penthouse',
-                   'EQ_CAT_terraceApartment',
-                   'EQ_CAT_loft',
-                   'EQ_CON_unknown',
-                   'EQ_CON_firstOccupancy',
-                   'EQ_CON_upscale',
-                   'EQ_CON_maintained',
-                   'EQ_CON_renovated',
-                   'EQ_CON_needsRenovation',
-                   'EQ_CON_refurbished',
-                   'EQ_CON_needsRefurbishment',
-                   'EQ_CON_partlyRenovated',
-                   'EQ_OUT_balcony',
-                   'EQ_OUT_garden',
-                   'EQ_OUT_loggia',
-                   'EQ_OUT_terrace',
-                   'Url']
-        
     # Only consider the coreColumns if they exist in the dataframe
     # (because some columns only exist in the buy or rent dataframe)
-    coreColumns_existing = [col for col in coreColumns if col in df.columns]
+    coreColumns_existing = [col for col in coreColumns['_rent'] if col in df.columns]
 
     # Only consider the existing coreColumns in the dataframe (so implicitly drop all other columns)
     df = df[coreColumns_existing].copy()
@@ -259,66 +410,86 @@ def reduce_to_core_columns_featureEngineering_rent(df):
     return df
 
 
+def get_cityCoordinates(region=gf.defaultRegion):
+    """For shapefile regarding given region (default german state Nordrhein-Westfalen) returns dataframe
+    with the cityname and the central-coordinates (Latitude, Longitude) of every city"""
+    
+    # Read in geomap from shapefile regarding given region and return it as a geopandas_dataframe
+    df_map = load_geopandasMap(region).to_crs(epsg=4326)
+    # Make central points for the administrative districts out of the polygon
+    # Thanks to https://stackoverflow.com/questions/38899190/geopandas-label-polygons
+    df_map['central'] = df_map['geometry'].apply(lambda x: x.representative_point().coords[:])
+    df_map['central'] = [coords[0] for coords in df_map['central']]
+    df_map['Longitude'] = df_map['central'].apply(lambda x: x[0])
+    df_map['Latitude'] = df_map['central'].apply(lambda x: x[1])
+    df_map.rename(columns={gf.regions[region]['cityColumn']: 'City'}, inplace=True)
+    
+    return pd.DataFrame(df_map[['City', 'Latitude', 'Longitude']])
+
+def save_cityCoordinates(region=gf.defaultRegion):
+    """For shapefile regarding given region (default german state Nordrhein-Westfalen) create mapping
+    for cityname to central-coordinates of the city and save it as file for later using in module app.py"""
+    
+    df_map = get_cityCoordinates(region)
+    # Save dataframe only with cityname and coordinates to file in folder of the region and
+    # for the default region also in web-application folder
+    # HINT: Path of web-application folder is defined for my machine and needs to be adjusted for other machines!
+    filename = gf.regions[region]['cityCoordinates']
+    gf.save_data(df_map[['City', 'Latitude', 'Longitude']].sort_values('City'), filename = gf.get_regionFolder(region) + filename)
+    if region == gf.defaultRegion:
+        gf.save_data(df_map[['City', 'Latitude', 'Longitude']].sort_values('City'), filename = '../Buy-and-Rent-Price-Estimator-for-Apartments_Web-Application/' + filename)
+
+
 #----------------------------------------------------------------------------------------------------
 
 
 # Section 2: Define the order of running the above functions.
 
 
-def run():
+@gf.profilable
+def run(cats=['_buy', '_rent'], cityCoordinates=True, region=gf.defaultRegion, nPartitions=1, textFeatures=False):
     """
     Runs the above functions in defined order.
+    The optional parameter cats defines the dataframes to be feature-engineered ('_buy' and/or '_rent').
+    The optional parameter region defines the region (see generalFunctions.regions) whose files are feature-engineered,
+    the coordinates are only matched against the shapefile of this region.
+    The optional parameter cityCoordinates defines if the mapping for cityname to central-coordinates is created.
+    The optional parameter nPartitions defines the number of processes of the per-row steps (see engineer_partitioned())
+    and of the hashing of the texts.
+    The optional parameter textFeatures defines if the hashed text-features are saved (see engineer_textFeatures()),
+    only needed for modeling.run(textFeatures=True).
+    The optional parameter profile ('cprofile', 'sampling' or 'allocations') profiles the run (see generalFunctions.profiled).
     """
     
-    # Regarding exposes to buy:
-    
-    # Execute pipeline
-    df_buy_feature_engineered = (
-          gf.load_data(filename = "cleaned_buy")
-          # .pipe(first_n_rows, n=100) #only relevant for testing
-          .pipe(renameColumns)
-          .pipe(convert_to_geopandasDataframe)
-          .pipe(convert_epsg)
-          .pipe(replace_citynames, load_geopandasMap())
-          .pipe(categoricalColumns_mapper)
-          .pipe(add_Prices_per_Area_buy)
-          .pipe(reduce_to_core_columns_featureEngineering_buy)
-          .pipe(gf.save_data, filename = "featureEngineered_buy")
-    )
+    # Define for exposes to buy and to rent the specific functions
+    add_Prices_per_Area = {'_buy': add_Prices_per_Area_buy, '_rent': add_Prices_per_Area_rent}
+    reduce_to_core_columns_featureEngineering = {'_buy': reduce_to_core_columns_featureEngineering_buy,
+                                                 '_rent': reduce_to_core_columns_featureEngineering_rent}
     
-    # Regarding exposes to rent:
+    # Read in geomap of the region once for all cats
+    regionFolder = gf.get_regionFolder(region)
+    df_map = load_geopandasMap(region)
     
-    # Execute pipeline
-    df_rent_feature_engineered = (
-          gf.load_data(filename = "cleaned_rent")
-          # .pipe(first_n_rows, n=100) #only relevant for testing
-          .pipe(renameColumns)
-          .pipe(convert_to_geopandasDataframe)
-          .pipe(convert_epsg)
-          .pipe(replace_citynames, load_geopandasMap())
-          .pipe(categoricalColumns_mapper)
-          .pipe(add_Prices_per_Area_rent)
-          .pipe(reduce_to_core_columns_featureEngineering_rent)
-          .pipe(gf.save_data, filename = "featureEngineered_rent")
-    )
+    for cat in cats:
     
+        # Execute pipeline
+        df_feature_engineered = (
+              gf.load_data(filename = regionFolder + "cleaned" + cat, columns = get_requiredColumns(cat))
+              # .pipe(first_n_rows, n=100) #only relevant for testing
+              .pipe(engineer_partitioned, df_map, gf.regions[region]['cityColumn'], nPartitions)
+              .pipe(gf.optimise_dtypes)
+              .pipe(add_Prices_per_Area[cat])
+              .pipe(reduce_to_core_columns_featureEngineering[cat])
+              .pipe(gf.save_data, filename = regionFolder + "featureEngineered" + cat)
+        )
+        
+        # Hash the texts of the feature-engineered rows
+        if textFeatures:
+            matrix, urls = engineer_textFeatures(regionFolder + "cleaned" + cat, df_feature_engineered['Url'], nPartitions)
+            save_textFeatures(matrix, urls, filename = regionFolder + "textFeatures" + cat)
     
-    # For shapefile regarding german state Nordrhein-WestfalenCreate create mapping
-    # for cityname to central-coordinates of the city and save it as file for later using in module app.py
-    
-    # Read in geomap from shapefile regarding german state North Rhine-Westphalia and return it as a geopandas_dataframe
-    df_map = load_geopandasMap().to_crs(epsg=4326)
-    # Make central points for the administrative districts out of the polygon
-    # Thanks to https://stackoverflow.com/questions/38899190/geopandas-label-polygons
-    df_map['central'] = df_map['geometry'].apply(lambda x: x.representative_point().coords[:])
-    df_map['central'] = [coords[0] for coords in df_map['central']]
-    df_map['Longitude'] = df_map['central'].apply(lambda x: x[0])
-    df_map['Latitude'] = df_map['central'].apply(lambda x: x[1])
-    df_map.rename(columns={'GN': 'City'}, inplace=True)
-    # Save dataframe only with cityname and coordinates to file in current folder and web-application folder
-    # HINT: Path of web-application folder is defined for my machine and needs to be adjusted for other machines!
-    gf.save_data(df_map[['City', 'Latitude', 'Longitude']].sort_values('City'), filename = 'nrwCityCoordinates')
-    gf.save_data(df_map[['City', 'Latitude', 'Longitude']].sort_values('City'), filename = '../Buy-and-Rent-Price-Estimator-for-Apartments_Web-Application/nrwCityCoordinates')
+    if cityCoordinates:
+        save_cityCoordinates(region)
     
 
 # Function run() shall be executed if module is executed directly via console 
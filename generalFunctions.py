@@ -7,29 +7,459 @@ to avoid redundancy.
 """
 
 import pandas as pd
+import collections
+import contextlib
+import cProfile
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
 from datetime import datetime
 
 def dayTime():
     """Returns actual day and time formatted as String"""
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-def load_data(filename):    
-    """Read in data from csv-file and returns dataframe"""    
-    return pd.read_csv(filename + '.csv')
+def get_peakRss():
+    """Returns the peak resident set size of the current process in MB"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is given in bytes on macOS and in kilobytes on Linux
+        return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        # Windows has no module resource
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024**2
 
+
+# Instrumentation of the pipeline-steps: every step measured with Step (context manager)
+# or instrumented (decorator) records wall time, CPU time, peak memory and rows in and out.
+# The records are kept in instrumentationRecords and, after start_instrumentation(), appended as
+# JSON-lines to a file. File, run-id and memory-tracing are passed via environment-variables,
+# so that stages running in separate processes write to the same file.
+instrumentationRecords = []
+instrumentationStack = []
+
+def start_instrumentation(filename='instrumentation.jsonl', traceMemory=False):
+    """Starts a new instrumented run whose records are appended as JSON-lines to given file.
+    With traceMemory=True the peak of the memory allocated by Python is traced per step
+    via tracemalloc (slows down the steps), otherwise only the peak RSS of the process is recorded.
+    Returns the id of the run."""
+
+    runId = uuid.uuid4().hex[:12]
+    os.environ['PIPELINE_INSTRUMENTATION_FILE'] = os.path.abspath(filename)
+    os.environ['PIPELINE_INSTRUMENTATION_RUN'] = runId
+    os.environ['PIPELINE_INSTRUMENTATION_TRACEMEMORY'] = '1' if traceMemory else ''
+    del instrumentationRecords[:]
+    return runId
+
+def count_rows(obj):
+    """Returns the number of rows of given dataframe/series/array (first element of a tuple) or None"""
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]
+    shape = getattr(obj, 'shape', None)
+    return int(shape[0]) if shape else None
+
+
+class Step:
+    """Context manager measuring one pipeline-step. Usage:
+        with gf.Step('cleaning_buy', rowsIn=len(df)) as step:
+            df = ...
+            step.rowsOut = len(df)
+    Nested steps are recorded with the path of their parent-steps."""
+
+    def __init__(self, name, rowsIn=None):
+        self.name = name
+        self.rowsIn = rowsIn
+        self.rowsOut = None
+
+    def __enter__(self):
+        self.traceMemory = bool(os.environ.get('PIPELINE_INSTRUMENTATION_TRACEMEMORY'))
+        if self.traceMemory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self.peakMemory = self.start_memoryInterval()
+        self.path = ' > '.join([step.name for step in instrumentationStack] + [self.name])
+        instrumentationStack.append(self)
+        self.startWall = time.perf_counter()
+        self.startCpu = time.process_time()
+        return self
+
+    def start_memoryInterval(self):
+        """Passes the traced peak since the last interval to all running steps
+        and starts a new interval. Returns the currently traced memory."""
+        current, peak = tracemalloc.get_traced_memory()
+        for step in instrumentationStack:
+            step.peakMemory = max(getattr(step, 'peakMemory', 0), peak)
+        # Without reset_peak() (Python < 3.9) the peak is the one since the start of tracing
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        return current
+
+    def __exit__(self, excType, excValue, traceback):
+        record = {'run': os.environ.get('PIPELINE_INSTRUMENTATION_RUN'),
+                  'time': dayTime(),
+                  'pid': os.getpid(),
+                  'step': self.name,
+                  'path': self.path,
+                  'wall_seconds': round(time.perf_counter() - self.startWall, 4),
+                  'cpu_seconds': round(time.process_time() - self.startCpu, 4),
+                  'peak_traced_mb': None,
+                  'peak_rss_mb': round(get_peakRss(), 1),
+                  'rows_in': self.rowsIn,
+                  'rows_out': self.rowsOut,
+                  'failed': excType is not None}
+        if self.traceMemory:
+            self.start_memoryInterval()
+            record['peak_traced_mb'] = round(self.peakMemory / 1024**2, 1)
+        instrumentationStack.remove(self)
+        instrumentationRecords.append(record)
+        filename = os.environ.get('PIPELINE_INSTRUMENTATION_FILE')
+        if filename:
+            with open(filename, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+        return False
+
+
+def instrumented(func):
+    """Decorator measuring every call of given function as Step. The rows in are counted for the
+    first argument and the rows out for the return-value (if they are dataframes, series or arrays)."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with Step(func.__name__, rowsIn=count_rows(args[0]) if args else None) as step:
+            result = func(*args, **kwargs)
+            step.rowsOut = count_rows(result)
+        return result
+
+    return wrapper
+
+def summarise_instrumentation(filename=None, runId=None):
+    """Returns summary-table of the instrumentation-records of given run per step-path
+    (default: the records of the current process or, if given, all records in file 'filename').
+    Peak-columns are the maximum, all other columns the sum over the calls of the step."""
+
+    records = instrumentationRecords
+    if filename is not None:
+        if not os.path.exists(filename):
+            return pd.DataFrame()
+        with open(filename, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    df = pd.DataFrame(records)
+    if df.empty:
+        return df
+    if runId is not None:
+        df = df[df['run'] == runId]
+
+    return (df.groupby('path', sort=False)
+              .agg(calls=('step', 'size'), wall_seconds=('wall_seconds', 'sum'), cpu_seconds=('cpu_seconds', 'sum'),
+                   peak_traced_mb=('peak_traced_mb', 'max'), peak_rss_mb=('peak_rss_mb', 'max'),
+                   rows_in=('rows_in', lambda rows: rows.sum(min_count=1)),
+                   rows_out=('rows_out', lambda rows: rows.sum(min_count=1)))
+              .sort_values('wall_seconds', ascending=False)
+              .reset_index())
+
+
+# Profiling of pipeline-stages: the run()-functions of the stages are decorated with 'profilable'
+# and accept the optional parameter profile:
+# * 'cprofile': deterministic profile of every function-call saved as <name>.prof (readable with pstats/snakeviz)
+# * 'sampling': samples the call-stack every 5 ms and saves the counts of the stacks as <name>.collapsed
+#   (collapsed-stack format of flamegraph.pl/speedscope, frames without line-numbers to be comparable across runs)
+# * 'allocations': traces the memory allocations and saves the biggest allocating lines as <name>.allocations.txt
+# The files are saved in folder 'profiles' with the name of the stage and its cats, e.g. cleaning_buy.prof.
+profileFolder = 'profiles'
+profileTypes = ['cprofile', 'sampling', 'allocations']
+
+
+class SamplingProfiler:
+    """Samples the call-stack of the thread which started it every 'interval' seconds
+    in a background-thread and counts the collapsed stacks ('module:function;module:function')"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stackCounts = collections.Counter()
+
+    def start(self):
+        self.threadId = threading.get_ident()
+        self.stopEvent = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def sample(self):
+        while not self.stopEvent.wait(self.interval):
+            frame = sys._current_frames().get(self.threadId)
+            stack = []
+            while frame is not None:
+                stack.append(os.path.basename(frame.f_code.co_filename) + ':' + frame.f_code.co_name)
+                frame = frame.f_back
+            self.stackCounts[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopEvent.set()
+        self.thread.join()
+
+    def save(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            for stack, count in self.stackCounts.most_common():
+                f.write(stack + ' ' + str(count) + '\n')
+
+
+@contextlib.contextmanager
+def profiled(name, profile=None, top=50):
+    """Profiles the enclosed code with given profile-type (see profileTypes, None: no profiling)
+    and saves the result to a file with given name in folder 'profiles'"""
+
+    if profile is None:
+        yield
+        return
+    if profile not in profileTypes:
+        raise ValueError('Unknown profile-type ' + str(profile) + ', choose one of ' + str(profileTypes))
+    os.makedirs(profileFolder, exist_ok=True)
+    filename = os.path.join(profileFolder, name)
+
+    if profile == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(filename + '.prof')
+            print("Profile saved to file: " + filename + '.prof')
+    elif profile == 'sampling':
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            profiler.save(filename + '.collapsed')
+            print("Profile saved to file: " + filename + '.collapsed')
+    else:
+        startedTracing = not tracemalloc.is_tracing()
+        if startedTracing:
+            tracemalloc.start(25)
+        snapshotBefore = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            snapshotAfter = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if startedTracing:
+                tracemalloc.stop()
+            with open(filename + '.allocations.txt', 'w', encoding='utf-8') as f:
+                f.write('Traced memory: current ' + str(round(current / 1024**2, 1)) + ' MB, peak '
+                        + str(round(peak / 1024**2, 1)) + ' MB\n')
+                f.write('Top ' + str(top) + ' lines by allocated memory (difference to start):\n')
+                for stat in snapshotAfter.compare_to(snapshotBefore, 'lineno')[:top]:
+                    f.write(str(stat) + '\n')
+            print("Profile saved to file: " + filename + '.allocations.txt')
+
+def profilable(func):
+    """Decorator adding the optional parameter profile (see profiled()) to given run()-function of a stage.
+    The profile is named after the module, the region (if not the default region) and the cats of the run,
+    e.g. cleaning_buy or cleaning_bayern_buy."""
+
+    @functools.wraps(func)
+    def wrapper(*args, profile=None, **kwargs):
+        if profile is None:
+            return func(*args, **kwargs)
+        arguments = inspect.signature(func).bind(*args, **kwargs)
+        arguments.apply_defaults()
+        moduleName = os.path.splitext(os.path.basename(func.__globals__.get('__file__', func.__module__)))[0]
+        region = arguments.arguments.get('region', defaultRegion)
+        region = region if isinstance(region, str) else 'pooled'
+        name = moduleName + ('' if region == defaultRegion else '_' + region) + ''.join(arguments.arguments.get('cats', []))
+        with profiled(name, profile):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+# Regions (german federal states) which can be scraped and processed with the key used as region-parameter:
+# * 'searchSlug': part of the immowelt.de search-url for the region
+# * 'shapefile': shapefile (without extension) with the polygons of the municipalities of the region
+# * 'cityColumn': column of the shapefile with the name of the municipality
+# * 'cityCoordinates': file (without extension) of the mapping cityname to central-coordinates
+# The artefacts of a region are saved in folder regions/<region>/ (one file per listing-type '_buy'/'_rent'),
+# those of the default region North Rhine-Westphalia in the current folder (used by the web-application).
+# HINT: Only the shapefile of North Rhine-Westphalia is part of this repo. For the other regions the shapefile
+# of their municipalities (e.g. extracted from the VG250-dataset of the Federal Agency for Cartography and Geodesy,
+# municipality-name in column 'GEN') has to be saved as shapefiles\<region>.shp first.
+defaultRegion = 'nordrhein-westfalen'
+regions = {region: {'searchSlug': 'bl-' + region,
+                    'shapefile': 'shapefiles\\' + region,
+                    'cityColumn': 'GEN',
+                    'cityCoordinates': region + 'CityCoordinates'}
+           for region in ['baden-wuerttemberg', 'bayern', 'berlin', 'brandenburg', 'bremen', 'hamburg', 'hessen',
+                          'mecklenburg-vorpommern', 'niedersachsen', 'rheinland-pfalz', 'saarland', 'sachsen',
+                          'sachsen-anhalt', 'schleswig-holstein', 'thueringen']}
+regions[defaultRegion] = {'searchSlug': 'bl-nordrhein-westfalen',
+                          'shapefile': 'shapefiles\\dvg2gem_nw',
+                          'cityColumn': 'GN',
+                          'cityCoordinates': 'nrwCityCoordinates'}
+
+def get_regionFolder(region=defaultRegion):
+    """Returns the folder (with trailing slash, empty for the default region) of the artefacts of given region"""
+    return '' if region == defaultRegion else 'regions/' + region + '/'
+
+# Explicit dtypes of the columns of the pipeline-files (scraped, cleaned, featureEngineered, X, y),
+# applied by load_data() and optimise_dtypes() to reduce the memory of the dataframes.
+# float32 is only used for values it represents exactly (integers and halves), category only for
+# strings with few distinct values and uint8 for the one-hot-encoded 0/1-columns, so saving
+# an optimised dataframe writes exactly the same csv-file. Prices, areas and coordinates stay float64.
+dtypeSchema = {'HardFacts_ROOMS_NumberValue': 'float32',
+               'Rooms': 'float32',
+               'equipmentArea_CONSTRUCTIONYEAR': 'float32',
+               'ConstructionYear': 'float32',
+               'MediaItemsCount': 'float32',
+               'Pictures_number': 'float32',
+               'EstateAddress_City': 'category',
+               'EstateAddress_District': 'category',
+               'EstateAddress_FederalState': 'category',
+               'City_district': 'category',
+               'City': 'category',
+               'Offerer_globalUserId': 'category',
+               'Offerer_id': 'category',
+               'equipmentArea_CATEGORY': 'category',
+               'equipmentArea_CONDITION': 'category',
+               'equipmentArea_ENERGY': 'category',
+               'equipmentArea_FLOOR': 'category',
+               'equipmentArea_OUTDOOR': 'category',
+               'General_EstateTypeKey': 'category',
+               'General_DistributionTypeKey': 'category',
+               'HardFacts_PRICE_Unit': 'category',
+               'HardFacts_PRICE_Label': 'category',
+               'HardFacts_AREA_LIVING_Unit': 'category',
+               'HardFacts_AREA_LIVING_Label': 'category',
+               'HardFacts_ROOMS_Label': 'category',
+               'Price_DataTable_PRICE_RENT_COLD_Unit': 'category',
+               'Price_DataTable_PRICE_RENT_COLD_Label': 'category',
+               'Price_AdditionalInformation_Commission_CommissionType': 'category'}
+dtypePrefixSchema = {'EQ_': 'uint8'}
+# Other string-columns are stored as category if at most this share of their values is distinct
+categoryMaxDistinctShare = 0.5
+
+def get_schemaDtype(col):
+    """Returns the dtype of given column defined by dtypeSchema/dtypePrefixSchema or None"""
+    if col in dtypeSchema:
+        return dtypeSchema[col]
+    for prefix, dtype in dtypePrefixSchema.items():
+        if col.startswith(prefix):
+            return dtype
+    return None
+
+def get_memoryUsage(df):
+    """Returns the memory used by given dataframe in MB (including the strings)"""
+    return df.memory_usage(deep=True).sum() / 1024**2
+
+def optimise_dtypes(df):
+    """Converts the columns of given dataframe to the dtypes of dtypeSchema/dtypePrefixSchema
+    and other string-columns with few distinct values to category. Returns the dataframe."""
+
+    for col in df.columns:
+        dtype = get_schemaDtype(col)
+        if dtype is None and df[col].dtype == 'object':
+            values = df[col].dropna()
+            if (pd.api.types.infer_dtype(values, skipna=True) == 'string'
+                    and values.nunique() <= categoryMaxDistinctShare * len(values)):
+                dtype = 'category'
+        if dtype is not None and df[col].dtype != dtype:
+            df[col] = df[col].astype(dtype)
+
+    return df
+
+def fill_missing(series, value):
+    """Returns given series with missing values filled with given value (also for categorical series)"""
+    if isinstance(series.dtype, pd.CategoricalDtype) and value not in series.cat.categories:
+        series = series.cat.add_categories([value])
+    return series.fillna(value)
+
+@instrumented
+def load_data(filename, optimiseDtypes=True, columns=None, skiprows=None, nrows=None):    
+    """Read in data from csv-file and returns dataframe.
+    With optimiseDtypes=True the numerical columns of dtypeSchema are parsed directly with their dtype
+    and the dataframe is optimised with optimise_dtypes(). Categories are only converted after parsing,
+    so that their values keep the parsed type (e.g. numerical ids are sorted as numbers, not as strings).
+    If 'columns' (list or set of column-names) is given, only these columns of the file are parsed
+    (names not contained in the file are ignored).
+    The optional parameters skiprows and nrows are passed to pandas.read_csv() to read only a block of rows."""    
+    usecols = None if columns is None else (lambda col, columns=set(columns): col in columns)
+    if not optimiseDtypes:
+        return pd.read_csv(filename + '.csv', usecols=usecols, skiprows=skiprows, nrows=nrows)
+    header = pd.read_csv(filename + '.csv', nrows=0, usecols=usecols).columns
+    dtypes = {col: get_schemaDtype(col) for col in header if get_schemaDtype(col) not in [None, 'category']}
+    return optimise_dtypes(pd.read_csv(filename + '.csv', usecols=usecols, dtype=dtypes, skiprows=skiprows, nrows=nrows))
+
+@instrumented
 def save_data(df, filename):
-    """Saves given dataframe df to csv-file"""
+    """Saves given dataframe df to csv-file (the folder of the file is created if necessary)"""
+    if os.path.dirname(filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
     df.to_csv(filename + '.csv', index = False)
     print("Dataframe saved to file: " + filename + '.csv')
     return df
 
+def save_dataset(X_train, X_test, y_train, y_test, filename):
+    """Saves target, features and split-assignment (column 'Split': 'train' or 'test') of given train- and test-rows
+    as one csv-file, the train-rows first so every split is a contiguous block of rows.
+    The target-name and the number of rows per split are saved to json-file with the same name."""
+
+    df = pd.concat([pd.concat([y_train, X_train], axis=1), pd.concat([y_test, X_test], axis=1)], ignore_index=True)
+    df['Split'] = ['train'] * len(X_train) + ['test'] * len(X_test)
+    save_data(df, filename)
+    with open(filename + '.json', 'w') as f:
+        json.dump({'target': y_train.name, 'rows': {'train': len(X_train), 'test': len(X_test)}}, f, indent=1)
+
+def get_datasetSlices(filename):
+    """Returns dictionary with the row-slices of the splits ('train', 'test') of given dataset-file
+    (see save_dataset()), X.iloc[slices['train']] of the whole dataset is a view without copy"""
+    with open(filename + '.json') as f:
+        rows = json.load(f)['rows']
+    return {'train': slice(0, rows['train']), 'test': slice(rows['train'], rows['train'] + rows['test'])}
+
+def load_dataset(filename, split=None, columns=None):
+    """Returns features X (dataframe) and target y (series) of given dataset-file (see save_dataset()).
+    With split='train' or 'test' only the block of rows of that split is read from the file,
+    with split=None all rows (train-rows first, see get_datasetSlices() for views of the splits).
+    If 'columns' is given, only these feature-columns are read."""
+
+    with open(filename + '.json') as f:
+        info = json.load(f)
+    skiprows, nrows = None, None
+    if split == 'train':
+        nrows = info['rows']['train']
+    elif split == 'test':
+        skiprows = range(1, info['rows']['train'] + 1)
+    df = load_data(filename, columns=None if columns is None else set(columns) | {info['target']},
+                   skiprows=skiprows, nrows=nrows)
+    y = df.pop(info['target'])
+    X = df.drop(columns='Split', errors='ignore')
+
+    return X, y
+
+def hash_file(path, blockSize=1024*1024):
+    """Returns the sha256-hash of the content of the file with given path as hex-string"""
+    fileHash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            fileHash.update(block)
+    return fileHash.hexdigest()
+
 def get_numerical_columns(df):
     """Returns all numerical columns for given dataframe df as a list"""    
-    return [col for col in df.columns if df[col].dtype in ['int64', 'float64']]
+    return [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col].dtype)]
 
 def get_categorical_columns(df):
     """Returns all categorical columns for given dataframe df as a list"""    
-    return [col for col in df.columns if df[col].dtype in ['object']]
+    return [col for col in df.columns if df[col].dtype in ['object', 'category']]
 
 def sort_df_columns(df):
     """Returns given dataframe df with columns sorted alphabetically"""
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Geo-aware K-Nearest Neighbors model for the coordinates of the apartments, used by 'modeling.py'.
+In contrast to KNeighborsRegressor on raw Latitude/Longitude (degrees treated as euclidean coordinates,
+although a degree of Longitude is only about 0.6 of a degree of Latitude in Germany) the neighbors
+are searched by their great-circle distance in a BallTree with haversine-metric.
+For very large listing sets an approximate mode searches a KDTree on coordinates projected to kilometres
+(equirectangular projection around a reference-latitude), which is much cheaper to query than the haversine-metric
+and whose distances deviate only by a fraction of a percent within a federal state.
+The tree is built once while fitting and pickled with the model, so it is not rebuilt when the model is loaded.
+HINT: The web-application needs this module next to 'app.py' to load such a model (model candidate knn_geo_LaLo).
+
+@author: Michael Volk
+"""
+
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.neighbors import BallTree, KDTree
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 1: Define the model
+
+
+# Mean earth radius in kilometres
+earthRadius = 6371.0
+
+# Number of train-rows from which modeling.py uses the approximate mode
+approximateFromRows = 1000000
+
+
+class GeoKNeighborsRegressor(RegressorMixin, BaseEstimator):
+    """K-Nearest Neighbors regression on the columns Latitude and Longitude (in this order, in degrees).
+    n_neighbors: number of neighbors, weights: 'uniform' or 'distance' (weighted by inverse distance),
+    leaf_size: leaf-size of the tree (trade-off between building- and query-time),
+    approximate: search a KDTree on projected coordinates (see module-docstring) instead of the BallTree with haversine-metric,
+    referenceLatitude: latitude (in degrees) of the projection of the approximate mode (default: centre of Germany)."""
+
+    def __init__(self, n_neighbors=5, weights='uniform', leaf_size=40, approximate=False, referenceLatitude=51.0):
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        self.leaf_size = leaf_size
+        self.approximate = approximate
+        self.referenceLatitude = referenceLatitude
+
+    def transform_coordinates(self, X):
+        """Returns the coordinates of given X (Latitude, Longitude in degrees) in the space of the tree:
+        radians for the haversine-metric, kilometres of the equirectangular projection for the approximate mode"""
+        X = np.radians(np.asarray(X, dtype='float64'))
+        if X.ndim != 2 or X.shape[1] != 2:
+            raise ValueError('GeoKNeighborsRegressor expects the two columns Latitude and Longitude, got shape ' + str(X.shape))
+        if self.approximate:
+            return earthRadius * np.column_stack([X[:, 0], X[:, 1] * np.cos(np.radians(self.referenceLatitude))])
+        return X
+
+    def fit(self, X, y):
+        """Builds the tree of the coordinates of given X and saves the targets y"""
+        self.coordinates_ = np.asarray(X, dtype='float64')
+        self.targets_ = np.asarray(y, dtype='float64')
+        points = self.transform_coordinates(self.coordinates_)
+        if self.approximate:
+            self.tree_ = KDTree(points, leaf_size=self.leaf_size)
+        else:
+            self.tree_ = BallTree(points, leaf_size=self.leaf_size, metric='haversine')
+        self.n_features_in_ = 2
+        return self
+
+    def kneighbors(self, X):
+        """Returns the distances (in kilometres) and row-positions of the nearest neighbors of every row of given X"""
+        distances, indices = self.tree_.query(self.transform_coordinates(X), k=min(self.n_neighbors, len(self.targets_)))
+        return (distances if self.approximate else distances * earthRadius), indices
+
+    def predict(self, X):
+        """Returns the (weighted) mean of the targets of the nearest neighbors of every row of given X"""
+        distances, indices = self.kneighbors(X)
+        if self.weights == 'distance':
+            with np.errstate(divide='ignore'):
+                weights = 1 / distances
+            # Rows with neighbors at distance 0 get the mean of these neighbors (like KNeighborsRegressor)
+            exact = np.isinf(weights)
+            weights[exact.any(axis=1)] = exact[exact.any(axis=1)]
+            return (self.targets_[indices] * weights).sum(axis=1) / weights.sum(axis=1)
+        return self.targets_[indices].mean(axis=1)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Offline geocoding of the exposes without coordinates, which would otherwise be dropped by 'cleaning.py'
+(about 5% of the scraped exposes have no Latitude/Longitude, but their zip code and city, mostly also their district).
+Builds a persistent cache geocodingCache_buy.csv, geocodingCache_rent.csv (in the folder of the region) with
+the centroids of the coordinates of all exposes seen so far per zip code and district, per zip code and per city,
+and the central-coordinates of the municipalities of the shapefile of the region. 'cleaning.py' looks up the missing
+coordinates in a dictionary per level (most specific level first), so no network-calls are necessary.
+
+The centroids are running means over the exposes seen in all scraping-runs (level 'listing' of the cache
+contains the Url of every expose already counted, so an expose scraped again is not counted twice).
+The level of the imputed coordinates is saved in column GeocodingLevel_OWN of the cleaned exposes. The imputed coordinates
+are only approximations (median distance to the true coordinates about 6 km), with cleaning.run(imputeCoordinates=False)
+the exposes without coordinates are dropped instead.
+
+@author: Michael Volk
+"""
+
+import generalFunctions as gf
+import os
+import pandas as pd
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 1: Define functions for the geocoding
+
+
+cacheColumns = ['Level', 'Key', 'Latitude', 'Longitude', 'Count']
+# Levels of the cache in order of the lookup (most specific first), the centroids of the first three levels
+# are calculated from the seen exposes, those of 'municipality' from the shapefile of the region
+lookupLevels = ['zipDistrict', 'zip', 'city', 'municipality']
+latitudeColumn = 'EstateMapData_LocationCoordinates_Latitude'
+longitudeColumn = 'EstateMapData_LocationCoordinates_Longitude'
+urlColumn = 'ProtocolExposeUrl'
+# Columns of the scraped files used by the geocoding
+geocodingColumns = ['EstateAddress_ZipCode', 'EstateAddress_District', 'EstateAddress_City',
+                    latitudeColumn, longitudeColumn, urlColumn]
+# Column added by impute_coordinates() with the level of the imputed coordinates (empty for scraped coordinates)
+levelColumn = 'GeocodingLevel_OWN'
+
+
+def get_cacheFilename(cat, region=gf.defaultRegion):
+    """Returns the filename (without .csv) of the geocoding-cache of given cat and region"""
+    return gf.get_regionFolder(region) + 'geocodingCache' + cat
+
+def make_keys(df, level):
+    """Returns series with the key of every row of given df for given level of the cache
+    (normalised zip code, district and city, missing if a part of the key is missing)"""
+
+    if level in ['city', 'municipality']:
+        return df['EstateAddress_City'].astype('string').str.strip().str.lower()
+    zips = pd.to_numeric(df['EstateAddress_ZipCode'], errors='coerce').astype('Int64').astype('string').str.zfill(5)
+    if level == 'zip':
+        return zips
+    return zips + '|' + df['EstateAddress_District'].astype('string').str.strip().str.lower()
+
+def load_cache(cat, region=gf.defaultRegion):
+    """Returns the geocoding-cache of given cat and region as dataframe (empty if it does not exist yet)"""
+    filename = get_cacheFilename(cat, region)
+    if not os.path.exists(filename + '.csv'):
+        return pd.DataFrame(columns=cacheColumns)
+    return pd.read_csv(filename + '.csv', dtype={'Key': str})
+
+@gf.instrumented
+def update_cache(cache, df, region=gf.defaultRegion):
+    """Adds the exposes of given df with coordinates, which are not yet in given cache, to the centroids of
+    the cache (running means) and the central-coordinates of the municipalities of the shapefile of given region,
+    if the cache does not contain them yet. Returns the updated cache."""
+
+    seenUrls = set(cache.loc[cache['Level'] == 'listing', 'Key'])
+    new = df[df[latitudeColumn].notna() & df[longitudeColumn].notna() & df[urlColumn].notna()]
+    new = new[~new[urlColumn].isin(seenUrls)].drop_duplicates(subset=urlColumn)
+    levels = [cache[cache['Level'].isin(['listing', 'municipality'])],
+              pd.DataFrame({'Level': 'listing', 'Key': new[urlColumn], 'Latitude': new[latitudeColumn],
+                            'Longitude': new[longitudeColumn], 'Count': 1})]
+
+    for level in lookupLevels[:3]:
+        points = pd.DataFrame({'Key': make_keys(new, level), 'Latitude': new[latitudeColumn],
+                               'Longitude': new[longitudeColumn], 'Count': 1}).dropna(subset=['Key'])
+        sums = points.groupby('Key').sum()
+        existing = cache[cache['Level'] == level].set_index('Key')[['Latitude', 'Longitude', 'Count']].astype('float64')
+        existing[['Latitude', 'Longitude']] = existing[['Latitude', 'Longitude']].mul(existing['Count'], axis=0)
+        sums = existing.add(sums, fill_value=0)
+        sums[['Latitude', 'Longitude']] = sums[['Latitude', 'Longitude']].div(sums['Count'], axis=0)
+        levels.append(sums.reset_index().assign(Level=level))
+
+    if not (cache['Level'] == 'municipality').any():
+        import featureEngineering
+        municipalities = featureEngineering.get_cityCoordinates(region)
+        levels.append(pd.DataFrame({'Level': 'municipality', 'Key': make_keys(municipalities.rename(
+            columns={'City': 'EstateAddress_City'}), 'municipality'), 'Latitude': municipalities['Latitude'],
+            'Longitude': municipalities['Longitude'], 'Count': 0}).drop_duplicates(subset='Key'))
+    print(gf.dayTime() + ': ' + str(len(new)) + ' new exposes with coordinates added to the geocoding-cache')
+
+    return pd.concat(levels, ignore_index=True)[cacheColumns]
+
+def load_index(cat, region=gf.defaultRegion):
+    """Returns the geocoding-index of given cat and region: dictionary with a dictionary per lookup-level
+    from key to tuple (Latitude, Longitude), or None if the geocoding-cache does not exist yet"""
+
+    if not os.path.exists(get_cacheFilename(cat, region) + '.csv'):
+        print('No geocoding-cache ' + get_cacheFilename(cat, region) + '.csv, missing coordinates are not imputed')
+        return None
+    cache = load_cache(cat, region)
+    return {level: dict(zip(cache.loc[cache['Level'] == level, 'Key'],
+                            zip(cache.loc[cache['Level'] == level, 'Latitude'],
+                                cache.loc[cache['Level'] == level, 'Longitude'])))
+            for level in lookupLevels}
+
+@gf.instrumented
+def impute_coordinates(df, index):
+    """Imputes the missing coordinates of given df by looking up the keys of the rows without coordinates
+    in given geocoding-index (see load_index()), level by level in order of lookupLevels.
+    The level of the imputed coordinates is saved in column levelColumn. Rows which are not found keep their
+    missing coordinates (and are dropped by the cleaning). Without index df is returned unchanged."""
+
+    if index is None:
+        return df
+    df[levelColumn] = None
+    missing = df.index[df[latitudeColumn].isna() | df[longitudeColumn].isna()]
+    for level in lookupLevels:
+        coordinates = make_keys(df.loc[missing], level).map(index[level]).dropna()
+        df.loc[coordinates.index, latitudeColumn] = [latitude for latitude, longitude in coordinates]
+        df.loc[coordinates.index, longitudeColumn] = [longitude for latitude, longitude in coordinates]
+        df.loc[coordinates.index, levelColumn] = level
+        missing = missing.difference(coordinates.index)
+    print(gf.dayTime() + ': Coordinates imputed for ' + str(df[levelColumn].notna().sum()) + ' rows, not found for '
+          + str(len(missing)) + ' rows')
+
+    return df
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 2: Define the order of running the above functions.
+
+
+@gf.profilable
+def run(cats=['_buy', '_rent'], region=gf.defaultRegion):
+    """
+    Runs the above functions in defined order.
+    The optional parameter cats defines the scraped files whose exposes are added to the geocoding-cache ('_buy' and/or '_rent').
+    The optional parameter region defines the region (see generalFunctions.regions) of the scraped files and of the cache.
+    The optional parameter profile ('cprofile', 'sampling' or 'allocations') profiles the run (see generalFunctions.profiled).
+    """
+
+    for cat in cats:
+        df = gf.load_data(filename = gf.get_regionFolder(region) + 'scraped' + cat, optimiseDtypes=False,
+                          columns = geocodingColumns)
+        cache = update_cache(load_cache(cat, region), df, region)
+        gf.save_data(cache, filename = get_cacheFilename(cat, region))
+
+
+# Function run() shall be executed if module is executed directly via console
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only historical store of the scraped exposes created by 'scraping.py', so the price history
+of the listings is kept although every scraping-run overwrites scraped_buy.csv, scraped_rent.csv.
+
+The store is saved in folder history/<region>/<buy|rent>/ and partitioned by crawl date
+(date of column 'ProtocolDatetimeRequestExposeUrl'): every snapshot appends its rows to the
+daily partitions day_<YYYY-MM-DD>.csv, which are merged by compact() to monthly partitions
+month_<YYYY-MM>.csv. Only the columns of historyColumns are stored, the values are kept as scraped.
+Besides the partitions the folder contains:
+* index.csv: pairs of OnlineId and partition containing rows of that listing, so the price trajectory
+  of a listing is queried by reading only its partitions (get_priceTrajectory())
+* manifest.json: hashes of the appended snapshots (a snapshot is appended only once) and
+  number of rows and first/last crawl date of every partition, so queries of a period only
+  read the partitions of that period (get_monthlyMedianPricePerArea())
+
+@author: Michael Volk
+"""
+
+import generalFunctions as gf
+import json
+import os
+import pandas as pd
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 1: Define functions for the historical store
+
+
+historyFolder = 'history'
+# Columns of the scraped exposes kept in the store
+historyColumns = ['OnlineId', 'ProtocolDatetimeRequestExposeUrl', 'CreateDate', 'ProtocolExposeUrl',
+                  'HardFacts_PRICE_NumberValue',
+                  'Price_DataTable_PRICE_RENT_COLD_NumberValue', 'Price_DataTable_PRICE_RENT_WARM_NumberValue',
+                  'HardFacts_AREA_LIVING_NumberValue', 'HardFacts_ROOMS_NumberValue',
+                  'equipmentArea_CONSTRUCTIONYEAR', 'EstateAddress_City', 'EstateAddress_District',
+                  'EstateAddress_ZipCode', 'EstateMapData_LocationCoordinates_Latitude',
+                  'EstateMapData_LocationCoordinates_Longitude']
+# Price-columns of the price-trends (buy-price and rent-cold-price like the target-variables of the models)
+priceColumns = {'_buy': 'HardFacts_PRICE_NumberValue', '_rent': 'Price_DataTable_PRICE_RENT_COLD_NumberValue'}
+areaColumn = 'HardFacts_AREA_LIVING_NumberValue'
+crawlColumn = 'ProtocolDatetimeRequestExposeUrl'
+
+
+def get_historyFolder(cat, region=gf.defaultRegion):
+    """Returns the folder of the historical store for given cat ('_buy' or '_rent') and region"""
+    return os.path.join(historyFolder, region, cat[1:])
+
+def load_manifest(folder):
+    """Returns the manifest (appended snapshots and partitions) of the store in given folder"""
+    filename = os.path.join(folder, 'manifest.json')
+    if not os.path.exists(filename):
+        return {'snapshots': [], 'partitions': {}}
+    with open(filename) as f:
+        return json.load(f)
+
+def save_manifest(folder, manifest):
+    """Saves given manifest of the store in given folder (replaced atomically)"""
+    filename = os.path.join(folder, 'manifest.json')
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(filename + '.tmp', filename)
+
+def load_index(folder):
+    """Returns the index (pairs of OnlineId and Partition) of the store in given folder"""
+    filename = os.path.join(folder, 'index.csv')
+    if not os.path.exists(filename):
+        return pd.DataFrame(columns=['OnlineId', 'Partition'])
+    return pd.read_csv(filename, dtype=str)
+
+def append_rows(df, filename):
+    """Appends given dataframe to given csv-file (with header if the file is new)"""
+    newFile = not os.path.exists(filename)
+    df.to_csv(filename, mode='a', header=newFile, index=False)
+
+@gf.instrumented
+def append_snapshot(cat, region=gf.defaultRegion, filename=None):
+    """Appends the scraped exposes of given cat and region (default: file scraped<cat>.csv of the region,
+    see generalFunctions.get_regionFolder()) to the daily partitions of the store and updates index and manifest.
+    A snapshot which was already appended (same content-hash) is skipped.
+    Returns the number of appended rows."""
+
+    filename = filename if filename is not None else gf.get_regionFolder(region) + 'scraped' + cat + '.csv'
+    folder = get_historyFolder(cat, region)
+    os.makedirs(folder, exist_ok=True)
+    manifest = load_manifest(folder)
+    snapshotHash = gf.hash_file(filename)
+    if snapshotHash in manifest['snapshots']:
+        print(gf.dayTime() + ': Snapshot ' + filename + ' already in historical store ' + folder)
+        return 0
+
+    # Read the values as text, so they are stored exactly as scraped
+    df = pd.read_csv(filename, usecols=lambda col: col in historyColumns, dtype=str)
+    df = df[[col for col in historyColumns if col in df.columns]].dropna(subset=['OnlineId', crawlColumn])
+    crawlDates = df[crawlColumn].str[:10]
+
+    index = []
+    for crawlDate, rows in df.groupby(crawlDates, sort=True):
+        partition = 'day_' + crawlDate + '.csv'
+        append_rows(rows, os.path.join(folder, partition))
+        partitionInfo = manifest['partitions'].setdefault(partition, {'rows': 0, 'from': crawlDate, 'until': crawlDate})
+        partitionInfo['rows'] += len(rows)
+        index.append(pd.DataFrame({'OnlineId': rows['OnlineId'].unique(), 'Partition': partition}))
+    # The index is created even for a snapshot without rows, as it is an output of the stage (see executer.py)
+    append_rows(pd.concat(index, ignore_index=True) if index else pd.DataFrame(columns=['OnlineId', 'Partition']),
+                os.path.join(folder, 'index.csv'))
+
+    # The manifest is saved last, so an interrupted append is repeated by the next run
+    # (rows appended twice are dropped by the queries, which keep one row per listing and crawl-time)
+    manifest['snapshots'].append(snapshotHash)
+    save_manifest(folder, manifest)
+    print(gf.dayTime() + ': ' + str(len(df)) + ' rows of ' + filename + ' appended to historical store ' + folder)
+
+    return len(df)
+
+@gf.instrumented
+def compact(cat, region=gf.defaultRegion, untilMonth=None):
+    """Merges the daily partitions of every month before 'untilMonth' ('YYYY-MM', default: month of the latest
+    daily partition, which is still appended to) of the store of given cat and region to one monthly partition.
+    Index and manifest are updated, afterwards the merged daily partitions are deleted.
+    Returns the list of the written monthly partitions."""
+
+    folder = get_historyFolder(cat, region)
+    manifest = load_manifest(folder)
+    dailyPartitions = sorted(partition for partition in manifest['partitions'] if partition.startswith('day_'))
+    if not dailyPartitions:
+        return []
+    untilMonth = untilMonth if untilMonth is not None else dailyPartitions[-1][4:11]
+    months = {}
+    for partition in dailyPartitions:
+        if partition[4:11] < untilMonth:
+            months.setdefault(partition[4:11], []).append(partition)
+
+    renamedPartitions = {}
+    for month, partitions in months.items():
+        monthPartition = 'month_' + month + '.csv'
+        filenames = [os.path.join(folder, partition) for partition in [monthPartition] + partitions
+                     if os.path.exists(os.path.join(folder, partition))]
+        df = pd.concat([pd.read_csv(filename, dtype=str) for filename in filenames], ignore_index=True)
+        df = df.sort_values(crawlColumn, kind='mergesort')
+        df.to_csv(os.path.join(folder, monthPartition + '.tmp'), index=False)
+        os.replace(os.path.join(folder, monthPartition + '.tmp'), os.path.join(folder, monthPartition))
+
+        infos = [manifest['partitions'][partition] for partition in [monthPartition] + partitions
+                 if partition in manifest['partitions']]
+        manifest['partitions'][monthPartition] = {'rows': len(df),
+                                                  'from': min(info['from'] for info in infos),
+                                                  'until': max(info['until'] for info in infos)}
+        renamedPartitions.update({partition: monthPartition for partition in partitions})
+        print(gf.dayTime() + ': ' + str(len(partitions)) + ' daily partitions merged to ' + monthPartition)
+
+    if renamedPartitions:
+        index = load_index(folder)
+        index['Partition'] = index['Partition'].replace(renamedPartitions)
+        index.drop_duplicates().to_csv(os.path.join(folder, 'index.csv.tmp'), index=False)
+        os.replace(os.path.join(folder, 'index.csv.tmp'), os.path.join(folder, 'index.csv'))
+        for partition in renamedPartitions:
+            del manifest['partitions'][partition]
+        save_manifest(folder, manifest)
+        for partition in renamedPartitions:
+            os.remove(os.path.join(folder, partition))
+
+    return sorted(set(renamedPartitions.values()))
+
+def load_partitions(folder, partitions, columns=None):
+    """Returns dataframe with the rows of given partitions of the store in given folder
+    (only given columns, default all) with parsed numerical and date columns"""
+
+    textColumns = ['OnlineId', 'ProtocolExposeUrl', 'EstateAddress_City', 'EstateAddress_District',
+                   'EstateAddress_ZipCode']
+    usecols = (lambda col: col in columns) if columns is not None else None
+    dfs = [pd.read_csv(os.path.join(folder, partition), usecols=usecols, dtype={col: str for col in textColumns})
+           for partition in partitions]
+    if not dfs:
+        return pd.DataFrame(columns=columns if columns is not None else historyColumns)
+    df = pd.concat(dfs, ignore_index=True)
+    for col in [crawlColumn, 'CreateDate']:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+
+    return df
+
+def get_priceTrajectory(onlineId, cat, region=gf.defaultRegion):
+    """Returns dataframe with the crawled prices (and price per area) of the listing with given OnlineId
+    in order of crawling. Only the partitions containing the listing (see index.csv) are read."""
+
+    folder = get_historyFolder(cat, region)
+    index = load_index(folder)
+    partitions = sorted(index.loc[index['OnlineId'] == str(onlineId), 'Partition'].unique())
+    df = load_partitions(folder, partitions, columns=['OnlineId', crawlColumn, priceColumns[cat], areaColumn])
+    df = df[df['OnlineId'] == str(onlineId)].drop_duplicates(subset=crawlColumn).sort_values(crawlColumn)
+    df['PricePerArea'] = df[priceColumns[cat]] / df[areaColumn]
+
+    return df.reset_index(drop=True)
+
+def get_monthlyMedianPricePerArea(cat, region=gf.defaultRegion, fromMonth=None, untilMonth=None, groupBy=None):
+    """Returns dataframe with the median price per area (and number of listings) per crawl-month
+    of given cat and region, optionally per given column (e.g. 'EstateAddress_City').
+    Every listing is counted once per month with its last crawled price.
+    Only the partitions overlapping the months 'fromMonth' until 'untilMonth' ('YYYY-MM') and only
+    the needed columns are read."""
+
+    folder = get_historyFolder(cat, region)
+    manifest = load_manifest(folder)
+    partitions = sorted(partition for partition, info in manifest['partitions'].items()
+                        if (fromMonth is None or info['until'][:7] >= fromMonth)
+                        and (untilMonth is None or info['from'][:7] <= untilMonth))
+    groupColumns = ['Month'] + ([groupBy] if groupBy is not None else [])
+    df = load_partitions(folder, partitions, columns=['OnlineId', crawlColumn, priceColumns[cat], areaColumn]
+                                                     + ([groupBy] if groupBy is not None else []))
+    df['Month'] = df[crawlColumn].dt.strftime('%Y-%m')
+    if fromMonth is not None:
+        df = df[df['Month'] >= fromMonth]
+    if untilMonth is not None:
+        df = df[df['Month'] <= untilMonth]
+    df = df.sort_values(crawlColumn, kind='mergesort').drop_duplicates(subset=['OnlineId', 'Month'], keep='last')
+    df['PricePerArea'] = df[priceColumns[cat]] / df[areaColumn]
+
+    return (df.groupby(groupColumns)
+              .agg(Listings=('OnlineId', 'size'), MedianPricePerArea=('PricePerArea', 'median'))
+              .reset_index())
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 2: Define the order of running the above functions.
+
+
+@gf.profilable
+def run(cats=['_buy', '_rent'], region=gf.defaultRegion):
+    """
+    Runs the above functions in defined order.
+    The optional parameter cats defines the scraped exposes to be appended to the store ('_buy' and/or '_rent').
+    The optional parameter region defines the region (see generalFunctions.regions) of the scraped exposes.
+    The optional parameter profile ('cprofile', 'sampling' or 'allocations') profiles the run (see generalFunctions.profiled).
+    """
+
+    for cat in cats:
+        append_snapshot(cat, region)
+        compact(cat, region)
+
+
+# Function run() shall be executed if module is executed directly via console
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Load-test for the local prediction-server 'predictionServer.py'.
+For every given concurrency level the given number of requests is sent by that many
+concurrent clients (each with its own keep-alive connection) to the server.
+Reports requests per second and client-side p50-/p99-latency per concurrency level
+and prints the server-side counters from endpoint /stats at the end.
+
+Start the server first with 'python predictionServer.py', then run 'python loadTesting.py'.
+
+@author: Michael Volk
+"""
+
+import asyncio
+import json
+import time
+import numpy as np
+import pandas as pd
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 1: Define functions for the load-test
+
+
+def make_configurations(n, seed=0):
+    """Returns n random apartment-configurations within North Rhine-Westphalia"""
+
+    rng = np.random.default_rng(seed)
+    return [{'Area': float(rng.integers(25, 180)),
+             'Rooms': float(rng.integers(1, 7)),
+             'ConstructionYear': float(rng.integers(1900, 2021)),
+             'Latitude': float(rng.uniform(50.4, 52.4)),
+             'Longitude': float(rng.uniform(6.0, 9.4)),
+             'EQ_OUT_balcony': int(rng.integers(0, 2))} for _ in range(n)]
+
+async def send_request(reader, writer, host, method, target, payload=None):
+    """Sends one HTTP/1.1-request over the given keep-alive connection and returns (status, payload)"""
+
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    writer.write(('%s %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                  % (method, target, host, len(body))).encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, value = line.decode('latin-1').split(':', 1)
+        headers[key.strip().lower()] = value.strip()
+    data = await reader.readexactly(int(headers.get('content-length', 0)))
+
+    return status, json.loads(data)
+
+async def client(host, port, cat, configurations, latencies):
+    """Sends the given configurations one after another over one connection
+    and appends the latency of each request to 'latencies'"""
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for configuration in configurations:
+            startTime = time.perf_counter()
+            status, _ = await send_request(reader, writer, host, 'POST', '/predict/' + cat, configuration)
+            latencies.append(time.perf_counter() - startTime)
+            if status != 200:
+                raise RuntimeError('Server answered with status %d' % status)
+    finally:
+        writer.close()
+
+async def measure_concurrencyLevel(host, port, cat, concurrency, configurations):
+    """Sends all given configurations with 'concurrency' concurrent clients and returns the measures"""
+
+    latencies = []
+    startTime = time.perf_counter()
+    await asyncio.gather(*[client(host, port, cat, configurations[i::concurrency], latencies)
+                           for i in range(concurrency)])
+    seconds = time.perf_counter() - startTime
+    latencies = np.array(latencies) * 1000
+
+    return {'concurrency': concurrency,
+            'requests': len(latencies),
+            'seconds': round(seconds, 3),
+            'requests_per_second': round(len(latencies) / seconds, 2),
+            'latency_p50_ms': round(float(np.percentile(latencies, 50)), 3),
+            'latency_p99_ms': round(float(np.percentile(latencies, 99)), 3)}
+
+async def get_serverStats(host, port):
+    """Returns the counters of endpoint /stats of the server"""
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        _, stats = await send_request(reader, writer, host, 'GET', '/stats')
+    finally:
+        writer.close()
+
+    return stats
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 2: Define the order of running the above functions.
+
+
+def run(host='127.0.0.1', port=8050, cat='buy', concurrencyLevels=(1, 4, 16, 64), requestsPerLevel=2000):
+    """
+    Runs the load-test against a running prediction-server for every given concurrency level
+    and returns the results as dataframe (one row per concurrency level).
+    """
+
+    configurations = make_configurations(requestsPerLevel)
+    results = []
+    for concurrency in concurrencyLevels:
+        results.append(asyncio.run(measure_concurrencyLevel(host, port, cat, concurrency, configurations)))
+        print('Concurrency %4d: %10.2f requests/s, p50 %8.3f ms, p99 %8.3f ms' % (
+            concurrency, results[-1]['requests_per_second'],
+            results[-1]['latency_p50_ms'], results[-1]['latency_p99_ms']))
+    print('Server-side counters: ' + json.dumps(asyncio.run(get_serverStats(host, port))))
+
+    return pd.DataFrame(results)
+
+
+# Function run() shall be executed if module is executed directly via console
+if __name__ == "__main__":
+    run()
@@ -5,6 +5,18 @@ than choosing the best one, and save it
 to file for using as prediction-model in flask-app 'app.py' for end-user.
 HINT: Path of web-application folder is defined for my machine and needs to be adjusted for other machines!
 
+With run(incremental=True) (e.g. 'python executer.py --incremental') the saved best model is only updated with the rows
+it was not trained on (see retrain_incrementally()): Random Forests get additional trees (warm_start), K-Nearest Neighbors
+are fitted again with the new rows appended and linear regressions update their sufficient statistics (X'X, X'y).
+All models are trained and compared again if the model drifted on the new rows.
+
+With run(spatialCV='city') (e.g. 'python executer.py --spatialCV city') all models are cross-validated on the same folds
+of whole municipalities ('grid': grid-cells of spatialCellSize degrees), see get_spatialFolds(). Neighbouring apartments
+are highly correlated, so with random folds the models on Latitude/Longitude look better than they are for new places.
+
+The training-matrices of the grid-searches are saved once per column-set as temporary memory-mapped files, which the
+worker-processes receive by reference (see make_sharedMatrices()); the best models are refitted on in-memory copies.
+
 Thanks to Ken Jee for inspiration to this module:
 https://github.com/PlayingNumbers/ds_salary_proj/blob/master/model_building.py#L42
 
@@ -12,18 +24,26 @@ https://github.com/PlayingNumbers/ds_salary_proj/blob/master/model_building.py#L
 """
 
 import generalFunctions as gf
+import evaluation
+import geoNeighbors
 import pandas as pd 
 import numpy as np 
+from sklearn.base import clone
 from sklearn.linear_model import LinearRegression
+from sklearn.linear_model import Ridge
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.neighbors import KNeighborsRegressor
-from sklearn.metrics import explained_variance_score, mean_absolute_error, median_absolute_error
 from sklearn.model_selection import GridSearchCV
+from sklearn.model_selection import GroupKFold
 from sklearn.preprocessing import FunctionTransformer
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import make_pipeline
 from sklearn.preprocessing import StandardScaler
+import json
+import os
 import pickle
+import shutil
+import tempfile
 
 
 #----------------------------------------------------------------------------------------------------
@@ -31,33 +51,317 @@ import pickle
 
 # Section 1: Define functions for the modeling process
 
-def gridSearch_fitAndPredict(X_train, y_train, X_test, y_test, columns, pipe,
-                             param_grid={}, scoringMethod='neg_median_absolute_error', cvFolds=3):
+def make_sharedMatrices(X_train, y_train):
+    """Returns dictionary for the training-matrices shared with the worker-processes of the grid-searches
+    (see get_sharedMatrix()) with a new temporary folder for their files and the memory-mapped y_train"""
+
+    folder = tempfile.mkdtemp(prefix='sharedMatrices_')
+    np.save(os.path.join(folder, 'y_train.npy'), np.ascontiguousarray(y_train, dtype='float64'))
+
+    return {'folder': folder,
+            'X_train': X_train,
+            'y_train': np.load(os.path.join(folder, 'y_train.npy'), mmap_mode='r'),
+            'matrices': {}}
+
+def get_sharedMatrix(sharedMatrices, columns, dtype='float64'):
+    """Returns the given columns of the X_train of given sharedMatrices (see make_sharedMatrices()) as dataframe
+    backed by a read-only memory-mapped contiguous array of given dtype. The array is saved only once per column-set
+    and dtype and then used by every model with these columns: joblib passes memory-mapped arrays to the
+    worker-processes of GridSearchCV by reference (filename) instead of pickling a copy for every grid-search."""
+
+    key = (tuple(columns), dtype)
+    if key not in sharedMatrices['matrices']:
+        filename = os.path.join(sharedMatrices['folder'], 'X_train_' + str(len(sharedMatrices['matrices'])) + '.npy')
+        np.save(filename, np.ascontiguousarray(sharedMatrices['X_train'][columns].to_numpy(dtype=dtype)))
+        sharedMatrices['matrices'][key] = pd.DataFrame(np.load(filename, mmap_mode='r'), columns=columns, copy=False)
+
+    return sharedMatrices['matrices'][key]
+
+def delete_sharedMatrices(sharedMatrices):
+    """Releases the memory-mapped arrays of given sharedMatrices (see make_sharedMatrices()) and deletes their files.
+    A failed deletion (e.g. on Windows while a file is still mapped) is printed with the folder to delete manually."""
+    sharedMatrices['matrices'].clear()
+    sharedMatrices['y_train'] = None
+    try:
+        shutil.rmtree(sharedMatrices['folder'])
+    except OSError as e:
+        print(gf.dayTime() + ': Shared training-matrices in ' + sharedMatrices['folder'] + ' could not be deleted: ' + str(e))
+
+def load_textMatrices(regionFolders, cat):
+    """Returns the sparse matrix of the hashed text-features of given cat of all given region-folders
+    (see featureEngineering.engineer_textFeatures()) and the Index of the Urls of its rows"""
+
+    import featureEngineering
+    import scipy.sparse
+    matrices, urls = zip(*[featureEngineering.load_textFeatures(folder + 'textFeatures' + cat) for folder in regionFolders])
+
+    return scipy.sparse.vstack(matrices, format='csr'), pd.Index(np.concatenate(urls))
+
+def get_textRows(textMatrix, textUrls, X):
+    """Returns the rows of given text-matrix (see load_textMatrices()) in the order of the Urls of given X
+    (rows of Urls without texts are empty, of duplicated Urls the last row is used)"""
+
+    import scipy.sparse
+    # A listing can occur several times (e.g. in several scrapes or pooled regions), its last texts are used
+    unique = ~textUrls.duplicated(keep='last')
+    textMatrix, textUrls = textMatrix[np.flatnonzero(unique)], textUrls[unique]
+    positions = textUrls.get_indexer(X['Url'])
+    # Position -1 (Url without texts) selects the appended empty row
+    textMatrix = scipy.sparse.vstack([textMatrix, scipy.sparse.csr_matrix((1, textMatrix.shape[1]))], format='csr')
+
+    return textMatrix[positions]
+
+@gf.instrumented
+def gridSearch_fitAndPredict(X_train, y_train, X_test, columns, pipe,
+                             param_grid={}, scoringMethod='neg_median_absolute_error', cvFolds=3, n_jobs=-1,
+                             sharedMatrices=None, textMatrices=None):
     """Fits given 'pipe' to given dataframes 'X_train' and 'y_train' based on given 'columns' 
     via grid-search over given parameters 'param_grid'.
-    Uses Cross-Validation-method with 'scoringMethod' and 'cvFolds'.
-    Than predict 'y_test_predict' for given 'X_test' and calculate scoring-measures regarding the error to given 'y_test'.
-    Returns dictionary with fitted pipe and scoring-measures."""
+    Uses Cross-Validation-method with 'scoringMethod' and 'cvFolds' (number of random folds or list of
+    precomputed folds, see get_spatialFolds()) and 'n_jobs' parallel processes.
+    With given 'sharedMatrices' (see make_sharedMatrices()) of X_train and y_train the pipe is fitted on the
+    memory-mapped training-matrix of the columns (float32 for a Random Forest without preprocessing,
+    which converts its input to float32 anyway, else float64) and the best pipe is refitted on an in-memory copy.
+    With given 'textMatrices' (dictionary with the sparse text-rows of X_train ('train') and X_test ('test'),
+    see get_textRows()) the hashed text-features are appended to the columns and the pipe is fitted on the
+    sparse matrix (the pipe has to accept sparse input).
+    Than predict 'y_test_predict' for given 'X_test' (the test-measures of all models are calculated
+    together by evaluation.evaluate_predictions()).
+    Returns dictionary with fitted pipe, cross-validation-score and test-predictions."""
     
-    gs = GridSearchCV(pipe, param_grid, scoring=scoringMethod, cv=cvFolds, n_jobs=-1)
-    gs.fit(X_train[columns], y_train)
+    X_predict = X_test[columns]
+    if textMatrices is not None:
+        import scipy.sparse
+        X_fit = scipy.sparse.hstack([X_train[columns].to_numpy(dtype='float64'), textMatrices['train']], format='csr')
+        X_predict = scipy.sparse.hstack([X_predict.to_numpy(dtype='float64'), textMatrices['test']], format='csr')
+        y_fit = y_train
+    elif sharedMatrices is None:
+        X_fit, y_fit = X_train[columns], y_train
+    else:
+        randomForestOnly = len(pipe.steps) == 1 and isinstance(pipe.steps[0][1], RandomForestRegressor)
+        X_fit = get_sharedMatrix(sharedMatrices, columns, 'float32' if randomForestOnly else 'float64')
+        y_fit = sharedMatrices['y_train']
+    gs = GridSearchCV(pipe, param_grid, scoring=scoringMethod, cv=cvFolds, n_jobs=n_jobs, refit=sharedMatrices is None)
+    gs.fit(X_fit, y_fit)
     crossValScore_mean = -gs.best_score_
-    y_test_predict = gs.best_estimator_.predict(X_test[columns])
-    test_errors = (y_test_predict - y_test).abs()
-    test_errors_notAbsolute = (y_test_predict - y_test)
-    test_mean_absolute_error = mean_absolute_error(y_test, y_test_predict)
-    test_median_absolute_error = median_absolute_error(y_test, y_test_predict)
-    test_explained_variance_score = explained_variance_score(y_test, y_test_predict)
+    if sharedMatrices is None:
+        bestPipe = gs.best_estimator_
+    else:
+        # Refit the best parameters on in-memory copies of the memory-mapped matrices, so the fitted model
+        # (e.g. the rows of K-Nearest Neighbors) does not reference the files deleted after the model-comparison
+        bestPipe = clone(pipe).set_params(**gs.best_params_).fit(
+            pd.DataFrame(np.array(X_fit), columns=columns), np.array(y_fit))
+    y_test_predict = bestPipe.predict(X_predict)
     
-    return {'pipe_with_model': gs.best_estimator_,
+    return {'pipe_with_model': bestPipe,
             'columns_used': columns,
+            'textFeatures': textMatrices is not None,
             'crossValScore_mean_median_absolute_error': crossValScore_mean,
-            'test_median_absolute_error': test_median_absolute_error,
-            'test_mean_absolute_error': test_mean_absolute_error,
-            'test_explained_variance_score': test_explained_variance_score,
-            'y_test_predict': y_test_predict,
-            'test_errors': test_errors,
-            'test_errors_notAbsolute': test_errors_notAbsolute}
+            'y_test_predict': y_test_predict}
+
+def get_spatialFolds(X_train, cvFolds=3, spatialCV='city', spatialCellSize=0.05, filename=None):
+    """Returns list of 'cvFolds' cross-validation-folds (row-positions of train- and validation-rows) of given X_train,
+    in which all listings of a municipality (spatialCV='city', column City created by featureEngineering.replace_citynames())
+    or of a grid-cell of 'spatialCellSize' degrees of Latitude/Longitude (spatialCV='grid') are in the same fold,
+    so neighbouring listings do not validate each other and the cross-validation-score reflects the accuracy for new places.
+    The folds are computed once and the list is passed as 'cvFolds' to the grid-searches of all models.
+    With given filename the fold of every train-row (columns Url, Group, Fold) is saved to csv-file with the settings
+    in a json-file of the same name, and the saved folds are reused if the settings and the Urls are unchanged,
+    so the fold-assignment is reproducible across runs.
+    With less than 2 groups (e.g. a region with one municipality) 'cvFolds' random folds are returned instead."""
+
+    if spatialCV == 'city':
+        groups = X_train['City'].astype(str).to_numpy()
+    else:
+        groups = pd.DataFrame({'LatitudeCell': np.floor(X_train['Latitude'].to_numpy() / spatialCellSize),
+                               'LongitudeCell': np.floor(X_train['Longitude'].to_numpy() / spatialCellSize)}
+                              ).groupby(['LatitudeCell', 'LongitudeCell']).ngroup().to_numpy()
+    nGroups = len(np.unique(groups))
+    if nGroups < 2:
+        print('Spatial cross-validation for ' + str(len(X_train)) + ' rows not possible with ' + str(nGroups)
+              + ' group (' + spatialCV + '), ' + str(cvFolds) + ' random folds are used')
+        return cvFolds
+    nFolds = min(cvFolds, nGroups)
+    settings = {'spatialCV': spatialCV, 'spatialCellSize': spatialCellSize, 'cvFolds': nFolds}
+
+    # Reuse the saved fold-assignment if the settings and the train-rows are unchanged
+    assignment = None
+    if filename is not None and os.path.exists(filename + '.json') and os.path.exists(filename + '.csv'):
+        with open(filename + '.json') as f:
+            savedSettings = json.load(f)
+        saved = pd.read_csv(filename + '.csv', dtype={'Url': str})
+        urls = X_train['Url'].astype(str)
+        if savedSettings == settings and saved['Url'].tolist() == urls.tolist():
+            assignment = saved['Fold'].to_numpy()
+        elif savedSettings == settings and len(saved) == len(urls) and set(saved['Url']) == set(urls):
+            # Train-rows in another order: assigned by their Url (the last fold of a duplicated Url)
+            assignment = urls.map(saved.drop_duplicates('Url', keep='last').set_index('Url')['Fold']).to_numpy()
+        if assignment is not None:
+            print('Spatial cross-validation folds loaded from file: ' + filename + '.csv')
+    if assignment is None:
+        assignment = np.empty(len(X_train), dtype='int64')
+        for fold, (trainRows, validationRows) in enumerate(GroupKFold(n_splits=nFolds).split(X_train, groups=groups)):
+            assignment[validationRows] = fold
+        if filename is not None:
+            gf.save_data(pd.DataFrame({'Url': X_train['Url'].to_numpy(), 'Group': groups, 'Fold': assignment}), filename)
+            with open(filename + '.json', 'w') as f:
+                json.dump(settings, f, indent=1)
+    folds = [(np.flatnonzero(assignment != fold), np.flatnonzero(assignment == fold)) for fold in range(nFolds)]
+    print('Spatial cross-validation for ' + str(len(X_train)) + ' rows: ' + str(nGroups)
+          + ' groups (' + spatialCV + ') in ' + str(nFolds) + ' folds')
+
+    return folds
+
+def transform_forEstimator(pipe, X):
+    """Returns given X transformed by the fitted preprocessing-steps of given pipe (all steps but the estimator)"""
+    for name, step in pipe.steps[:-1]:
+        X = step.transform(X)
+    return X
+
+def get_sufficientStatistics(pipe, X, y):
+    """Returns the sufficient statistics of a linear regression (X'X and X'y of the columns transformed
+    by the preprocessing-steps of given pipe, with a column of ones for the intercept) for given X and y"""
+    X = np.asarray(transform_forEstimator(pipe, X), dtype='float64')
+    X = np.column_stack([X, np.ones(len(X))])
+    return {'XtX': X.T @ X, 'Xty': X.T @ np.asarray(y, dtype='float64')}
+
+def get_fittedRows(pipe, X, y):
+    """Returns the rows a K-Nearest Neighbors model is fitted on (X transformed by the preprocessing-steps
+    of given pipe and y), so it can be fitted again with new rows appended"""
+    return {'X': np.asarray(transform_forEstimator(pipe, X), dtype='float64'), 'y': np.asarray(y, dtype='float64')}
+
+def get_nNewTrees(estimator, nNewRows, nTrainedRows):
+    """Returns the number of trees added to given Random Forest for given number of new rows
+    (proportional to their share of all rows the forest was trained on)"""
+    return max(1, round(estimator.n_estimators * nNewRows / nTrainedRows))
+
+def update_model(modelConfig, X_new, y_new):
+    """Updates the fitted model of given modelConfig with given new training-rows without refitting it on all rows:
+    * Random Forest: adds trees fitted on the new rows (warm_start), their number proportional to the share of the new rows
+    * K-Nearest Neighbors: is fitted again on its fitted rows (modelConfig['fittedRows']) with the new rows appended
+      (the geo-aware model on its coordinates and targets)
+    * Linear regression: adds the new rows to the sufficient statistics and solves the normal equations again
+    The preprocessing-steps of the pipe (log-transformer, scaler) are not refitted."""
+
+    pipe = modelConfig['model']
+    estimator = pipe.steps[-1][1]
+    X_new = transform_forEstimator(pipe, X_new[modelConfig['columns_used']])
+    y_new = np.asarray(y_new, dtype='float64')
+
+    if isinstance(estimator, RandomForestRegressor):
+        nNewTrees = get_nNewTrees(estimator, len(y_new), len(modelConfig['trainedUrls']))
+        estimator.set_params(warm_start=True, n_estimators=estimator.n_estimators + nNewTrees)
+        estimator.fit(X_new, y_new)
+        estimator.set_params(warm_start=False)
+    elif isinstance(estimator, KNeighborsRegressor):
+        fittedRows = modelConfig['fittedRows']
+        fittedRows['X'] = np.vstack([fittedRows['X'], np.asarray(X_new, dtype='float64')])
+        fittedRows['y'] = np.concatenate([fittedRows['y'], y_new])
+        X_fitted = fittedRows['X']
+        if hasattr(estimator, 'feature_names_in_'):
+            X_fitted = pd.DataFrame(X_fitted, columns=estimator.feature_names_in_)
+        estimator.fit(X_fitted, fittedRows['y'])
+    elif isinstance(estimator, geoNeighbors.GeoKNeighborsRegressor):
+        estimator.fit(np.vstack([estimator.coordinates_, np.asarray(X_new, dtype='float64')]),
+                      np.concatenate([estimator.targets_, y_new]))
+    elif isinstance(estimator, LinearRegression):
+        X_new = np.column_stack([np.asarray(X_new, dtype='float64'), np.ones(len(y_new))])
+        statistics = modelConfig['sufficientStatistics']
+        statistics['XtX'] = statistics['XtX'] + X_new.T @ X_new
+        statistics['Xty'] = statistics['Xty'] + X_new.T @ y_new
+        coefficients = np.linalg.lstsq(statistics['XtX'], statistics['Xty'], rcond=None)[0]
+        estimator.coef_, estimator.intercept_ = coefficients[:-1], coefficients[-1]
+    else:
+        raise TypeError('Incremental update not supported for ' + type(estimator).__name__)
+
+def calibrate_modelConfig(modelConfig, X_calibration, y_calibration):
+    """Sets test-errors, reference-error for the drift-check and interval-table of given modelConfig
+    on basis of its predictions for given calibration-rows (not used for fitting the model)"""
+    y_predict = modelConfig['model'].predict(X_calibration[modelConfig['columns_used']])
+    modelConfig['test_errors_notAbsolute'] = pd.Series(y_predict - y_calibration.to_numpy(),
+                                                       index=y_calibration.index, name=y_calibration.name)
+    modelConfig['test_errors'] = modelConfig['test_errors_notAbsolute'].abs()
+    modelConfig['test_median_absolute_error'] = modelConfig['test_errors'].median()
+    modelConfig['intervalTable'] = evaluation.calibrate_intervalTable(y_calibration, y_predict)
+    modelConfig['calibrationUrls'] = X_calibration['Url'].tolist()
+
+def save_model(modelConfig, cat, outputFolder, region=gf.defaultRegion):
+    """Saves given modelConfig (=pickle the model with used columns, test_errors, interval-table, ...) to file
+    'model' + cat + '.p' in given outputFolder and for the default region also in web-application folder,
+    and the model with its used columns and interval-table to file 'scoringModel' + cat + '.p' (see scoring.py)"""
+
+    # HINT: Path of web-application folder is defined for my machine and needs to be adjusted for other machines!
+    paths = [outputFolder]
+    if region == gf.defaultRegion:
+        paths.append('../Buy-and-Rent-Price-Estimator-for-Apartments_Web-Application/')
+    for path in paths:
+        # Written to a temporary file first and replaced atomically, so the server never reads a half-written model
+        with open(path + 'model' + cat + '.p.tmp', 'wb') as f:
+            pickle.dump(modelConfig, f)
+        os.replace(path + 'model' + cat + '.p.tmp', path + 'model' + cat + '.p')
+        print('Model for ' + cat[1:] + ' saved to file ' + path + 'model' + cat + '.p')
+        # Lean copy for 'scoring.py' without the test-errors and Urls (pandas-objects), see scoring.load_scoringModel()
+        with open(path + 'scoringModel' + cat + '.p.tmp', 'wb') as f:
+            pickle.dump({key: modelConfig[key] for key in ['model', 'columns_used', 'intervalTable']}, f)
+        os.replace(path + 'scoringModel' + cat + '.p.tmp', path + 'scoringModel' + cat + '.p')
+
+@gf.instrumented
+def retrain_incrementally(cat, X, y, outputFolder, region=gf.defaultRegion, driftThreshold=1.2,
+                          maxTrees=400, minCalibrationRows=100):
+    """Updates the saved model for given cat with the rows of X['train' + cat] it was not trained on yet
+    (see update_model()), if the model did not drift: its median absolute error on all new rows
+    (neither trained on nor used for its calibration) must not exceed its reference-error (median absolute error on its calibration-rows) times 'driftThreshold'.
+    Afterwards the model is calibrated again on the test-rows it was not trained on and saved.
+    Returns False if the model drifted, a Random Forest would exceed 'maxTrees' trees, less than 'minCalibrationRows'
+    test-rows were not trained on (e.g. after a new random train/test-split) or the model was saved without
+    the information for updates, so that all models have to be trained again, else True."""
+
+    with open(outputFolder + 'model' + cat + '.p', 'rb') as f:
+        modelConfig = pickle.load(f)
+    if 'trainedUrls' not in modelConfig:
+        print('Model for ' + cat[1:] + ' was saved without trained Urls, incremental update not possible')
+        return False
+    estimator = modelConfig['model'].steps[-1][1]
+    if isinstance(estimator, KNeighborsRegressor) and 'fittedRows' not in modelConfig:
+        print('Model for ' + cat[1:] + ' was saved without fitted rows, incremental update not possible')
+        return False
+    trainedUrls = set(modelConfig['trainedUrls'])
+
+    # Drift-check on all new rows
+    X_unseen = pd.concat([X['train' + cat], X['test' + cat]])
+    y_unseen = pd.concat([y['train' + cat], y['test' + cat]])
+    unseen = ~X_unseen['Url'].isin(trainedUrls | set(modelConfig['calibrationUrls'])).to_numpy()
+    if not unseen.any():
+        print('No new rows for ' + cat[1:] + ', model is current')
+        return True
+    error = np.median(np.abs(modelConfig['model'].predict(X_unseen.loc[unseen, modelConfig['columns_used']])
+                             - y_unseen[unseen].to_numpy()))
+    print('Median absolute error of model for ' + cat[1:] + ' on ' + str(unseen.sum()) + ' new rows: '
+          + str(round(error, 4)) + ' (reference: ' + str(round(modelConfig['test_median_absolute_error'], 4)) + ')')
+    if error > modelConfig['test_median_absolute_error'] * driftThreshold:
+        print('Model for ' + cat[1:] + ' drifted, all models are trained again')
+        return False
+
+    # Update model with the new training-rows and calibrate it on the test-rows it was not trained on
+    newTrain = ~X['train' + cat]['Url'].isin(trainedUrls).to_numpy()
+    newTrainedUrls = X['train' + cat].loc[newTrain, 'Url'].tolist()
+    calibration = ~X['test' + cat]['Url'].isin(trainedUrls | set(newTrainedUrls)).to_numpy()
+    if calibration.sum() < minCalibrationRows:
+        print('Only ' + str(calibration.sum()) + ' test-rows for ' + cat[1:] + ' not trained on for calibrating the model, '
+              + 'all models are trained again')
+        return False
+    if (isinstance(estimator, RandomForestRegressor) and newTrain.any()
+            and estimator.n_estimators + get_nNewTrees(estimator, newTrain.sum(), len(trainedUrls)) > maxTrees):
+        print('Random Forest for ' + cat[1:] + ' would exceed ' + str(maxTrees) + ' trees, all models are trained again')
+        return False
+    if newTrain.any():
+        update_model(modelConfig, X['train' + cat][newTrain], y['train' + cat][newTrain])
+        modelConfig['trainedUrls'] = modelConfig['trainedUrls'] + newTrainedUrls
+    calibrate_modelConfig(modelConfig, X['test' + cat][calibration], y['test' + cat][calibration])
+    print('Model for ' + cat[1:] + ' updated with ' + str(newTrain.sum()) + ' new rows')
+    save_model(modelConfig, cat, outputFolder, region)
+
+    return True
 
 
 #----------------------------------------------------------------------------------------------------
@@ -66,11 +370,30 @@ def gridSearch_fitAndPredict(X_train, y_train, X_test, y_test, columns, pipe,
 # Section 2: Define the order of running the above functions.
 
 
-def run():
+@gf.profilable
+def run(cats=['_buy', '_rent'], n_jobs=-1, region=gf.defaultRegion, nSampledResiduals=0,
+        incremental=False, driftThreshold=1.2, maxTrees=400, spatialCV=None, spatialCellSize=0.05, textFeatures=False):
     """
     Runs the above functions in defined order.
     Building different prediction models for buy and rent, than choosing for each the best one,
     and save it to file for using as prediction-model in flask-app 'app.py'.
+    The optional parameter cats defines the dataframes to be modeled ('_buy' and/or '_rent').
+    The optional parameter n_jobs defines the number of parallel processes of each grid-search (-1: all CPUs).
+    The optional parameter region defines the region (see generalFunctions.regions) whose dataframes are modeled.
+    For a list of regions a pooled model is trained on the dataframes of all these regions and saved in folder regions/pooled/.
+    The optional parameter nSampledResiduals defines the number of test-rows whose residuals are saved
+    for every model to file sampledResiduals<cat>.csv (0: no file).
+    With the optional parameter spatialCV ('city' or 'grid' with grid-cells of 'spatialCellSize' degrees) all models are
+    cross-validated on the same spatial folds (see get_spatialFolds(), saved to file spatialFolds<cat>.csv)
+    instead of random folds.
+    With the optional parameter incremental=True the saved model is only updated with the new rows
+    (see retrain_incrementally()), all models are only trained again if its error on the new rows
+    exceeds its reference-error times 'driftThreshold', a Random Forest would grow beyond 'maxTrees' trees
+    or too few test-rows are left for calibrating it.
+    With the optional parameter textFeatures=True a sparse ridge-regression on columns_standard and the hashed
+    text-features (see featureEngineering.engineer_textFeatures()) is compared with the other models. It is not saved
+    as best model, because the price-estimates of the web-application and of 'scoring.py' have no description-texts.
+    The optional parameter profile ('cprofile', 'sampling' or 'allocations') profiles the run (see generalFunctions.profiled).
     """
     
     #Define standard set of columns for models
@@ -106,9 +429,6 @@ def run():
     # Define experimental set of columns (only necessary for defined experimental models, which are uncommented by default)
     neighborsBasedPriceEstimate = ['Price_estimate_nearest_forModel']
     
-    # Define dataframe-names to be loaded and used in further process
-    df_names = ['buy', 'train_buy', 'test_buy', 'rent', 'train_rent', 'test_rent']
-    
     # Define column-transformer for dataframe regarding logarithm
     def make_log_transformer(columns):
         """Returns log_transformer-object for given column-name-list"""
@@ -117,13 +437,30 @@ def run():
             remainder='passthrough', verbose_feature_names_out=False)
         return log_transformer
     
-    # Load dataframes in dictionaries
+    # Define folders of the regions to be loaded and the folder for saving the results
+    if isinstance(region, str):
+        regionFolders = [gf.get_regionFolder(region)]
+        outputFolder = gf.get_regionFolder(region)
+    else:
+        regionFolders = [gf.get_regionFolder(r) for r in region]
+        outputFolder = 'regions/pooled/'
+    
+    # Load dataset-files (of all regions) in dictionaries, train- and test-dataframes are views of the whole dataset
     X={}
     y={}
-    for df_name in df_names:
-        X[df_name] = gf.load_data(filename = 'X_' + df_name)
-        y[df_name] = gf.load_data(filename = 'y_' + df_name)
-        y[df_name] = y[df_name].squeeze()
+    for cat in cats:
+        datasets = []
+        for folder in regionFolders:
+            X_all, y_all = gf.load_dataset(filename = folder + 'dataset' + cat)
+            datasets.append((X_all, y_all, gf.get_datasetSlices(filename = folder + 'dataset' + cat)))
+        for df_name, split in zip([cat[1:], 'train' + cat, 'test' + cat], [None, 'train', 'test']):
+            parts = [(X_all, y_all) if split is None else (X_all.iloc[slices[split]], y_all.iloc[slices[split]])
+                     for X_all, y_all, slices in datasets]
+            if len(parts) == 1:
+                X[df_name], y[df_name] = parts[0]
+            else:
+                X[df_name] = pd.concat([part[0] for part in parts], ignore_index=True)
+                y[df_name] = pd.concat([part[1] for part in parts], ignore_index=True)
             
     # Transform y to log(y) (better measure for equal-weighting relative erros between predicted and real value)
     for df_name in y:
@@ -134,46 +471,76 @@ def run():
     errorMeasures = {}
     
     # Loop for fitting and predicting different models for buy and rent dataframe
-    for cat in ['_buy', '_rent']:
+    for cat in cats:
+        
+        # Update the saved model with the new rows instead of training all models again (if it did not drift)
+        if incremental and os.path.exists(outputFolder + 'model' + cat + '.p'):
+            if retrain_incrementally(cat, X, y, outputFolder, region, driftThreshold, maxTrees):
+                continue
+        
+        # Define the cross-validation-folds once for all models (3 random folds or spatial folds)
+        folds = 3 if spatialCV is None else get_spatialFolds(X['train' + cat], 3, spatialCV, spatialCellSize,
+                                                             filename = outputFolder + 'spatialFolds' + cat)
+        
+        # Save the training-matrices once as memory-mapped files shared with the worker-processes of all grid-searches
+        sharedMatrices = make_sharedMatrices(X['train' + cat], y['train' + cat])
         
         # Random Forest model based on ['Latitude', 'Longitude', 'Area']
         modelsAndMeasures['rf_LaLoAr' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = ['Latitude', 'Longitude', 'Area'],
             pipe = make_pipeline(RandomForestRegressor()),
             )
 
         # Random Forest model based on ['Latitude', 'Longitude', 'ConstructionYear']
         modelsAndMeasures['rf_LaLoYe' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = ['Latitude', 'Longitude', 'ConstructionYear'],
             pipe = make_pipeline(RandomForestRegressor()),
             )
 
         # Random Forest model based on ['Area', 'ConstructionYear']
         modelsAndMeasures['rf_ArYe' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = ['Area', 'ConstructionYear'],
             pipe = make_pipeline(RandomForestRegressor()),
             )
     
         # Random Forest model based on ['Latitude', 'Longitude', 'Area', 'ConstructionYear']
         modelsAndMeasures['rf_LaLoArYe' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = ['Latitude', 'Longitude', 'Area', 'ConstructionYear'],
             pipe = make_pipeline(RandomForestRegressor()),
             )
     
         # Random Forest model based on columns_standard
         modelsAndMeasures['rf_columns_standard' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = columns_standard,
             pipe = make_pipeline(RandomForestRegressor()),
             )
     
         # Random Forest model with scaled X_log based on columns_standard
         modelsAndMeasures['rf_columns_standard_Xlog_scaled' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = columns_standard,
             pipe = make_pipeline(make_log_transformer([col for col in columns_logTransform if col in columns_standard]),
                                  StandardScaler(),
@@ -183,7 +550,10 @@ def run():
         # Grid-Search Optimisation of so far best Random Forest-Model (measured in cross-validation score):
         # Random Forest model based on columns_standard with parameters grid-search-optimised
         modelsAndMeasures['rf_columns_standard_gsOpt' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = columns_standard,
             pipe = make_pipeline(RandomForestRegressor()),
             param_grid = {
@@ -196,7 +566,10 @@ def run():
         # # Experimental model including feature-engineered variable Price_estimate_nearest_forModel:
         # # Random Forest model with scaled X_log based on columns_standard  + Price_estimate_nearest_forModel
         # modelsAndMeasures['rf_columns_standard_and_neighborsBasedPriceEstimate_Xlog_scaled' + cat] = gridSearch_fitAndPredict(
-        #     X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+        #     X['train' + cat], y['train' + cat], X['test' + cat],
+        #     n_jobs = n_jobs,
+        #     cvFolds = folds,
+        #     sharedMatrices = sharedMatrices,
         #     columns = columns_standard + neighborsBasedPriceEstimate,
         #     pipe = make_pipeline(make_log_transformer([col for col in columns_logTransform if col in columns_standard]),
         #                          StandardScaler(),
@@ -205,21 +578,44 @@ def run():
         
         # K-Nearest Neighbors model with ['Latitude', 'Longitude']
         modelsAndMeasures['knn_LaLo' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = ['Latitude', 'Longitude'],
             pipe = make_pipeline(KNeighborsRegressor())
             )
             
+        # Geo-aware K-Nearest Neighbors model with ['Latitude', 'Longitude'] (great-circle distances, see geoNeighbors.py)
+        # In approximate mode for very large listing sets
+        modelsAndMeasures['knn_geo_LaLo' + cat] = gridSearch_fitAndPredict(
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
+            columns = ['Latitude', 'Longitude'],
+            pipe = make_pipeline(geoNeighbors.GeoKNeighborsRegressor(
+                approximate = len(X['train' + cat]) >= geoNeighbors.approximateFromRows)),
+            param_grid = {'geokneighborsregressor__n_neighbors': [5, 10, 20],
+                          'geokneighborsregressor__weights': ['uniform', 'distance']}
+            )
+            
         # K-Nearest Neighbors model with scaled ['Latitude', 'Longitude']
         modelsAndMeasures['knn_LaLo_scaled' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = ['Latitude', 'Longitude'],
             pipe = make_pipeline(StandardScaler(), KNeighborsRegressor()),
             )
                 
         # K-Nearest Neighbors model with scaled ['Latitude', 'Longitude', 'Area', 'ConstructionYear']
         modelsAndMeasures['knn_LaLoArYe_scaled' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = ['Latitude', 'Longitude', 'Area', 'ConstructionYear'],
             pipe = make_pipeline(StandardScaler(), KNeighborsRegressor())
             )
@@ -227,35 +623,69 @@ def run():
         # # Experimental model including feature-engineered variable Price_estimate_nearest_forModel:
         # # K-Nearest Neighbors model with scaled ['Latitude', 'Longitude', 'Area', 'ConstructionYear', 'Price_estimate_nearest_forModel']
         # modelsAndMeasures['knn_LaLoArYe_and_neighborsBasedPriceEstimate_scaled' + cat] = gridSearch_fitAndPredict(
-        #     X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+        #     X['train' + cat], y['train' + cat], X['test' + cat],
+        #     n_jobs = n_jobs,
+        #     cvFolds = folds,
+        #     sharedMatrices = sharedMatrices,
         #     columns = ['Latitude', 'Longitude', 'Area', 'ConstructionYear', 'Price_estimate_nearest_forModel'],
         #     pipe = make_pipeline(StandardScaler(), KNeighborsRegressor())
         #     )
         
         # K-Nearest Neighbors model with scaled columns_standard
         modelsAndMeasures['knn_columns_standard_scaled' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = columns_standard,
             pipe = make_pipeline(StandardScaler(), KNeighborsRegressor())
             )
         
+        # Ridge regression model with scaled columns_standard and the hashed text-features (sparse matrix)
+        # Only the columns_standard (first columns of the matrix) are scaled, the 0/1 text-features are passed through
+        if textFeatures:
+            textMatrix, textUrls = load_textMatrices(regionFolders, cat)
+            modelsAndMeasures['ridge_columns_standard_text' + cat] = gridSearch_fitAndPredict(
+                X['train' + cat], y['train' + cat], X['test' + cat],
+                n_jobs = n_jobs,
+                cvFolds = folds,
+                textMatrices = {'train': get_textRows(textMatrix, textUrls, X['train' + cat]),
+                                'test': get_textRows(textMatrix, textUrls, X['test' + cat])},
+                columns = columns_standard,
+                pipe = make_pipeline(ColumnTransformer([('scaled', StandardScaler(with_mean=False),
+                                                         list(range(len(columns_standard))))],
+                                                       remainder='passthrough', sparse_threshold=1),
+                                     Ridge()),
+                param_grid = {'ridge__alpha': [1, 10, 100]}
+                )
+            del textMatrix, textUrls
+        
         # Linear regression model based on 'Area'
         modelsAndMeasures['lr_Area' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = ['Area'],
             pipe = make_pipeline(LinearRegression())   
             )
         
         # Linear regression model with log('Area')
         modelsAndMeasures['lr_Area_log' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = ['Area'],
             pipe = make_pipeline(make_log_transformer([col for col in columns_logTransform if col in ('Area')]), LinearRegression())
             )
         
         # Linear regression model with scaled log('Area')
         modelsAndMeasures['lr_Area_log_scaled' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = ['Area'],
             pipe = make_pipeline(make_log_transformer([col for col in columns_logTransform if col in ('Area')]),
                                  StandardScaler(),
@@ -264,7 +694,10 @@ def run():
         
         # Linear regression model with scaled ['Latitude', 'Longitude', 'Area', 'ConstructionYear']
         modelsAndMeasures['lr_LaLoArYe_Xlog_scaled' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = ['Latitude', 'Longitude', 'Area', 'ConstructionYear'],
             pipe = make_pipeline(make_log_transformer([col for col in columns_logTransform if col in ['Latitude', 'Longitude', 'Area', 'ConstructionYear']]),
                                  StandardScaler(),
@@ -274,7 +707,10 @@ def run():
         
         # Linear regression model with scaled X_log based on columns_standard
         modelsAndMeasures['lr_columns_standard_Xlog_scaled' + cat] = gridSearch_fitAndPredict(
-            X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+            X['train' + cat], y['train' + cat], X['test' + cat],
+            n_jobs = n_jobs,
+            cvFolds = folds,
+            sharedMatrices = sharedMatrices,
             columns = columns_standard,
             pipe = make_pipeline(make_log_transformer([col for col in columns_logTransform if col in columns_standard]),
                                  StandardScaler(),
@@ -284,57 +720,74 @@ def run():
         # # Experimental model including feature-engineered variable Price_estimate_nearest_forModel:
         # # Linear regression model with scaled X_log based on columns_standard + Price_estimate_nearest_forModel
         # modelsAndMeasures['lr_columns_standard_and_neighborsBasedPriceEstimate_Xlog_scaled' + cat] = gridSearch_fitAndPredict(
-        #     X['train' + cat], y['train' + cat], X['test' + cat], y['test' + cat],
+        #     X['train' + cat], y['train' + cat], X['test' + cat],
+        #     n_jobs = n_jobs,
+        #     cvFolds = folds,
+        #     sharedMatrices = sharedMatrices,
         #     columns = columns_standard + neighborsBasedPriceEstimate,
         #     pipe = make_pipeline(make_log_transformer([col for col in columns_logTransform if col in columns_standard]),
         #                          StandardScaler(),
         #                          LinearRegression())
         #     )    
     
+        # Delete the files of the shared training-matrices (the fitted models keep their own copies when pickled)
+        delete_sharedMatrices(sharedMatrices)
+    
+        # Evaluate the test-predictions of all models in one vectorized pass
+        # (only the summary-measures and the optional residual-samples are kept)
+        predictions, modelNames = evaluation.stack_predictions(
+            {key: modelsAndMeasures[key].pop('y_test_predict') for key in modelsAndMeasures if cat in key})
+        measures, sampledResiduals = evaluation.evaluate_predictions(y['test' + cat], predictions, modelNames,
+                                                                     nSampledResiduals=nSampledResiduals)
+        if sampledResiduals is not None:
+            gf.save_data(sampledResiduals, filename = outputFolder + "sampledResiduals" + cat)
     
         # Construct dataframe with error-measures of fitted models for comparision
         # Errors are retransformed with exp() to get Error-Factors (=max(predicted, real)/min(predicted, real))
-        errorMeasures['raw' + cat] = [[key,
-                                      np.exp(modelsAndMeasures[key]['crossValScore_mean_median_absolute_error']),
-                                      np.exp(modelsAndMeasures[key]['test_median_absolute_error']),
-                                      np.exp(modelsAndMeasures[key]['test_mean_absolute_error']),
-                                      modelsAndMeasures[key]['test_explained_variance_score'],
-                                      np.exp(modelsAndMeasures[key]['test_errors'].quantile(q=0.50)),
-                                      np.exp(modelsAndMeasures[key]['test_errors'].quantile(q=0.75)),
-                                      np.exp(modelsAndMeasures[key]['test_errors'].quantile(q=0.90)),
-                                      np.exp(modelsAndMeasures[key]['test_errors'].quantile(q=0.95)),
-                                      ] for key in modelsAndMeasures if cat in key]
-        errorMeasures['final' + cat] = pd.DataFrame(
-                                                    np.array(errorMeasures['raw' + cat]),
-                                                    columns=['Model',
-                                                            'crossValScore_mean_median_absolute_error',
-                                                            'test_median_absolute_error',
-                                                            'test_mean_absolute_error',
-                                                            'test_explained_variance_score',
-                                                            'test_errorfactors_quantile_50%',
-                                                            'test_errorfactors_quantile_75%',
-                                                            'test_errorfactors_quantile_90%',
-                                                            'test_errorfactors_quantile_95%'])
-        errorMeasures['final' + cat] = errorMeasures['final' + cat].astype(
-            {col: 'float64' for col in errorMeasures['final' + cat].columns if col != 'Model'})
+        errorMeasures['final' + cat] = np.exp(measures.drop(columns='test_explained_variance_score'))
+        errorMeasures['final' + cat].columns = errorMeasures['final' + cat].columns.str.replace(
+            'test_errors_quantile', 'test_errorfactors_quantile')
+        errorMeasures['final' + cat].insert(0, 'crossValScore_mean_median_absolute_error', np.exp(
+            [modelsAndMeasures[key]['crossValScore_mean_median_absolute_error'] for key in modelNames]))
+        errorMeasures['final' + cat].insert(3, 'test_explained_variance_score', measures['test_explained_variance_score'])
+        errorMeasures['final' + cat] = errorMeasures['final' + cat].reset_index()
         # Save errorMeasures['final' + cat] to csv-file
-        gf.save_data(errorMeasures['final' + cat], filename = "errorMeasures" + cat)
+        gf.save_data(errorMeasures['final' + cat], filename = outputFolder + "errorMeasures" + cat)
     
         # Save model (=pickle the model) with the best 'crossValScore_mean_median_absolute_error'
-        # Get name of model with the best 'crossValScore_mean_median_absolute_error'
+        # Get name of model with the best 'crossValScore_mean_median_absolute_error' (models with text-features are only compared)
+        savable = ~errorMeasures['final' + cat]['Model'].map(
+            lambda key: modelsAndMeasures[key]['textFeatures']).to_numpy()
         modelName = errorMeasures['final' + cat].loc[
-            errorMeasures['final' + cat]['crossValScore_mean_median_absolute_error'].idxmin(),
+            errorMeasures['final' + cat].loc[savable, 'crossValScore_mean_median_absolute_error'].idxmin(),
             'Model']
         
-        # Get model with used columns and test_errors and save it to file in current folder and web-application folder
-        # HINT: Path of web-application folder is defined for my machine and needs to be adjusted for other machines!
-        for path in ['', '../Buy-and-Rent-Price-Estimator-for-Apartments_Web-Application/']:
-            pickle.dump({'model': modelsAndMeasures[modelName]['pipe_with_model'],
-                         'columns_used': modelsAndMeasures[modelName]['columns_used'],
-                         'test_errors': modelsAndMeasures[modelName]['test_errors'],
-                         'test_errors_notAbsolute': modelsAndMeasures[modelName]['test_errors_notAbsolute']},
-                         open(path + 'model' + cat + '.p', 'wb'))
-            print('Best model for ' + cat[1:] + ': ' + modelName + ' - saved to file ' + path + 'model' + cat + '.p')
+        # Get the residuals of the best model (prediction - y_test) from the stacked predictions
+        # and calibrate its prediction-intervals per price band on the test-rows (not used for choosing the model)
+        test_errors_notAbsolute = evaluation.get_residuals(y['test' + cat], predictions, modelNames, modelName)
+        modelConfig = {'model': modelsAndMeasures[modelName]['pipe_with_model'],
+                       'columns_used': modelsAndMeasures[modelName]['columns_used'],
+                       'test_errors': test_errors_notAbsolute.abs(),
+                       'test_errors_notAbsolute': test_errors_notAbsolute,
+                       'test_median_absolute_error': test_errors_notAbsolute.abs().median(),
+                       'intervalTable': evaluation.calibrate_intervalTable(y['test' + cat],
+                                                                           predictions[modelNames.index(modelName)]),
+                       # Information for incremental updates of the model (see retrain_incrementally())
+                       'trainedUrls': X['train' + cat]['Url'].tolist(),
+                       'calibrationUrls': X['test' + cat]['Url'].tolist()}
+        if isinstance(modelConfig['model'].steps[-1][1], LinearRegression):
+            modelConfig['sufficientStatistics'] = get_sufficientStatistics(
+                modelConfig['model'], X['train' + cat][modelConfig['columns_used']], y['train' + cat])
+        if isinstance(modelConfig['model'].steps[-1][1], KNeighborsRegressor):
+            modelConfig['fittedRows'] = get_fittedRows(
+                modelConfig['model'], X['train' + cat][modelConfig['columns_used']], y['train' + cat])
+        print('Prediction-intervals for ' + cat[1:] + ' (coverage ' + str(modelConfig['intervalTable']['coverage']) + '):\n'
+              + evaluation.format_intervalTable(modelConfig['intervalTable']).to_string(index=False))
+        
+        # Save model with used columns and test_errors to file in folder of the region and
+        # for the default region also in web-application folder
+        print('Best model for ' + cat[1:] + ': ' + modelName)
+        save_model(modelConfig, cat, outputFolder, region)
         
      
 # Function run() shall be executed if module is executed directly via console 
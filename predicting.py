@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Loads the best models for buy and rent saved by 'modeling.py' (model_buy.p, model_rent.p)
+and predicts prices for given apartment-configurations.
+Used by the local prediction-server 'predictionServer.py' and every other module which
+needs price-estimates of the best models without running the modeling-process again.
+
+An apartment-configuration is a dictionary with column-names of 'columns_used' as keys,
+e.g. {'Area': 80, 'ConstructionYear': 1995, 'City': 'Köln', 'EQ_OUT_balcony': 1}.
+Columns which are not given are filled with the values of 'defaultConfiguration'.
+If 'City' is given instead of 'Latitude' and 'Longitude', the central-coordinates of the city
+are taken from file nrwCityCoordinates.csv created by 'featureEngineering.py'.
+
+@author: Michael Volk
+"""
+
+import generalFunctions as gf
+import evaluation
+import pickle
+import numpy as np
+import pandas as pd
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 1: Define functions for the prediction-process
+
+
+# Default values for all columns which can be used by the models (see columns_standard in 'modeling.py')
+defaultConfiguration = {'Area': 70,
+                        'Rooms': 3,
+                        'ConstructionYear': 1980,
+                        'Latitude': 50.9375, #Köln
+                        'Longitude': 6.9603, #Köln
+                        'EQ_CAT_unknown': 1,
+                        'EQ_CAT_floorApartment': 0,
+                        'EQ_CAT_apartment': 0,
+                        'EQ_CAT_maisonette': 0,
+                        'EQ_CAT_penthouse': 0,
+                        'EQ_CAT_terraceApartment': 0,
+                        'EQ_CAT_loft': 0,
+                        'EQ_CON_unknown': 1,
+                        'EQ_CON_firstOccupancy': 0,
+                        'EQ_CON_upscale': 0,
+                        'EQ_CON_maintained': 0,
+                        'EQ_CON_renovated': 0,
+                        'EQ_CON_needsRenovation': 0,
+                        'EQ_CON_refurbished': 0,
+                        'EQ_CON_needsRefurbishment': 0,
+                        'EQ_CON_partlyRenovated': 0,
+                        'EQ_OUT_balcony': 0,
+                        'EQ_OUT_garden': 0,
+                        'EQ_OUT_loggia': 0,
+                        'EQ_OUT_terrace': 0}
+
+
+def load_model(cat, path=''):
+    """Loads the pickled best model for given cat ('_buy' or '_rent') from file 'model' + cat + '.p'
+    in given path and returns it as dictionary ('modelConfig').
+    The confidence-intervals are looked up in the 'intervalTable' calibrated by 'modeling.py'
+    (see evaluation.calibrate_intervalTable()). For models saved without it, a table with the
+    5%- and 95%-quantiles of 'test_errors_notAbsolute' is created once while loading."""
+
+    with open(file=path + 'model' + cat + '.p', mode='rb') as pickled:
+        modelConfig = pickle.load(pickled)
+    if 'intervalTable' not in modelConfig:
+        modelConfig['intervalTable'] = evaluation.make_globalIntervalTable(modelConfig['test_errors_notAbsolute'])
+
+    return modelConfig
+
+def load_cityCoordinates(path=''):
+    """Loads file nrwCityCoordinates.csv created by 'featureEngineering.py' from given path
+    and returns dictionary with cityname as key and tuple (Latitude, Longitude) as value"""
+
+    df = gf.load_data(filename = path + 'nrwCityCoordinates')
+
+    return dict(zip(df.City, zip(df.Latitude, df.Longitude)))
+
+def make_featureFrame(configurations, columns_used, cityCoordinates=None):
+    """Returns dataframe with one row per given apartment-configuration (list of dictionaries)
+    and the given 'columns_used' of the model as columns in the order expected by the model.
+    Missing columns are filled with the values of 'defaultConfiguration'.
+    Raises KeyError for an unknown 'City' or a column without default-value."""
+
+    rows = []
+    for configuration in configurations:
+        row = dict(defaultConfiguration)
+        if 'City' in configuration and cityCoordinates is not None:
+            row['Latitude'], row['Longitude'] = cityCoordinates[configuration['City']]
+        row.update(configuration)
+        rows.append([row[col] for col in columns_used])
+
+    return pd.DataFrame(rows, columns=columns_used, dtype='float64')
+
+def predict_prices(modelConfig, featureFrame):
+    """Predicts prices for given 'featureFrame' (see make_featureFrame()) with the model
+    of given 'modelConfig' (see load_model()) in one vectorized predict-call.
+    The model predicts log(price), so the prediction and the confidence-interval
+    (looked up per price band in the 'intervalTable' of the model) are retransformed with exp().
+    Returns dataframe with columns 'Price_estimate', 'Price_lower', 'Price_upper'."""
+
+    y_predict = modelConfig['model'].predict(featureFrame[modelConfig['columns_used']])
+    y_lower, y_upper = evaluation.lookup_intervals(modelConfig['intervalTable'], y_predict)
+
+    return pd.DataFrame({'Price_estimate': np.exp(y_predict),
+                         'Price_lower': np.exp(y_lower),
+                         'Price_upper': np.exp(y_upper)},
+                        index=featureFrame.index)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+LRU/TTL prediction-cache around the best-model inference path of 'predicting.py'.
+End users of the estimator often re-submit nearly identical apartment-configurations
+(same city, area and year with only one checkbox toggled), so many predictions can be
+answered without walking every tree of the Random Forest again.
+
+The cache is keyed on the canonicalised feature-vector of the model's 'columns_used'.
+Latitude and Longitude are rounded to 'coordinateDecimals' decimals before predicting,
+so that configurations which differ only in negligible coordinate-digits share one entry
+(3 decimals ~ 100 metres). Entries expire after 'ttlSeconds' and the least recently used
+entries are evicted when 'maxSize' is reached. The cache is invalidated and the model
+is reloaded as soon as the model-file model_buy.p / model_rent.p changes on disk.
+
+@author: Michael Volk
+"""
+
+import predicting
+import collections
+import os
+import time
+import pandas as pd
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 1: Define classes and functions for the prediction-cache
+
+
+def canonicalise_featureFrame(featureFrame, coordinateDecimals=3):
+    """Returns copy of given featureFrame with rounded 'Latitude' and 'Longitude' (if contained)"""
+
+    featureFrame = featureFrame.copy()
+    for col in ['Latitude', 'Longitude']:
+        if col in featureFrame.columns:
+            featureFrame[col] = featureFrame[col].round(coordinateDecimals)
+
+    return featureFrame
+
+
+class PredictionCache:
+    """Dictionary-like LRU-cache with time-to-live per entry and hit-/miss-counters"""
+
+    def __init__(self, maxSize=10000, ttlSeconds=3600):
+        self.maxSize = maxSize
+        self.ttlSeconds = ttlSeconds
+        self.entries = collections.OrderedDict() #key -> (expiry-time, value)
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Returns cached value for given key or None if key is not cached or expired"""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            del self.entries[key]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, value):
+        """Caches given value for given key and evicts the least recently used entries if necessary"""
+        self.entries[key] = (time.monotonic() + self.ttlSeconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Removes all entries (counters are kept)"""
+        self.entries.clear()
+        self.invalidations += 1
+
+    def summary(self):
+        """Returns dictionary with size and counters of the cache"""
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations}
+
+
+class CachedModel:
+    """Best model for one cat ('_buy' or '_rent') with prediction-cache in front of it.
+    Checks at most every 'checkIntervalSeconds' whether the model-file changed
+    (modification-time and size) and if so reloads the model and clears the cache."""
+
+    def __init__(self, cat, path='', maxSize=10000, ttlSeconds=3600, coordinateDecimals=3,
+                 checkIntervalSeconds=1.0):
+        self.cat = cat
+        self.path = path
+        self.modelFile = path + 'model' + cat + '.p'
+        self.coordinateDecimals = coordinateDecimals
+        self.checkIntervalSeconds = checkIntervalSeconds
+        self.cache = PredictionCache(maxSize, ttlSeconds)
+        self.load()
+
+    def get_modelFileSignature(self):
+        """Returns (modification-time, size) of the model-file"""
+        stat = os.stat(self.modelFile)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        """(Re-)loads the model from the model-file. The signature is only recorded after a successful
+        load (taken before it, so a file replaced while loading is reloaded at the next check)."""
+        modelFileSignature = self.get_modelFileSignature()
+        self.modelConfig = predicting.load_model(self.cat, self.path)
+        self.modelFileSignature = modelFileSignature
+        self.lastCheck = time.monotonic()
+
+    def check_modelFile(self):
+        """Reloads the model and invalidates the cache if the model-file changed.
+        Returns True if the model has been reloaded."""
+        if time.monotonic() - self.lastCheck < self.checkIntervalSeconds:
+            return False
+        self.lastCheck = time.monotonic()
+        if self.get_modelFileSignature() == self.modelFileSignature:
+            return False
+        try:
+            self.load()
+        except Exception as e:
+            # Keeps serving the previous model, the reload is retried at the next check
+            print('Reloading ' + self.modelFile + ' failed (' + repr(e) + '), previous model kept')
+            return False
+        self.cache.clear()
+        return True
+
+    def predict_prices(self, featureFrame, checkModelFile=True):
+        """Same as predicting.predict_prices(), but cached: only the configurations which
+        are not cached are predicted by the model (in one vectorized predict-call).
+        With checkModelFile=False the model-file is not checked (the caller checked it before building
+        'featureFrame' with the used columns of the current model)."""
+        if checkModelFile:
+            self.check_modelFile()
+        featureFrame = canonicalise_featureFrame(featureFrame[self.modelConfig['columns_used']],
+                                                 self.coordinateDecimals)
+        keys = list(featureFrame.itertuples(index=False, name=None))
+        results = [self.cache.get(key) for key in keys]
+
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            predicted = predicting.predict_prices(self.modelConfig, featureFrame.iloc[misses])
+            for i, prediction in zip(misses, predicted.to_dict(orient='records')):
+                self.cache.put(keys[i], prediction)
+                results[i] = prediction
+
+        return pd.DataFrame(results, index=featureFrame.index,
+                            columns=['Price_estimate', 'Price_lower', 'Price_upper'])
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Local low-latency prediction-server for the best models for buy and rent saved by 'modeling.py'.
+In contrast to the flask-app, which unpickles the models per request, the server holds
+both models in memory, warms them up at start and gathers concurrent requests
+into micro-batches, so that each predict-call of a model is vectorized over many requests.
+
+The server is a plain asyncio HTTP/1.1 server (keep-alive supported) on localhost with the endpoints:
+* POST /predict/buy, POST /predict/rent: body is one apartment-configuration as JSON-object
+  (see 'predicting.py') or a JSON-list of configurations. Returns 'Price_estimate',
+  'Price_lower', 'Price_upper' for each configuration.
+* GET /stats: p50-/p99-latency, throughput, micro-batching and prediction-cache counters of the server
+* GET /health: returns status ok when the models are loaded and warmed up
+
+Optionally ('cacheSize' > 0, default) the predictions are cached by 'predictionCache.py',
+which also reloads a model as soon as its model-file changes.
+
+Start the server with 'python predictionServer.py' and load-test it with 'loadTesting.py'.
+
+@author: Michael Volk
+"""
+
+import generalFunctions as gf
+import predicting
+import predictionCache
+import asyncio
+import collections
+import json
+import time
+import numpy as np
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 1: Define classes and functions for the prediction-server
+
+
+class LatencyStats:
+    """Collects latency and throughput counters of the server.
+    Latencies are kept in a ring-buffer of the last 'window' requests,
+    so that the memory of the server does not grow with the number of requests."""
+
+    def __init__(self, window=10000):
+        self.latencies = collections.deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batchedRows = 0
+        self.startTime = time.perf_counter()
+
+    def record_request(self, seconds, error=False):
+        """Records the latency of one request in seconds"""
+        self.latencies.append(seconds)
+        self.requests += 1
+        self.errors += int(error)
+
+    def record_batch(self, size):
+        """Records one predict-call of a model with given batch-size"""
+        self.batches += 1
+        self.batchedRows += size
+
+    def summary(self):
+        """Returns dictionary with all counters, latencies in milliseconds"""
+        uptime = time.perf_counter() - self.startTime
+        latencies = np.array(self.latencies) * 1000
+        return {'uptime_seconds': round(uptime, 3),
+                'requests': self.requests,
+                'errors': self.errors,
+                'requests_per_second': round(self.requests / uptime, 2) if uptime > 0 else 0.0,
+                'latency_p50_ms': round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+                'latency_p99_ms': round(float(np.percentile(latencies, 99)), 3) if len(latencies) else None,
+                'batches': self.batches,
+                'mean_batch_size': round(self.batchedRows / self.batches, 2) if self.batches else None}
+
+
+class MicroBatcher:
+    """Gathers concurrent prediction-requests for one model into micro-batches.
+    A batch is closed if 'maxBatchSize' requests are collected or if 'maxWaitMs' milliseconds
+    passed since the first request of the batch arrived. The vectorized predict-call
+    is executed in a thread, so the event-loop keeps accepting requests meanwhile.
+    If a 'cachedModel' (see 'predictionCache.py') is given, it is used instead of 'modelConfig'."""
+
+    def __init__(self, modelConfig, cityCoordinates=None, maxBatchSize=64, maxWaitMs=2, stats=None,
+                 cachedModel=None):
+        self.modelConfig = modelConfig
+        self.cachedModel = cachedModel
+        self.cityCoordinates = cityCoordinates
+        self.maxBatchSize = maxBatchSize
+        self.maxWait = maxWaitMs / 1000
+        self.stats = stats if stats is not None else LatencyStats()
+        self.queue = None #created in serve() inside the running event-loop
+
+    async def predict(self, configuration):
+        """Puts given apartment-configuration in the queue and waits for its prediction"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((configuration, future))
+        return await future
+
+    def predict_batch(self, configurations):
+        """Predicts all given configurations with one predict-call of the model"""
+        if self.cachedModel is not None:
+            # Reload the cached model before building the features, its used columns may have changed with the model-file
+            self.cachedModel.check_modelFile()
+            self.modelConfig = self.cachedModel.modelConfig
+        featureFrame = predicting.make_featureFrame(configurations, self.modelConfig['columns_used'],
+                                                    self.cityCoordinates)
+        if self.cachedModel is not None:
+            return self.cachedModel.predict_prices(featureFrame, checkModelFile=False).to_dict(orient='records')
+        return predicting.predict_prices(self.modelConfig, featureFrame).to_dict(orient='records')
+
+    async def worker(self):
+        """Endless loop collecting the micro-batches from the queue and predicting them"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.maxWait
+            while len(batch) < self.maxBatchSize:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            configurations = [configuration for configuration, future in batch]
+            try:
+                results = await loop.run_in_executor(None, self.predict_batch, configurations)
+                self.stats.record_batch(len(batch))
+            except Exception:
+                # One invalid configuration shall not fail the whole batch:
+                # predict every configuration separately to assign the error to the right request
+                results = []
+                for configuration in configurations:
+                    try:
+                        results.append((await loop.run_in_executor(None, self.predict_batch, [configuration]))[0])
+                    except Exception as e:
+                        results.append(e)
+                    self.stats.record_batch(1)
+            for (configuration, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+def warm_up(batcher, batchSizes=(1, 8)):
+    """Predicts batches of 'defaultConfiguration' with given batch-sizes,
+    so that the first real requests do not pay for lazy initialisations of the model.
+    The prediction-cache is bypassed, so that its counters only reflect real requests."""
+
+    for batchSize in batchSizes:
+        featureFrame = predicting.make_featureFrame([{}] * batchSize, batcher.modelConfig['columns_used'])
+        predicting.predict_prices(batcher.modelConfig, featureFrame)
+
+
+class PredictionServer:
+    """Holds the micro-batchers for buy and rent and answers the HTTP-requests"""
+
+    def __init__(self, path='', maxBatchSize=64, maxWaitMs=2, cacheSize=10000, cacheTtlSeconds=3600,
+                 coordinateDecimals=3):
+        self.stats = LatencyStats()
+        cityCoordinates = predicting.load_cityCoordinates(path)
+        self.batchers = {}
+        for cat in ['_buy', '_rent']:
+            if cacheSize > 0:
+                cachedModel = predictionCache.CachedModel(cat, path, cacheSize, cacheTtlSeconds, coordinateDecimals)
+                modelConfig = cachedModel.modelConfig
+            else:
+                cachedModel = None
+                modelConfig = predicting.load_model(cat, path)
+            self.batchers[cat[1:]] = MicroBatcher(modelConfig, cityCoordinates, maxBatchSize, maxWaitMs,
+                                                  self.stats, cachedModel)
+            warm_up(self.batchers[cat[1:]], batchSizes=(1, maxBatchSize))
+
+    async def route(self, method, target, body):
+        """Returns HTTP-status and JSON-serializable payload for given request"""
+        if method == 'GET' and target == '/health':
+            return 200, {'status': 'ok'}
+        if method == 'GET' and target == '/stats':
+            stats = self.stats.summary()
+            for name, batcher in self.batchers.items():
+                if batcher.cachedModel is not None:
+                    stats['cache_' + name] = batcher.cachedModel.cache.summary()
+            return 200, stats
+        if method == 'POST' and target.startswith('/predict/') and target[len('/predict/'):] in self.batchers:
+            batcher = self.batchers[target[len('/predict/'):]]
+            try:
+                configurations = json.loads(body)
+            except ValueError:
+                return 400, {'error': 'body is not valid JSON'}
+            try:
+                if isinstance(configurations, list):
+                    return 200, list(await asyncio.gather(*[batcher.predict(c) for c in configurations]))
+                return 200, await batcher.predict(configurations)
+            except KeyError as e:
+                return 400, {'error': 'unknown city or column: %s' % e}
+            except (TypeError, ValueError) as e:
+                return 400, {'error': str(e)}
+        return 404, {'error': 'not found'}
+
+    async def handle_connection(self, reader, writer):
+        """Reads HTTP/1.1-requests from one connection until the client closes it"""
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+                startTime = time.perf_counter()
+                method, target, _ = requestLine.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, value = line.decode('latin-1').split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                try:
+                    status, payload = await self.route(method, target, body)
+                except Exception as e:
+                    # An unexpected error (e.g. raised inside the model) is answered, the connection stays open
+                    status, payload = 500, {'error': 'internal server error: %s: %s' % (type(e).__name__, e)}
+                data = json.dumps(payload).encode('utf-8')
+                writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                              % (status, 'OK' if status == 200 else 'Error', len(data))).encode('latin-1') + data)
+                await writer.drain()
+                if target.startswith('/predict/'):
+                    self.stats.record_request(time.perf_counter() - startTime, error=(status != 200))
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        """Starts the workers of the micro-batchers and serves until cancelled"""
+        for batcher in self.batchers.values():
+            batcher.queue = asyncio.Queue()
+        workers = [asyncio.ensure_future(batcher.worker()) for batcher in self.batchers.values()]
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(gf.dayTime() + ': Prediction-server listening on http://%s:%d' % (host, port))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 2: Define the order of running the above functions.
+
+
+def run(host='127.0.0.1', port=8050, path='', maxBatchSize=64, maxWaitMs=2,
+        cacheSize=10000, cacheTtlSeconds=3600, coordinateDecimals=3):
+    """
+    Loads and warms up the best models for buy and rent from given path
+    and serves predictions on given host and port until interrupted.
+    Set 'cacheSize' to 0 to disable the prediction-cache.
+    """
+
+    print(gf.dayTime() + ': Loading and warming up models')
+    server = PredictionServer(path, maxBatchSize, maxWaitMs, cacheSize, cacheTtlSeconds, coordinateDecimals)
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        print(gf.dayTime() + ': Prediction-server stopped')
+
+
+# Function run() shall be executed if module is executed directly via console
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Precomputes a price-surface of the best models for buy and rent saved by 'modeling.py'
+and saves it as compact lookup-tables priceSurface_buy.npz, priceSurface_rent.npz.
+The web-application and analysts can then read a price-estimate with an O(1) lookup
+instead of running model inference for every map tile.
+
+The surface consists of the predicted prices for a grid of standard apartment-configurations:
+area-buckets x construction-year-buckets x condition, each for
+* every municipality of North Rhine-Westphalia (central-coordinates from nrwCityCoordinates.csv
+  created by 'featureEngineering.py'), default
+* or every cell of a finer square grid (in degrees of Latitude/Longitude),
+  clipped to the municipalities of shapefile dvg2gem_nw.shp
+
+Each model predicts the whole grid in a few vectorized predict-calls.
+The prices are stored as float32-array with shape (points, areas, years, conditions).
+
+@author: Michael Volk
+"""
+
+import generalFunctions as gf
+import predicting
+import numpy as np
+import pandas as pd
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 1: Define functions for the price-surface
+
+
+# Representative values of the buckets of the standard apartment-configurations
+areaBuckets = [30, 45, 60, 75, 90, 110, 130, 160]
+constructionYearBuckets = [1900, 1950, 1965, 1980, 1995, 2005, 2015, 2020]
+conditionBuckets = ['unknown', 'firstOccupancy', 'upscale', 'maintained', 'renovated',
+                    'needsRenovation', 'refurbished', 'needsRefurbishment', 'partlyRenovated']
+
+
+def get_bucketEdges(buckets):
+    """Returns the edges between the given representative bucket-values (midpoints),
+    used for finding the bucket of a value with np.searchsorted()"""
+    return (np.array(buckets[:-1]) + np.array(buckets[1:])) / 2
+
+def make_cityPoints(path=''):
+    """Returns dataframe with columns 'Name', 'Latitude', 'Longitude' for every municipality
+    on basis of file nrwCityCoordinates.csv created by 'featureEngineering.py'"""
+
+    df = gf.load_data(filename = path + 'nrwCityCoordinates')
+
+    return df.rename(columns={'City': 'Name'})[['Name', 'Latitude', 'Longitude']].reset_index(drop=True)
+
+def make_squareGridPoints(df_map, cellSizeDegrees=0.05):
+    """Returns dataframe with columns 'Name', 'Latitude', 'Longitude' for the centre of every cell
+    of a square grid (in degrees) whose centre lies within a municipality of given geopandasMap 'df_map'.
+    'Name' is the identifier 'row_column' of the cell relative to the south-west corner of the grid,
+    which allows the O(1) lookup of a cell for given coordinates."""
+
+    import geopandas as gpd
+
+    df_map = df_map.to_crs(epsg=4326)
+    minLongitude, minLatitude, maxLongitude, maxLatitude = df_map.total_bounds
+    rows = np.arange(int(np.ceil((maxLatitude - minLatitude) / cellSizeDegrees)))
+    columns = np.arange(int(np.ceil((maxLongitude - minLongitude) / cellSizeDegrees)))
+    rowGrid, columnGrid = [grid.ravel() for grid in np.meshgrid(rows, columns, indexing='ij')]
+    cells = gpd.GeoDataFrame({'Name': [str(r) + '_' + str(c) for r, c in zip(rowGrid, columnGrid)],
+                              'Latitude': minLatitude + (rowGrid + 0.5) * cellSizeDegrees,
+                              'Longitude': minLongitude + (columnGrid + 0.5) * cellSizeDegrees})
+    cells = cells.set_geometry(gpd.points_from_xy(cells.Longitude, cells.Latitude), crs='epsg:4326')
+
+    # Clip the grid to the municipalities with one spatial join instead of a loop over all cells
+    cells = gpd.sjoin(cells, df_map[['geometry']], how='inner', op='within')
+    cells = cells[~cells.index.duplicated()]
+
+    return pd.DataFrame(cells[['Name', 'Latitude', 'Longitude']]).reset_index(drop=True)
+
+def make_gridFeatureFrame(points, columns_used):
+    """Returns featureFrame (see 'predicting.py') with one row per combination of
+    point x area-bucket x construction-year-bucket x condition-bucket (in this order, C-contiguous)"""
+
+    shape = (len(points), len(areaBuckets), len(constructionYearBuckets), len(conditionBuckets))
+    pointIndex, areaIndex, yearIndex, conditionIndex = [index.ravel() for index in np.indices(shape)]
+
+    featureFrame = pd.DataFrame({col: np.full(len(pointIndex), value, dtype='float64')
+                                 for col, value in predicting.defaultConfiguration.items()})
+    featureFrame['Latitude'] = points.Latitude.to_numpy()[pointIndex]
+    featureFrame['Longitude'] = points.Longitude.to_numpy()[pointIndex]
+    featureFrame['Area'] = np.array(areaBuckets, dtype='float64')[areaIndex]
+    # Number of rooms derived from the area: one room per 25 m², at least 1 and at most 7 rooms
+    featureFrame['Rooms'] = np.clip(np.round(featureFrame['Area'] / 25), 1, 7)
+    featureFrame['ConstructionYear'] = np.array(constructionYearBuckets, dtype='float64')[yearIndex]
+    featureFrame['EQ_CON_unknown'] = 0.0
+    for i, condition in enumerate(conditionBuckets):
+        featureFrame.loc[conditionIndex == i, 'EQ_CON_' + condition] = 1.0
+
+    return featureFrame[columns_used]
+
+def compute_priceSurface(modelConfig, points, chunkSize=100000):
+    """Predicts the prices of the whole grid for given 'modelConfig' (see predicting.load_model())
+    and given points in chunks of 'chunkSize' rows. Returns float32-array with shape
+    (points, areas, years, conditions)."""
+
+    featureFrame = make_gridFeatureFrame(points, modelConfig['columns_used'])
+    prices = np.empty(len(featureFrame), dtype='float32')
+    for start in range(0, len(featureFrame), chunkSize):
+        prices[start:start + chunkSize] = predicting.predict_prices(
+            modelConfig, featureFrame.iloc[start:start + chunkSize])['Price_estimate'].to_numpy()
+
+    return prices.reshape(len(points), len(areaBuckets), len(constructionYearBuckets), len(conditionBuckets))
+
+def save_priceSurface(prices, points, filename, gridType='cities', cellSizeDegrees=None, gridOrigin=None):
+    """Saves given price-surface together with its axes to compressed npz-file"""
+
+    np.savez_compressed(filename + '.npz',
+                        prices=prices,
+                        pointNames=points.Name.to_numpy().astype(str),
+                        pointLatitudes=points.Latitude.to_numpy(),
+                        pointLongitudes=points.Longitude.to_numpy(),
+                        areaBuckets=np.array(areaBuckets),
+                        constructionYearBuckets=np.array(constructionYearBuckets),
+                        conditionBuckets=np.array(conditionBuckets),
+                        gridType=np.array(gridType),
+                        cellSizeDegrees=np.array(np.nan if cellSizeDegrees is None else cellSizeDegrees),
+                        gridOrigin=np.array([np.nan, np.nan] if gridOrigin is None else gridOrigin))
+    print("Price-surface saved to file: " + filename + '.npz')
+
+def load_priceSurface(cat, path=''):
+    """Loads the price-surface for given cat ('_buy' or '_rent') from file 'priceSurface' + cat + '.npz'
+    and returns it as dictionary with the lookup-indices already built"""
+
+    with np.load(path + 'priceSurface' + cat + '.npz') as data:
+        surface = {key: data[key] for key in data.files}
+    surface['pointIndex'] = {name: i for i, name in enumerate(surface['pointNames'])}
+    surface['conditionIndex'] = {condition: i for i, condition in enumerate(surface['conditionBuckets'])}
+    surface['areaEdges'] = get_bucketEdges(surface['areaBuckets'])
+    surface['constructionYearEdges'] = get_bucketEdges(surface['constructionYearBuckets'])
+
+    return surface
+
+def lookup_price(surface, area, constructionYear, condition='unknown', city=None, latitude=None, longitude=None):
+    """Returns the precomputed price of given surface (see load_priceSurface()) for the nearest
+    area- and construction-year-bucket and given condition, either for given 'city'
+    (municipality-surface) or for given 'latitude' and 'longitude' (square-grid-surface).
+    Raises KeyError for an unknown city, condition or coordinates outside of the grid."""
+
+    if city is not None:
+        pointIndex = surface['pointIndex'][city]
+    else:
+        cellSize = float(surface['cellSizeDegrees'])
+        row = int((latitude - surface['gridOrigin'][0]) // cellSize)
+        column = int((longitude - surface['gridOrigin'][1]) // cellSize)
+        pointIndex = surface['pointIndex'][str(row) + '_' + str(column)]
+
+    return float(surface['prices'][pointIndex,
+                                   np.searchsorted(surface['areaEdges'], area),
+                                   np.searchsorted(surface['constructionYearEdges'], constructionYear),
+                                   surface['conditionIndex'][condition]])
+
+def priceSurface_to_dataframe(surface):
+    """Returns given surface as long-format dataframe (one row per point and configuration) for analysts"""
+
+    prices = surface['prices']
+    pointIndex, areaIndex, yearIndex, conditionIndex = [index.ravel() for index in np.indices(prices.shape)]
+
+    return pd.DataFrame({'Name': surface['pointNames'][pointIndex],
+                         'Latitude': surface['pointLatitudes'][pointIndex],
+                         'Longitude': surface['pointLongitudes'][pointIndex],
+                         'Area': surface['areaBuckets'][areaIndex],
+                         'ConstructionYear': surface['constructionYearBuckets'][yearIndex],
+                         'Condition': surface['conditionBuckets'][conditionIndex],
+                         'Price_estimate': prices.ravel()})
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 2: Define the order of running the above functions.
+
+
+def run(gridType='cities', cellSizeDegrees=0.05):
+    """
+    Runs the above functions in defined order.
+    Computes the price-surfaces for buy and rent for the municipalities (gridType='cities')
+    or for a square grid with given 'cellSizeDegrees' (gridType='square') and saves them.
+    """
+
+    # Define the points of the surface
+    if gridType == 'cities':
+        points = make_cityPoints()
+        gridOrigin = None
+    else:
+        import featureEngineering
+        df_map = featureEngineering.load_geopandasMap()
+        points = make_squareGridPoints(df_map, cellSizeDegrees)
+        minLongitude, minLatitude = df_map.to_crs(epsg=4326).total_bounds[:2]
+        gridOrigin = [minLatitude, minLongitude]
+
+    for cat in ['_buy', '_rent']:
+        print(gf.dayTime() + ': Computing price-surface for ' + cat[1:] + ' with '
+              + str(len(points)) + ' points')
+        prices = compute_priceSurface(predicting.load_model(cat), points)
+        # Save price-surface to file in current folder and web-application folder
+        # HINT: Path of web-application folder is defined for my machine and needs to be adjusted for other machines!
+        for path in ['', '../Buy-and-Rent-Price-Estimator-for-Apartments_Web-Application/']:
+            save_priceSurface(prices, points, path + 'priceSurface' + cat, gridType,
+                              cellSizeDegrees if gridType != 'cities' else None, gridOrigin)
+
+
+# Function run() shall be executed if module is executed directly via console
+if __name__ == "__main__":
+    run()
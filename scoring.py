@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight prediction entry point for scoring batches of apartments with the best models for buy and rent.
+Imports only numpy and the model runtime (scikit-learn, loaded by unpickling the model) instead of
+pandas, geopandas and the pipeline-modules, so it starts fast (e.g. in short-lived batch-jobs).
+Uses the lean model-files scoringModel_buy.p, scoringModel_rent.p saved by 'modeling.py' next to
+model_buy.p, model_rent.p (only the model, its used columns and its interval-table).
+pandas is only imported for models whose preprocessing selects columns by name (log-transformer).
+
+Usage from console (csv-file with a header containing all columns used by the model):
+    python scoring.py _buy apartments.csv prices.csv
+
+@author: Michael Volk
+"""
+
+import evaluation
+import pickle
+import sys
+import warnings
+import numpy as np
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 1: Define functions for scoring
+
+
+def load_scoringModel(cat, path=''):
+    """Loads the lean model for given cat ('_buy' or '_rent') from file 'scoringModel' + cat + '.p' in given path
+    and returns it as dictionary with the keys 'model', 'columns_used' and 'intervalTable'"""
+
+    with open(file=path + 'scoringModel' + cat + '.p', mode='rb') as pickled:
+        return pickle.load(pickled)
+
+def needs_dataframe(model):
+    """Returns True if a step of given pipe selects columns by name (ColumnTransformer), which requires a dataframe"""
+    return any(type(step).__name__ == 'ColumnTransformer' for name, step in getattr(model, 'steps', []))
+
+def score(scoringModel, features):
+    """Predicts the prices of given 2-D array 'features' (one row per apartment, columns in the order of
+    scoringModel['columns_used']) in one vectorized predict-call.
+    Returns the arrays of the price-estimates and the lower and upper bounds of their prediction-intervals
+    (retransformed with exp(), the model predicts log(price))."""
+
+    features = np.asarray(features, dtype='float64')
+    model = scoringModel['model']
+    if needs_dataframe(model):
+        import pandas as pd
+        features = pd.DataFrame(features, columns=scoringModel['columns_used'])
+    with warnings.catch_warnings():
+        # The models are fitted on dataframes, the feature-names of an array are not checked
+        warnings.filterwarnings('ignore', message='X does not have valid feature names')
+        y_predict = model.predict(features)
+    y_lower, y_upper = evaluation.lookup_intervals(scoringModel['intervalTable'], y_predict)
+
+    return np.exp(y_predict), np.exp(y_lower), np.exp(y_upper)
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 2: Score the apartments of a csv-file
+
+
+def run(cat='_buy', inputFilename='apartments.csv', outputFilename='prices.csv', path=''):
+    """
+    Scores the apartments of given csv-file (header with all columns used by the model of given cat)
+    with the model saved in given path and saves the columns Price_estimate, Price_lower, Price_upper
+    to given output csv-file.
+    """
+
+    scoringModel = load_scoringModel(cat, path)
+    rows = np.genfromtxt(inputFilename, delimiter=',', names=True, dtype='float64', ndmin=1)
+    features = np.column_stack([rows[col] for col in scoringModel['columns_used']])
+    prices = np.column_stack(score(scoringModel, features))
+    np.savetxt(outputFilename, prices, delimiter=',', header='Price_estimate,Price_lower,Price_upper',
+               comments='', fmt='%.2f')
+    print('Prices of ' + str(len(prices)) + ' apartments saved to file: ' + outputFilename)
+
+
+# Function run() shall be executed if module is executed directly via console
+if __name__ == "__main__":
+    run(*sys.argv[1:])
@@ -18,13 +18,11 @@ saved as a csv-file in the end - each for buy and rent.
 """
 
 import generalFunctions as gf
-import requests
-from bs4 import BeautifulSoup
 import json
 from datetime import datetime
 from collections import defaultdict
 import csv
-import tqdm #used for progress-measurement of loops
+import os
 import numpy as np #used for definition of NaN
 import pandas as pd
 
@@ -57,6 +55,10 @@ def urlExposeCollector (urlSearchResultPage, maxSearchResults = 999999):
 
     """ 
     
+    import requests
+    from bs4 import BeautifulSoup
+    import tqdm #used for progress-measurement of loops
+    
     try:
 
         #Define empty list for collecting the links to the exposes
@@ -171,6 +173,9 @@ def exposeScraper(urlExpose):
         Contains the relevant apartment data
     """    
     
+    import requests
+    from bs4 import BeautifulSoup
+    
     try:
         #Create general protocol data
         dateAndTime = datetime.today().strftime('%Y-%m-%d %H:%M:%S')
@@ -301,6 +306,8 @@ def scrapeAndSaveExposes(collectedExposeUrls, filename, maxNumberExposes = 99999
         Contains data of the exposes, one row per expose
     """
     
+    import tqdm #used for progress-measurement of loops
+    
     print(gf.dayTime() + ": scrapeAndSaveExposes started")
     #Create list with scraped expose data
     exposesData = []
@@ -329,28 +336,31 @@ def scrapeAndSaveExposes(collectedExposeUrls, filename, maxNumberExposes = 99999
 
 # Section 2: Define the order of running the above functions.
 
-def run(maxNumberExposes=999999):
+@gf.profilable
+def run(maxNumberExposes=999999, cats=['_buy', '_rent'], region=gf.defaultRegion):
     """
     Runs the above functions in defined order.
     The optional parameter maxNumberExposes defines the maximum number of exposes to be scraped.
+    The optional parameter cats defines the exposes to be scraped ('_buy' and/or '_rent').
+    The optional parameter region defines the german federal state to be scraped (see generalFunctions.regions).
+    The optional parameter profile ('cprofile', 'sampling' or 'allocations') profiles the run (see generalFunctions.profiled).
     """
-    #Search and scrape from website immowelt.de for apartments in nordrhein-westfalen to buy with construction year <= 2021
-    
-    #Define url for a immowelt.de search result page
-    urlSearchResultPage_Buying = 'https://www.immowelt.de/liste/bl-nordrhein-westfalen/wohnungen/kaufen?cyma=2021&d=true&sd=DESC&sf=TIMESTAMP&sp=1'
-    # Collect and save expose urls to list and csv-file. Than scrape exposes from that list and save them in a pandas-dataframe formated csv-file
-    print (gf.dayTime() + ': Started scraping-process for buy')
-    scrapeAndSaveExposes(collectAndSaveExposeUrls(urlSearchResultPage_Buying, "urls_buy"), "scraped_buy", maxNumberExposes)
-    print (gf.dayTime() + ': Finished scraping-process for buy')
+    #Search and scrape from website immowelt.de for apartments in given region to buy/rent with construction year <= 2021
     
-    #Search and scrape from website immowelt.de for apartments in nordrhein-westfalen to rent with construction year <= 2021
+    #Define urls for a immowelt.de search result page for buy and rent
+    searchSlug = gf.regions[region]['searchSlug']
+    urlsSearchResultPage = {
+        '_buy': 'https://www.immowelt.de/liste/' + searchSlug + '/wohnungen/kaufen?cyma=2021&d=true&sd=DESC&sf=TIMESTAMP&sp=1',
+        '_rent': 'https://www.immowelt.de/liste/' + searchSlug + '/wohnungen/mieten?cyma=2021&d=true&sd=DESC&sf=TIMESTAMP&sp=1'}
+    regionFolder = gf.get_regionFolder(region)
+    if regionFolder:
+        os.makedirs(regionFolder, exist_ok=True)
     
-    # Example of an url search result page for apartments in nordrhein-westfalen to rent with construction year <= 2021
-    urlSearchResultPage_Renting = 'https://www.immowelt.de/liste/bl-nordrhein-westfalen/wohnungen/mieten?cyma=2021&d=true&sd=DESC&sf=TIMESTAMP&sp=1'
-    # Collect and save expose urls to list and csv-file. Than scrape exposes from that list and save them in a pandas-dataframe formated csv-file
-    print (gf.dayTime() + ': Started scraping-process for rent')
-    scrapeAndSaveExposes(collectAndSaveExposeUrls(urlSearchResultPage_Renting, "urls_rent"), "scraped_rent", maxNumberExposes)
-    print (gf.dayTime() + ': Finished scraping-process for rent')
+    for cat in cats:
+        # Collect and save expose urls to list and csv-file. Than scrape exposes from that list and save them in a pandas-dataframe formated csv-file
+        print (gf.dayTime() + ': Started scraping-process for ' + cat[1:] + ' in ' + region)
+        scrapeAndSaveExposes(collectAndSaveExposeUrls(urlsSearchResultPage[cat], regionFolder + "urls" + cat), regionFolder + "scraped" + cat, maxNumberExposes)
+        print (gf.dayTime() + ': Finished scraping-process for ' + cat[1:] + ' in ' + region)
 
     
 # Function run() shall be executed if module is executed directly via console 
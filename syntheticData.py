@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Generates synthetic apartment-expose-data shaped like the dataframes created by 'scraping.py'
+(scraped_buy.csv, scraped_rent.csv), so that the pipeline can be run and benchmarked
+without requesting live data from immowelt.de.
+
+The synthetic exposes mimic the real data:
+* same column-names as scraped by exposeScraper(), including many sparse
+  'equipmentArea_', 'HardFacts_' and 'Price_DataTable_' columns with mostly missing values
+* coordinates sampled inside the municipalities of shapefile dvg2gem_nw.shp, with city-name,
+  ZIP-code and location-id consistent to the municipality
+* prices depending on location, area, construction year and condition
+* description-texts composed of typical phrases (e.g. 'Aufzug', 'Tiefgarage', 'Fußbodenheizung')
+* a realistic share of missing values, outliers, wrong units, duplicates and blacklist-keywords,
+  so that every rule of 'cleaning.py' has rows to drop
+
+@author: Michael Volk
+"""
+
+import generalFunctions as gf
+import numpy as np
+import pandas as pd
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 1: Define functions for generating synthetic exposes
+
+
+# Typical phrases of description-texts, each with probability to be contained in a text
+descriptionPhrases = [
+    ('Die helle Wohnung befindet sich in einem gepflegten Mehrfamilienhaus.', 0.6),
+    ('Ein Aufzug ist im Haus vorhanden.', 0.3),
+    ('Ein Stellplatz in der Tiefgarage kann zusätzlich angemietet werden.', 0.25),
+    ('Alle Räume verfügen über eine Fußbodenheizung.', 0.15),
+    ('Die Einbauküche ist im Preis enthalten.', 0.35),
+    ('Das Badezimmer ist mit Dusche und Badewanne ausgestattet.', 0.4),
+    ('Vom Balkon aus genießen Sie einen schönen Blick ins Grüne.', 0.3),
+    ('Die Wohnung ist barrierefrei erreichbar.', 0.1),
+    ('Einkaufsmöglichkeiten, Schulen und Kindergärten sind fußläufig erreichbar.', 0.5),
+    ('Die Anbindung an den öffentlichen Nahverkehr ist sehr gut.', 0.45),
+    ('Ein Kellerraum gehört zur Wohnung.', 0.4),
+    ('Die Fenster wurden vor wenigen Jahren erneuert.', 0.2),
+    ('Parkett- und Fliesenböden prägen das Bild der Wohnung.', 0.3),
+    ('Gäste-WC vorhanden.', 0.2),
+]
+blacklistPhrases = ['Die Wohnung wird im Wege der Zwangsversteigerung verkauft.',
+                    'Es handelt sich um ein Erbbaurecht.',
+                    'Verkauf gegen Angebot.',
+                    'Die Wohnung ist Teil eines Paketverkaufs.',
+                    'Pflegeimmobilie als Kapitalanlage.']
+
+categoryValues = ['Etagenwohnung', 'Apartment', 'Maisonette', 'Penthouse', 'Terrassenwohnung', 'Loft',
+                  'Dachgeschosswohnung', 'Erdgeschosswohnung']
+conditionValues = ['gepflegt', 'saniert', 'teilsaniert', 'renoviert', 'Erstbezug', 'gehobene Ausstattung',
+                   'renovierungsbedürftig', 'sanierungsbedürftig', 'entkernt']
+outdoorValues = ['Balkon', 'Terrasse', 'Garten', 'Loggia', 'Wintergarten', 'Balkon, Garten', 'Terrasse, Garten']
+districtValues = ['Altstadt', 'Innenstadt', 'Nord', 'Süd', 'Ost', 'West', 'Mitte', 'Neustadt']
+
+# Centres of the big cities with the highest prices per area (Longitude, Latitude)
+priceCentres = [(6.7735, 51.2277), (6.9603, 50.9375), (7.0982, 50.7374), (7.6261, 51.9607), (6.0839, 50.7753)]
+
+
+def sample_coordinates(df_map, n, rng):
+    """Samples n points uniformly inside the municipalities of given geopandasMap 'df_map'.
+    Returns dataframe with columns 'Latitude', 'Longitude', 'MunicipalityIndex'."""
+
+    import geopandas as gpd
+
+    df_map = df_map.to_crs(epsg=4326).reset_index(drop=True)
+    minLongitude, minLatitude, maxLongitude, maxLatitude = df_map.total_bounds
+    samples = []
+    sampled = 0
+    while sampled < n:
+        # Sample in the bounding box and keep the points within a municipality (spatial join)
+        batchSize = int((n - sampled) * 1.6) + 100
+        points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(rng.uniform(minLongitude, maxLongitude, batchSize),
+                                                              rng.uniform(minLatitude, maxLatitude, batchSize)),
+                                  crs=df_map.crs)
+        joined = gpd.sjoin(points, df_map[['geometry']], how='inner', op='within')
+        joined = joined[~joined.index.duplicated()]
+        samples.append(pd.DataFrame({'Latitude': joined.geometry.y.to_numpy(),
+                                     'Longitude': joined.geometry.x.to_numpy(),
+                                     'MunicipalityIndex': joined['index_right'].to_numpy()}))
+        sampled += len(joined)
+
+    return pd.concat(samples, ignore_index=True).iloc[:n]
+
+def make_descriptionTexts(n, rng, blacklistShare=0.0):
+    """Returns n description-texts composed of the typical phrases,
+    'blacklistShare' of them contain a blacklist-keyword of 'cleaning.py'"""
+
+    contained = np.column_stack([rng.random(n) < probability for _, probability in descriptionPhrases])
+    blacklisted = rng.random(n) < blacklistShare
+    blacklistChoice = rng.integers(0, len(blacklistPhrases), n)
+    numbers = rng.integers(0, 10**9, n)
+    texts = []
+    for i in range(n):
+        phrases = [phrase for (phrase, _), isContained in zip(descriptionPhrases, contained[i]) if isContained]
+        if blacklisted[i]:
+            phrases.append(blacklistPhrases[blacklistChoice[i]])
+        # The reference number makes texts unique (real texts are rarely identical)
+        texts.append('Objektbeschreibung\n\n' + ' '.join(phrases) + '\n\nObjekt-Nr. ' + str(numbers[i]))
+
+    return texts
+
+def with_missing(values, share, rng):
+    """Returns given values as object-array with 'share' of the values replaced by NaN"""
+    values = np.array(values, dtype=object)
+    values[rng.random(len(values)) < share] = np.nan
+    return values
+
+def make_scrapedFrame(n, cat, df_map, seed=0, nSparseColumns=150, crawlDate='2022-05-15'):
+    """Returns dataframe with n synthetic exposes for given cat ('_buy' or '_rent')
+    shaped like the dataframes created by 'scraping.py'"""
+
+    rng = np.random.default_rng(seed)
+    buy = (cat == '_buy')
+    municipalities = df_map.reset_index(drop=True)
+    coordinates = sample_coordinates(municipalities, n, rng)
+    municipalityIndex = coordinates.MunicipalityIndex.to_numpy()
+    districtIndex = rng.integers(0, len(districtValues), n)
+
+    # Hard facts
+    area = np.round(rng.lognormal(np.log(72), 0.35, n), 2)
+    rooms = np.clip(np.round((area / 28 + rng.normal(0, 0.6, n)) * 2) / 2, 1, 9)
+    constructionYear = np.where(rng.random(n) < 0.05, rng.integers(1700, 2030, n),
+                                np.clip(np.round(rng.normal(1975, 28, n)), 1850, 2021)).astype(float)
+    condition = rng.choice(conditionValues, n)
+
+    # Price per area depends on the distance to the price-centres, the construction year and the condition
+    distance = np.min([np.hypot(coordinates.Longitude.to_numpy() - lon, coordinates.Latitude.to_numpy() - lat)
+                       for lon, lat in priceCentres], axis=0)
+    factor = (np.exp(-distance * 3) * 0.9 + 0.6) * (1 + (constructionYear - 1975) / 250) \
+        * np.where(np.isin(condition, ['Erstbezug', 'gehobene Ausstattung']), 1.2, 1.0) \
+        * rng.lognormal(0, 0.2, n)
+    if buy:
+        price = np.round(area * 2800 * factor, -2)
+        # Outliers outside of the price-boundaries of 'cleaning.py'
+        price[rng.random(n) < 0.01] = rng.choice([15000, 3500000], 1)[0]
+    else:
+        price = np.round(area * 9.5 * factor, 0)
+        price[rng.random(n) < 0.01] = rng.choice([50, 9000], 1)[0]
+    area[rng.random(n) < 0.01] = 250 #outliers of area
+
+    onlineIds = ['2' + format(i, 'x').zfill(7) + cat[1] for i in rng.permutation(10 * n)[:n]]
+    offererIds = rng.integers(10**6, 10**6 + max(n // 8, 10), n).astype(str)
+    zipCodes = (32000 + (municipalities.KN.astype('int64').to_numpy() * 7919) % 27000)[municipalityIndex] \
+        + districtIndex
+
+    df = pd.DataFrame({
+        'ProtocolExposeUrl': ['https://www.immowelt.de/expose/' + onlineId for onlineId in onlineIds],
+        'ProtocolDatetimeRequestExposeUrl': crawlDate + ' ' + pd.Series(rng.integers(0, 24, n)).astype(str).str.zfill(2) + ':00:00',
+        'ProtocolErrorTypeOccured': np.nan,
+        'ProtocolErrorTypeOccuredDetail': np.nan,
+        'CreateDate': (pd.Timestamp(crawlDate) - pd.to_timedelta(rng.integers(0, 180, n), unit='D')).strftime('%Y-%m-%dT%H:%M:%S'),
+        'equipmentArea_CONSTRUCTIONYEAR': with_missing(constructionYear, 0.12, rng),
+        'equipmentArea_CATEGORY': with_missing(rng.choice(categoryValues, n, p=[0.55, 0.1, 0.06, 0.04, 0.05, 0.02, 0.1, 0.08]), 0.3, rng),
+        'equipmentArea_CONDITION': with_missing(condition, 0.25, rng),
+        'equipmentArea_ENERGY': with_missing(rng.choice(['Gas', 'Fernwärme', 'Öl', 'Wärmepumpe'], n), 0.4, rng),
+        'equipmentArea_FLOOR': with_missing(rng.integers(0, 8, n).astype(str), 0.3, rng),
+        'equipmentArea_OUTDOOR': with_missing(rng.choice(outdoorValues, n), 0.4, rng),
+        'EstateAddress_City': municipalities.GN.to_numpy()[municipalityIndex],
+        'EstateAddress_District': with_missing(np.array(districtValues)[districtIndex], 0.4, rng),
+        'EstateAddress_FederalState': 'Nordrhein-Westfalen',
+        'EstateAddress_FederalStateId': 10,
+        'EstateAddress_LocationId': municipalityIndex * 100 + districtIndex,
+        'EstateAddress_PublishStreet': rng.random(n) < 0.5,
+        'EstateAddress_ZipCode': zipCodes.astype(str),
+        'EstateMapData_LocationCoordinates_Latitude': with_missing(coordinates.Latitude.round(6), 0.05, rng),
+        'EstateMapData_LocationCoordinates_Longitude': coordinates.Longitude.round(6).to_numpy(),
+        'General_Headline': rng.choice(['Schöne Wohnung', 'Helle Wohnung mit Balkon', 'Gemütliche Wohnung',
+                                        'Moderne Wohnung in zentraler Lage', 'Kapitalanlage'], n),
+        'General_EstateTypeKey': np.where(rng.random(n) < 0.01, 'HAUS', 'WOHNUNG'),
+        'General_DistributionTypeKey': 'ZUM_KAUF' if buy else 'ZUR_MIETE',
+        'General_EstateId': rng.integers(10**7, 10**8, n),
+        'GlobalObjectKey': onlineIds,
+        'HardFacts_PRICE_Label': np.where(rng.random(n) < 0.01, 'Preis auf Anfrage', 'Kaufpreis' if buy else 'Kaltmiete'),
+        'HardFacts_PRICE_NumberValue': with_missing(price, 0.01, rng),
+        'HardFacts_PRICE_Unit': np.where(rng.random(n) < 0.005, 'CHF', 'EUR'),
+        'HardFacts_AREA_LIVING_Label': 'Wohnfläche',
+        'HardFacts_AREA_LIVING_NumberValue': area,
+        'HardFacts_AREA_LIVING_Unit': 'SQM',
+        'HardFacts_ROOMS_Label': 'Zimmer',
+        'HardFacts_ROOMS_NumberValue': rooms,
+        'MediaItemsCount': with_missing(rng.integers(1, 40, n), 0.02, rng),
+        'Offerer_contactData_companyName': with_missing(rng.choice(['Immobilien GmbH', 'Makler AG', 'Wohnbau KG'], n), 0.3, rng),
+        'Offerer_globalUserId': offererIds,
+        'Offerer_sellerType': rng.choice(['COMMERCIAL', 'PRIVATE'], n, p=[0.8, 0.2]),
+        'OnlineId': onlineIds,
+        'EnergyPasses_Data_EnergyType': with_missing(rng.choice(['CONSUMPTION', 'DEMAND'], n), 0.3, rng),
+        'EnergyPasses_Data_Value': with_missing(np.round(rng.uniform(40, 250, n), 1), 0.3, rng),
+        'EnergyPasses_Data_HotWaterIncluded': with_missing(rng.random(n) < 0.5, 0.3, rng),
+    })
+    # Missing longitude where latitude is missing (coordinates are missing together)
+    df.loc[df.EstateMapData_LocationCoordinates_Latitude.isna(), 'EstateMapData_LocationCoordinates_Longitude'] = np.nan
+
+    if buy:
+        df['Price_AdditionalInformation_Commission_CommissionType'] = with_missing(rng.choice(['PERCENT', 'NONE'], n), 0.2, rng)
+        df['Price_AdditionalInformation_Commission_DisplayValue_Label'] = 'Käuferprovision'
+        df['Price_AdditionalInformation_Commission_DisplayValue_NumberValue'] = with_missing(rng.choice([0, 3.57], n), 0.2, rng)
+        df['Price_AdditionalInformation_Commission_DisplayValue_StringValue'] = with_missing(rng.choice(['provisionsfrei', '3,57 %'], n), 0.2, rng)
+        df['Price_DataTable_PRICE_COMMONCHARGE_Label'] = 'Hausgeld'
+        df['Price_DataTable_PRICE_COMMONCHARGE_NumberValue'] = with_missing(np.round(area * 3.2), 0.4, rng)
+        df['Price_DataTable_PRICE_COMMONCHARGE_Unit'] = 'EUR'
+    else:
+        rentCold = price.copy()
+        df['Price_DataTable_PRICE_RENT_COLD_Label'] = np.where(rng.random(n) < 0.005, 'Nettomiete', 'Kaltmiete')
+        df['Price_DataTable_PRICE_RENT_COLD_NumberValue'] = with_missing(rentCold, 0.01, rng)
+        df['Price_DataTable_PRICE_RENT_COLD_Unit'] = 'EUR'
+        df['Price_DataTable_PRICE_ADDITIONALCOSTS_NumberValue'] = with_missing(np.round(area * 2.2), 0.2, rng)
+        df['Price_DataTable_PRICE_HEATINGCOSTS_NumberValue'] = with_missing(np.round(area * 1.1), 0.4, rng)
+        df['Price_DataTable_PRICE_RENT_WARM_NumberValue'] = with_missing(np.round(rentCold + area * 3.3), 0.1, rng)
+
+    # Sparse columns which are scraped but not used (e.g. rare equipment-keys)
+    prefixes = ['equipmentArea_', 'HardFacts_', 'Price_DataTable_']
+    sparseColumns = {}
+    for i in range(nSparseColumns):
+        values = np.full(n, np.nan, dtype=object)
+        filled = rng.random(n) < 0.03
+        values[filled] = rng.choice(['ja', 'nein', '1', 'vorhanden'], filled.sum())
+        sparseColumns[prefixes[i % len(prefixes)] + 'SPARSE' + str(i) + '_Value'] = values
+    df = pd.concat([df, pd.DataFrame(sparseColumns)], axis=1)
+
+    df['DescriptionText'] = make_descriptionTexts(n, rng, blacklistShare=0.02 if buy else 0.0)
+
+    # Duplicates: exposes offered more than once (identical text) and apartments of one building-project
+    duplicates = rng.random(n) < 0.08
+    df.loc[duplicates, 'DescriptionText'] = df.DescriptionText.to_numpy()[rng.integers(0, n, duplicates.sum())]
+    sameProject = np.flatnonzero(rng.random(n) < 0.05)
+    sources = rng.integers(0, n, len(sameProject))
+    for col in ['Offerer_globalUserId', 'equipmentArea_CONSTRUCTIONYEAR', 'EstateAddress_LocationId']:
+        df.loc[sameProject, col] = df[col].to_numpy()[sources]
+
+    return df
+
+
+#----------------------------------------------------------------------------------------------------
+
+
+# Section 2: Define the order of running the above functions.
+
+
+def run(nRows=10000, seed=0, path=''):
+    """
+    Runs the above functions in defined order.
+    Generates nRows synthetic exposes each for buy and rent and saves them
+    as scraped_buy.csv, scraped_rent.csv in given path.
+    """
+
+    import featureEngineering
+    df_map = featureEngineering.load_geopandasMap()
+    for i, cat in enumerate(['_buy', '_rent']):
+        print(gf.dayTime() + ': Generating ' + str(nRows) + ' synthetic exposes for ' + cat[1:])
+        gf.save_data(make_scrapedFrame(nRows, cat, df_map, seed=seed + i), filename = path + 'scraped' + cat)
+
+
+# Function run() shall be executed if module is executed directly via console
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the error-measures of 'evaluation.py' against the sklearn.metrics of the same names.
+
+@author: Michael Volk
+"""
+
+import evaluation
+import numpy as np
+import pytest
+from sklearn.metrics import explained_variance_score
+
+
+@pytest.mark.parametrize('y_true', [np.array([5.0, 5.0, 5.0, 5.0]), np.array([4.0, 5.5, 5.0, 6.5])])
+def test_explainedVarianceScoreLikeSklearn(y_true):
+    predictions, modelNames = evaluation.stack_predictions({'perfect': y_true.copy(),
+                                                'shifted': y_true + 0.5,
+                                                'noisy': y_true + np.array([0.1, -0.2, 0.3, 0.0])})
+    measures, _ = evaluation.evaluate_predictions(y_true, predictions, modelNames)
+
+    expected = [explained_variance_score(y_true, y_predict) for y_predict in predictions]
+    np.testing.assert_allclose(measures['test_explained_variance_score'].to_numpy(), expected)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the skipping of current stages and the saving of the pipeline-state by 'executer.py'.
+The run()-functions of the stages are replaced by fakes, which only write their output-files.
+
+@author: Michael Volk
+"""
+
+import executer
+import pytest
+import sys
+import types
+
+
+def make_fakeStage(monkeypatch, name, write):
+    """Replaces the module of given stage by a fake whose run() calls write(cat) and counts its calls"""
+    calls = []
+    def run(cats, region, **parameters):
+        calls.extend(cats)
+        for cat in cats:
+            write(cat)
+    monkeypatch.setitem(sys.modules, name, types.SimpleNamespace(run=run))
+    return calls
+
+def test_scrapingRunsAgainWithoutChanges(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def scrape(cat):
+        for filename in ['urls' + cat + '.csv', 'scraped' + cat + '.csv']:
+            with open(filename, 'w') as f:
+                f.write('Url\nhttps://www.immowelt.de/expose/1\n')
+    scrapingCalls = make_fakeStage(monkeypatch, 'scraping', scrape)
+
+    executer.run(onlyStage='scraping', branchCats=['_buy'])
+    executer.run(onlyStage='scraping', branchCats=['_buy'])
+
+    # Nothing changed in between, but the website may have: scraping runs at every run
+    assert scrapingCalls == ['_buy', '_buy']
+
+def test_currentStageIsSkipped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open('featureEngineered_buy.csv', 'w') as f:
+        f.write('Url\nhttps://www.immowelt.de/expose/1\n')
+
+    def split(cat):
+        for filename in ['dataset' + cat + '.csv', 'dataset' + cat + '.json']:
+            with open(filename, 'w') as f:
+                f.write('{}')
+    splittingCalls = make_fakeStage(monkeypatch, 'trainTestSplitting', split)
+
+    executer.run(onlyStage='trainTestSplitting', branchCats=['_buy'])
+    executer.run(onlyStage='trainTestSplitting', branchCats=['_buy'])
+
+    assert splittingCalls == ['_buy']
+
+def test_finishedBranchIsKeptIfOtherBranchFails(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for cat in executer.cats:
+        with open('featureEngineered' + cat + '.csv', 'w') as f:
+            f.write('Url\nhttps://www.immowelt.de/expose/1\n')
+
+    def split(cat):
+        if cat == '_rent':
+            raise ValueError('split failed')
+        for filename in ['dataset' + cat + '.csv', 'dataset' + cat + '.json']:
+            with open(filename, 'w') as f:
+                f.write('{}')
+    make_fakeStage(monkeypatch, 'trainTestSplitting', split)
+
+    with pytest.raises(ValueError):
+        executer.run(onlyStage='trainTestSplitting', parallel='stages', cpus=2)
+
+    state = executer.load_state()
+    assert 'trainTestSplitting_buy' in state['stages']
+    assert 'trainTestSplitting_rent' not in state['stages']
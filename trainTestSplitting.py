@@ -2,8 +2,16 @@
 """
 Splits feature-engineered dataframes created by *featureEngineering.py* into
 train and test dataframes for the models in module *modeling.py*.
-Dependent variable y (rent-warm-price for rent-dataframe and buy-price for buy-dataframe)
-and independent variables X are saved to separate files (this split is also performed for the whole dataframe).
+Dependent variable y (rent-cold-price for rent-dataframe and buy-price for buy-dataframe) and
+independent variables X of the train- and test-rows are saved together as one file dataset_buy.csv, dataset_rent.csv
+(target first, train-rows first, column 'Split' with 'train' or 'test') with a json-file dataset_buy.json,
+dataset_rent.json containing the target-name and the number of rows per split
+(see generalFunctions.save_dataset() and generalFunctions.load_dataset()).
+
+By default the rows are split randomly. With run(splitMode='hash') (e.g. 'python executer.py --splitMode hash')
+every listing is assigned by the hash of its Url, so its assignment is stable across data refreshes and incrementally
+updated models stay valid; with spatialCellSize (e.g. 0.05 degrees) the grid-cells are hashed instead,
+so neighbouring listings are not split between train and test data.
 
 OPTIONAL: Function add_nearestApartments_medianPrice_forModel() can be used
 to get a price-estimate for every apartment based on its nearest-neighboors-apartments
@@ -16,8 +24,8 @@ But by default this function is not used because its very time-intensive to calc
 """
 
 import generalFunctions as gf
-from geopy import distance
-from sklearn.model_selection import train_test_split
+import numpy as np
+import pandas as pd
 
 
 #----------------------------------------------------------------------------------------------------
@@ -26,9 +34,29 @@ from sklearn.model_selection import train_test_split
 # Section 1: Define functions for the modelling-process
 
 
-def train_test_splitter(df, buy=True):
+def get_hashTestMask(df, testSize=0.2, hashColumn='Url', spatialCellSize=None):
+    """Returns boolean array which assigns every row of given df to the test-data (True) or train-data (False)
+    by hashing its 'hashColumn' (all rows are hashed vectorized in one pass with a fixed hash-key),
+    so a listing keeps its assignment across data refreshes, independent of the row-order and of other rows.
+    With 'spatialCellSize' (in degrees of Latitude/Longitude, e.g. 0.05) the cells of that grid are hashed
+    instead, so all listings of a cell are either train- or test-data (no leakage between neighbours)."""
+
+    if spatialCellSize is None:
+        keys = df[hashColumn].astype(str)
+    else:
+        keys = pd.DataFrame({'LatitudeCell': np.floor(df['Latitude'].to_numpy() / spatialCellSize).astype('int64'),
+                             'LongitudeCell': np.floor(df['Longitude'].to_numpy() / spatialCellSize).astype('int64')})
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+    return (hashes % 10000) < round(testSize * 10000)
+
+@gf.instrumented
+def train_test_splitter(df, buy=True, splitMode='random', spatialCellSize=None):
     """Returs training- and test-dataframe for explantory variables (X_train, X_test)
-    and target-variables (y_train, y_test) on the basis of given df."""
+    and target-variables (y_train, y_test) on the basis of given df.
+    With splitMode='random' the rows are shuffled and split (depends on the row-order of df),
+    with splitMode='hash' every listing is assigned by the hash of its Url or, with 'spatialCellSize',
+    of its grid-cell (see get_hashTestMask()), so the assignment is stable across data refreshes."""
         
     # Create y and X from df dependent if buy or rent dataframe is given
     if buy == True:
@@ -39,7 +67,12 @@ def train_test_splitter(df, buy=True):
         X = df.drop('Price_rent_cold', axis=1).copy()
         
     # Split X and y in train and test data
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size = 0.2, random_state = 0)
+    if splitMode == 'hash':
+        test = get_hashTestMask(X, testSize = 0.2, spatialCellSize = spatialCellSize)
+        X_train, X_test, y_train, y_test = X[~test], X[test], y[~test], y[test]
+    else:
+        from sklearn.model_selection import train_test_split
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size = 0.2, random_state = 0)
 
     return X, X_train, X_test, y, y_train, y_test
 
@@ -67,6 +100,8 @@ def add_nearestApartments_medianPrice_forModel(X_train, X_test=None, buy=True, n
         buy: True if X_train is dataframe for buy, False if X_train is dataframe for rent
         n: number of nearest neighbors to be included"""
     
+    from geopy import distance
+    
     # Adds coordinates-tuple consisting of (Latitude, Longitude)"""
     X_train['Coordinates'] = list(zip(X_train.Latitude, X_train.Longitude))
     X_test['Coordinates'] = list(zip(X_test.Latitude, X_test.Longitude))
@@ -120,43 +155,38 @@ def add_nearestApartments_medianPrice_forModel(X_train, X_test=None, buy=True, n
 # Section 2: Define the order of running the above functions.
 
 
-def run():
+@gf.profilable
+def run(cats=['_buy', '_rent'], region=gf.defaultRegion, splitMode='random', spatialCellSize=None):
     """
     Runs the above functions in defined order.
+    The optional parameter cats defines the dataframes to be split ('_buy' and/or '_rent').
+    The optional parameter region defines the region (see generalFunctions.regions) whose dataframes are split.
+    The optional parameters splitMode ('random' or 'hash') and spatialCellSize define the split (see train_test_splitter()).
+    The optional parameter profile ('cprofile', 'sampling' or 'allocations') profiles the run (see generalFunctions.profiled).
     """
     
-    # Load dataframes
-    df_buy = gf.load_data(filename = "featureEngineered_buy")
-    df_rent = gf.load_data(filename = "featureEngineered_rent")
-    
-    # # Cut to only the first n rows of the dataframe (only relevant for testing)
-    # n = 100
-    # df_buy = df_buy[0:n].copy()
-    # df_rent = df_rent[0:n].copy()
+    regionFolder = gf.get_regionFolder(region)
     
-    # Execute train_test_splitter
-    X_buy, X_train_buy, X_test_buy, y_buy, y_train_buy, y_test_buy = train_test_splitter(df_buy, buy=True)
-    X_rent, X_train_rent, X_test_rent, y_rent, y_train_rent, y_test_rent = train_test_splitter(df_rent, buy=False)
-    
-    # # Execute add_nearestApartments_medianPrice_forModel
-    # # CAUTION: Very time intensive to calculate. Calculation time raises quadratic with number of rows!
-    # # Therefore this function is not used by default.
-    # X_train_buy, X_test_buy = add_nearestApartments_medianPrice_forModel(X_train_buy, X_test_buy, buy=True, n=1)
-    # X_train_rent, X_test_rent = add_nearestApartments_medianPrice_forModel(X_train_rent, X_test_rent, buy=False, n=1)
-    
-    # Save dataframes
-    gf.save_data(X_buy, filename = "X_buy")
-    gf.save_data(X_train_buy, filename = "X_train_buy")
-    gf.save_data(X_test_buy, filename = "X_test_buy")
-    gf.save_data(y_buy, filename = "y_buy")
-    gf.save_data(y_train_buy, filename = "y_train_buy")
-    gf.save_data(y_test_buy, filename = "y_test_buy")
-    gf.save_data(X_rent, filename = "X_rent")
-    gf.save_data(X_train_rent, filename = "X_train_rent")
-    gf.save_data(X_test_rent, filename = "X_test_rent")
-    gf.save_data(y_rent, filename = "y_rent")
-    gf.save_data(y_train_rent, filename = "y_train_rent")
-    gf.save_data(y_test_rent, filename = "y_test_rent")
+    for cat in cats:
+        
+        # Load dataframe
+        df = gf.load_data(filename = regionFolder + "featureEngineered" + cat)
+        
+        # # Cut to only the first n rows of the dataframe (only relevant for testing)
+        # n = 100
+        # df = df[0:n].copy()
+        
+        # Execute train_test_splitter
+        X, X_train, X_test, y, y_train, y_test = train_test_splitter(df, buy=(cat == '_buy'), splitMode=splitMode,
+                                                                     spatialCellSize=spatialCellSize)
+        
+        # # Execute add_nearestApartments_medianPrice_forModel
+        # # CAUTION: Very time intensive to calculate. Calculation time raises quadratic with number of rows!
+        # # Therefore this function is not used by default.
+        # X_train, X_test = add_nearestApartments_medianPrice_forModel(X_train, X_test, buy=(cat == '_buy'), n=1)
+        
+        # Save train- and test-rows as one dataset-file (X and y are the union of both, see generalFunctions.load_dataset())
+        gf.save_dataset(X_train, X_test, y_train, y_test, filename = regionFolder + "dataset" + cat)
  
     
 # Function run() shall be executed if module is executed directly via console 